@@ -5,11 +5,17 @@ import plotly.express as px
 import os
 import base64
 from io import BytesIO
-from scripts.mongo_connector import get_company_names, get_groups_for_company
-from scripts.data_processing import load_and_process_data, load_and_process_data_trainings, load_and_process_data_cumplimentacion
-from scripts.metrics import calcular_metricas_recurrencia, calcular_metricas_connections, calcular_metricas_entrenamientos
+from scripts.mongo_connector import get_pool_stats, get_sync_stats
+from scripts.data_processing import empresas_excluidas, grupos_excluidos, get_load_stats, get_version_stats, list_company_names, list_group_names
+from scripts.snapshots import read_manifest, SNAPSHOT_MODE
+from scripts.refresher import get_served_datasets, get_refresh_stats
+from scripts.partitions import PARTITIONS_ENABLED, get_partition, get_partition_stats
+from scripts.memo import get_memo_stats
+from scripts.metrics import calcular_metricas_recurrencia, calcular_metricas_connections, calcular_metricas_entrenamientos, calcular_tendencia_conexiones
+from scripts.metrics import calcular_retencion_cohortes
 from scripts.nlp_analysis import preprocess_text, plot_text_length_distribution, plot_word_frequency, sentiment_analysis, topic_modeling, generate_bigram_word_cloud, interpretar_sentimiento,  interpretar_subjetividad
 from scripts.metrics import calcular_metricas_coach, contar_usuarios_unicos, obtener_resumen_progreso
+from scripts.connection_store import connection_date_range
 from collections import Counter
 
 # Colores personalizados
@@ -58,22 +64,28 @@ else:
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown(f"""<h1 style='text-align: right; color: {PRIMARY_COLOR}; font-size: 30px;'>Dashboard de bchange 👨‍🚀</h1>""", unsafe_allow_html=True)
 
-# Cargar el dataframe solo una vez por sesión
-if "df" not in st.session_state:
-    st.session_state.df = load_and_process_data()
-
-df = st.session_state.df  # Referencia al dataframe en session_state
-
-# Df entrenamientos, solo se carga una vez por sesión
-if "df_trainings" not in st.session_state:
-    st.session_state.df_trainings = load_and_process_data_trainings()
-df_trainings = st.session_state.df_trainings  # Referencia al dataframe en session_state
-
-# Df cumplimentación, solo una vez por sesión
-if "df_cumplimentacion" not in st.session_state:
-    st.session_state.df_cumplimentacion = load_and_process_data_cumplimentacion()
-
-df_cumplimentacion = st.session_state.df_cumplimentacion  # Referencia al dataframe en session_state
+# Actualizar datos: un hilo de fondo comprueba la huella de MongoDB cada REFRESH_INTERVAL_S segundos (o al pulsar
+# el botón) y prepara la nueva versión de datos mientras se sigue mostrando la actual (ver scripts.refresher)
+actualizar = SNAPSHOT_MODE != "offline" and st.sidebar.button("🔄 Actualizar datos")
+served = get_served_datasets(refresh=actualizar)
+if actualizar:
+    st.sidebar.info("Comprobando si hay datos nuevos; se mostrarán en cuanto estén cargados.")
+st.sidebar.caption(f"📅 Datos a fecha de {served['as_of']:%d/%m/%Y %H:%M}")
+
+# Versión de datos servida: se cambia de versión en la siguiente interacción tras terminar de cargarla
+# (desde la instantánea en disco o desde MongoDB, según la sección [snapshots] de secrets.toml).
+# Los DataFrames son de sólo lectura y se comparten entre sesiones: no se guardan en session_state.
+# Con la carga por empresa sólo se sirven las dimensiones; los datos se cargan al elegir la empresa (ver más abajo)
+data_version = served["version"]
+df_dimensions = served["datasets"]["df_dimensions" if PARTITIONS_ENABLED else "df_trainings"]
+
+# Función para descargar un DataFrame en Excel: el fichero se genera una vez por versión de datos y filtros
+@st.cache_data(max_entries=32, show_spinner=False)
+def descargar_excel(data_version, clave, _df):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        _df.to_excel(writer, index=False, sheet_name="Datos")
+    return output.getvalue()
 
 # Estilos CSS personalizados
 st.markdown(
@@ -95,23 +107,40 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Estado del pool de conexiones a MongoDB (compartido por todas las sesiones)
+with st.sidebar.expander("🔌 Conexión a MongoDB"):
+    st.json(get_pool_stats())
+with st.sidebar.expander("⏱ Carga de colecciones"):
+    st.json(get_load_stats())
+    st.json(get_sync_stats())
+with st.sidebar.expander("🏷 Versión de datos"):
+    st.json(get_version_stats())
+    st.json(get_refresh_stats())
+with st.sidebar.expander("🧠 Caché de métricas"):
+    st.json(get_memo_stats())
+if PARTITIONS_ENABLED:
+    with st.sidebar.expander("🗂 Particiones por empresa"):
+        st.json(get_partition_stats())
+if SNAPSHOT_MODE != "off":
+    with st.sidebar.expander("💾 Instantánea en disco"):
+        manifest = read_manifest()
+        st.write(f"Modo: {SNAPSHOT_MODE}")
+        st.write(f"Creada: {manifest['created_at']}" if manifest else "No hay ninguna instantánea")
+
 # Filtros
-metric_type = st.selectbox("Seleccione el tipo de métrica", ["Recurrencia", "Conexiones", "Entrenamientos", "Coach", "Cumplimentación"], index=0)
+metric_type = st.selectbox("Seleccione el tipo de métrica", ["Recurrencia", "Retención", "Conexiones", "Entrenamientos", "Coach", "Cumplimentación"], index=0)
 
 if metric_type != "Entrenamientos":
-   # Empresas excluidas
-    empresas_excluidas = ["Auren", "Demos Clientes"]
-
 # Obtener y filtrar empresas
-    company_names = get_company_names()
+    company_names = list_company_names(df_dimensions)
     company_names = [name for name in company_names if name not in empresas_excluidas]
 
     selected_company = st.selectbox("Seleccione una empresa", ["Todas"] + company_names)
 
     # Obtener y filtrar grupos si se seleccionó una empresa
     if selected_company != "Todas":
-        groups = get_groups_for_company(selected_company)
-        groups = [g for g in groups if g != "Cumplimentación"]
+        groups = list_group_names(df_dimensions, selected_company)
+        groups = [g for g in groups if g not in grupos_excluidos]
     else:
         groups = []
 
@@ -120,6 +149,19 @@ else:
     selected_company = None
     selected_group = None
 
+# Datos de la vista: los de la versión servida o, con la carga por empresa, la partición de la empresa elegida
+# (la partición "Todas" para todas las empresas y para los entrenamientos, con todos los datos: su primera carga
+# es una carga completa; sus segundos de carga están en "Particiones por empresa")
+if PARTITIONS_ENABLED:
+    partition_company = selected_company if selected_company not in (None, "Todas") else None
+    with st.spinner("Cargando los datos de la empresa..." if partition_company else "Cargando los datos de todas las empresas..."):
+        datasets = get_partition(partition_company, data_version)
+else:
+    datasets = served["datasets"]
+df = datasets["df"]
+df_trainings = datasets["df_trainings"]
+df_cumplimentacion = datasets["df_cumplimentacion"]
+
 if metric_type == "Recurrencia":
     st.markdown(f"<h2 style='color: {ACCENT_COLOR};'> \U0001F4CC Métricas de {metric_type}</h2>", unsafe_allow_html=True)
     
@@ -164,38 +206,70 @@ if metric_type == "Recurrencia":
     fig.update_traces(texttemplate="%{text}", textposition="outside")
     st.plotly_chart(fig, use_container_width=True)
 
+elif metric_type == "Retención":
+    st.markdown(f"<h2 style='color: {ACCENT_COLOR};'> \U0001F4CC Métricas de {metric_type}</h2>", unsafe_allow_html=True)
+    
+    company_filter = selected_company if selected_company != "Todas" else None
+    group_filter = selected_group if selected_group != "Todos" else None
+    
+    semanas = st.slider("Semanas tras el check-out", min_value=4, max_value=26, value=12)
+    df_retencion = calcular_retencion_cohortes(df, company_filter, group_filter, semanas)
+    
+    if df_retencion.empty:
+        st.warning("No hay usuarios que hayan terminado el programa con los filtros seleccionados.")
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("\U0001F465 Usuarios con check-out", f"{int(df_retencion['Usuarios'].sum())}")
+        with col2:
+            valor = (df_retencion["Semana +1"] * df_retencion["Usuarios"]).sum() / df_retencion.loc[df_retencion["Semana +1"].notna(), "Usuarios"].sum()
+            valor = 0 if pd.isna(valor) else round(valor, 1)
+            st.metric("🔁 Vuelven la semana siguiente", f"{valor}%")
+        
+        df_heatmap = df_retencion.drop(columns="Usuarios")
+        df_heatmap.index = df_heatmap.index.strftime("%d/%m/%Y") + " (" + df_retencion["Usuarios"].astype(str) + ")"
+        fig = px.imshow(df_heatmap, text_auto=".0f", aspect="auto", color_continuous_scale=[BACKGROUND_COLOR, PRIMARY_COLOR],
+                        labels={"x": "Semanas tras el check-out", "y": "Cohorte (usuarios)", "color": "% conectados"},
+                        title="Retención semanal por cohorte de check-out")
+        fig.update_layout(height=max(400, 28 * len(df_heatmap)))
+        st.plotly_chart(fig, use_container_width=True)
+        
+        st.markdown("### 📊 Retención por cohorte (%)")
+        st.dataframe(df_retencion)
+
 elif metric_type == "Conexiones":
     st.markdown(f"<h2 style='color: {ACCENT_COLOR};'> \U0001F4CC Métricas de {metric_type}</h2>", unsafe_allow_html=True)
     
     company_filter = selected_company if selected_company != "Todas" else None
     group_filter = selected_group if selected_group != "Todos" else None
     
-    df_connections = calcular_metricas_connections(df, company_filter, group_filter)
+    # Rango de fechas de inicio de las conexiones (por defecto, todas)
+    fecha_min, fecha_max = connection_date_range(df["connection_store"])
+    fecha_inicio, fecha_fin = None, None
+    if fecha_min is not None:
+        rango = st.date_input("Seleccione el rango de fechas", (fecha_min, fecha_max), min_value=fecha_min, max_value=fecha_max)
+        if len(rango) == 2 and (rango[0], rango[1]) != (fecha_min, fecha_max):
+            fecha_inicio, fecha_fin = rango
+    
+    total_conexiones, duracion_media, df_show, df_weekly = calcular_metricas_connections(df, company_filter, group_filter, fecha_inicio, fecha_fin)
     
     col1, col2 = st.columns(2)
     with col1:
-        st.metric("🔢 Número total de conexiones", f"{int(df_connections['connection_id'].nunique())} conexiones")
+        st.metric("🔢 Número total de conexiones", f"{total_conexiones} conexiones")
     with col2:
-        valor = df_connections['connectionDuration'].mean()
+        valor = duracion_media
         valor = 0 if pd.isna(valor) else int(valor)
         st.metric("⏱ Tiempo de conexión medio/sesión", f"{valor} minutos")
     
     col3,col4 = st.columns(2)
     with col3:
         st.markdown("### 📊 Tiempo de conexión medio por compañía")
-        df_show = df_connections.groupby("company_name", as_index=False).agg({"connectionDuration": "mean"}).sort_values(by="connectionDuration", ascending=False)
         df_show.rename(columns={"company_name": "Empresa", "connectionDuration": "Tiempo medio de conexión (minutos)"}, inplace=True)
         # Redondear a entero
         df_show["Tiempo medio de conexión (minutos)"] = df_show["Tiempo medio de conexión (minutos)"].round(0).astype(int)
         st.dataframe(df_show)
     
     with col4: 
-        df_connections["startDate"] = pd.to_datetime(df_connections["startDate"])
-        df_connections["day_of_week"] = df_connections["startDate"].dt.day_name()
-        df_weekly = df_connections.groupby("day_of_week")["connectionDuration"].count().reset_index()
-        day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        df_weekly["day_of_week"] = pd.Categorical(df_weekly["day_of_week"], categories=day_order, ordered=True)
-        df_weekly = df_weekly.sort_values("day_of_week")
         fig = px.bar(df_weekly, x="day_of_week", y="connectionDuration", title="Conexiones acumuladas por día de la semana",
                      labels={"day_of_week": "Día de la semana", "connectionDuration": "Número de conexiones"},
                      color_discrete_sequence=["#1f77b4"])
@@ -205,6 +279,17 @@ elif metric_type == "Conexiones":
                  title="Distribución de tiempo de conexión por compañía")
     fig.update_traces(texttemplate="%{text:.0f}", textposition="outside")
     st.plotly_chart(fig, use_container_width=True)
+    
+    # Evolución en el tiempo (calculada sólo con los agregados diarios de conexiones)
+    st.markdown("### 📈 Evolución de las conexiones")
+    frecuencias = {"Día": "D", "Semana": "W", "Mes": "M"}
+    frecuencia = st.radio("Agrupar por", list(frecuencias), index=1, horizontal=True)
+    df_trend = calcular_tendencia_conexiones(df, company_filter, group_filter, frecuencias[frecuencia], fecha_inicio, fecha_fin)
+    fig = px.line(df_trend, x="period", y=["connections", "active_users"], markers=True, title=f"Conexiones y usuarios activos por {frecuencia.lower()}",
+                  labels={"period": frecuencia, "value": "Número", "variable": ""},
+                  color_discrete_sequence=[PRIMARY_COLOR, ACCENT_COLOR])
+    fig.for_each_trace(lambda trace: trace.update(name={"connections": "Conexiones", "active_users": "Usuarios activos"}[trace.name]))
+    st.plotly_chart(fig, use_container_width=True)
 
 elif metric_type == "Coach":
     st.markdown(f"<h2 style='color: {ACCENT_COLOR};'> 👨‍🚀 Métricas de {metric_type}</h2>", unsafe_allow_html=True)
@@ -213,6 +298,8 @@ elif metric_type == "Coach":
     group_filter = selected_group if selected_group != "Todos" else None
     
     respondieron_msg,  recibieron_msg_summary, respondieron_msg_summary = calcular_metricas_coach(df_trainings, company_filter, group_filter)
+    recibieron_msg_summary.to_excel("Alcanzados por el coach.xlsx")
+    respondieron_msg_summary.to_excel("Respondieron al coach.xlsx")
     total_recibieron = recibieron_msg_summary['# Usuarios'].sum()
     total_respondieron = respondieron_msg_summary['# Usuarios'].sum()
     usuarios = contar_usuarios_unicos(df_trainings, fecha_inicio='2025-02-28', company_name=company_filter, group_name = group_filter)
@@ -248,20 +335,12 @@ elif metric_type == "Coach":
 
     st.plotly_chart(fig, use_container_width=True)
 
-    # Función para descargar el DataFrame en Excel
-    def descargar_excel(df, nombre_archivo="datos_coach.xlsx"):
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Datos")
-        output.seek(0)
-        return output
-
     # Mostrar el DataFrame `respondieron_msg`
     st.markdown("### 📋 Detalle de las conversaciones")
     st.dataframe(respondieron_msg, use_container_width=True)
 
     # Botón para descargar los datos en Excel
-    excel_file = descargar_excel(respondieron_msg)
+    excel_file = descargar_excel(data_version, ("coach", company_filter, group_filter), respondieron_msg)
     st.download_button(
         label="📥 Descargar datos en Excel",
         data=excel_file,
@@ -296,7 +375,7 @@ elif metric_type == "Cumplimentación":
     # --- Resumen por módulo
     st.markdown("---")
     st.markdown("### 📚 Cumplimentación por módulo")
-    resumen_modulos= df_cumplimentacion.groupby("module_name")["progress_percent"].mean().reset_index().sort_values(by="progress_percent", ascending=False)
+    resumen_modulos= df_cumplimentacion.groupby("module_name", observed=True)["progress_percent"].mean().reset_index().sort_values(by="progress_percent", ascending=False)
     resumen_modulos= resumen_modulos.rename(columns={
     'module_name': 'Módulo',
     'progress_percent': 'Porcentaje (%)'
@@ -304,7 +383,7 @@ elif metric_type == "Cumplimentación":
     # Redondear a 2 decimales
     resumen_modulos['Porcentaje (%)'] = resumen_modulos['Porcentaje (%)'].round(2)
      # Reemplazar los valores en la columna 'Tipo'
-    resumen_modulos['Módulo'] = resumen_modulos['Módulo'].replace({
+    resumen_modulos['Módulo'] = resumen_modulos['Módulo'].astype(str).replace({
         'transformacion-intrapersonal': 'Módulo 1: Transformación Intrapersonal',
         'transformacion-interpersonal': 'Módulo 2: Transformación Interpersonal',  
         'transformacion-transversal': 'Módulo 3: Transformación Transversal',
@@ -427,14 +506,7 @@ elif metric_type == "Cumplimentación":
         #top_bottom_1(modulo_3, "🔄 Transversal")
     st.markdown("------------------------------------------------------------------------------------------")
     # Botón para descargar los datos en Excel
-    # Función para descargar el DataFrame en Excel
-    def descargar_excel(df, nombre_archivo="datos_cumplimentacion.xlsx"):
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Datos")
-        output.seek(0)
-        return output
-    excel_file = descargar_excel(df_cumplimentacion)
+    excel_file = descargar_excel(data_version, ("cumplimentacion", company_filter, group_filter, incluir_sin_progreso), df_cumplimentacion)
     st.download_button(
         label="📥 Descargar datos en Excel",
         data=excel_file,
@@ -549,7 +621,7 @@ elif metric_type == "Entrenamientos":
     with st.expander("💬 Análisis NLP de Sugerencias"):
 
         # Example usage with valid_training_actions
-        valid_survey_answers_suggestions['Sugerencias'].fillna("", inplace=True)
+        valid_survey_answers_suggestions['Sugerencias'] = valid_survey_answers_suggestions['Sugerencias'].fillna("")
 
         valid_survey_answers_suggestions['processed_sugerencias'] = valid_survey_answers_suggestions['Sugerencias'].apply(preprocess_text)
         valid_survey_answers_suggestions['processed_sugerencias'] = valid_survey_answers_suggestions['processed_sugerencias'].apply(lambda x: x.replace(' él ', ' '))
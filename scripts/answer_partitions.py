@@ -0,0 +1,47 @@
+# Description: Partición por tipo de las respuestas (y de sus ítems) de la vista de entrenamientos.
+#
+# Las métricas de entrenamientos leen cada una un tipo de respuesta (encuesta, acciones, cuadernos, cuestionario).
+# En lugar de recorrer todas las respuestas con query("type == ...") en cada sub-métrica, las filas se ordenan una
+# vez por versión de datos por (tipo, usuario, entrenamiento), con el tipo como categoría, y se guarda dónde empieza
+# cada tipo (offsets). Leer un tipo es un recorte de ese orden: el coste depende del tamaño del tipo, no del de la
+# colección ni del número de tipos. Se guardan las posiciones, no una copia ordenada de las respuestas.
+import numpy as np
+import pandas as pd
+
+# Claves por las que se ordenan las filas de cada tipo
+answer_partition_keys = ("user", "trainingNamedId")
+
+
+def build_type_index(frame, keys=answer_partition_keys):
+    """Índice por tipo de documento de `frame`: las posiciones de sus filas ordenadas por (tipo, *keys), los tipos
+    y el desplazamiento en ese orden de la primera fila de cada tipo (offsets tipo CSR).
+
+    Dentro de un mismo (tipo, *keys) las filas conservan su orden original. Las filas sin tipo quedan fuera.
+    """
+    if "type" not in frame.columns:
+        return {"order": np.empty(0, dtype=np.int64), "types": pd.Index([]), "offsets": np.zeros(1, dtype=np.int64)}
+    types = pd.Categorical(frame["type"])
+    codes = types.codes.astype(np.int64)
+    sort_keys = [pd.factorize(frame[key], sort=True)[0] for key in reversed(keys) if key in frame.columns]
+    order = np.lexsort(sort_keys + [codes])
+    counts = np.bincount(codes[codes >= 0], minlength=len(types.categories))
+    offsets = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+    return {"order": order, "types": types.categories, "offsets": offsets}
+
+
+def rows_of_type(frame, type_index, doc_type, columns):
+    """Columnas `columns` de las filas de `frame` de un tipo, ordenadas por las claves del índice, sin recorrer el resto."""
+    position = type_index["types"].get_indexer([doc_type])[0]
+    if position < 0:
+        rows = type_index["order"][:0]
+    else:
+        rows = type_index["order"][type_index["offsets"][position]:type_index["offsets"][position + 1]]
+    positions = frame.columns.get_indexer(columns)
+    if (positions < 0).any():
+        raise KeyError(f"Columnas que no están en los datos: {[column for column, position in zip(columns, positions) if position < 0]}")
+    return frame.iloc[rows, positions]
+
+
+def build_answer_partitions(answers, answer_items):
+    """Índices por tipo de las respuestas y de sus ítems aplanados (ver scripts.nested_items)."""
+    return {"answers": build_type_index(answers), "answer_items": build_type_index(answer_items)}
\ No newline at end of file
@@ -0,0 +1,47 @@
+# Description: Validez de las respuestas de texto libre de los entrenamientos y recuento de respuestas válidas.
+#
+# Una respuesta de texto es válida si tiene al menos MIN_TEXT_LENGTH caracteres (las más cortas, como "ok" o
+# "nada", no cuentan). La regla se evalúa de una vez para toda la columna con el accesor .str de pandas, y los
+# recuentos por (usuario, entrenamiento) y por entrenamiento salen de una única agregación agrupada por tipo de
+# respuesta. La usan las acciones, los cuadernos, las afirmaciones y las sugerencias de la encuesta.
+import pandas as pd
+import streamlit as st
+
+# Configuración (sección [trainings] de secrets.toml): longitud mínima de una respuesta de texto válida
+MIN_TEXT_LENGTH = int(st.secrets.get("trainings", {}).get("MIN_TEXT_LENGTH", 8))
+
+
+def is_valid_text(values, min_length=MIN_TEXT_LENGTH, as_text=True, keep_blank=False):
+    """Máscara de las respuestas válidas de una columna: no nulas y con al menos `min_length` caracteres.
+
+    Con `as_text` los valores que no son texto se comparan por su representación (str); si no, sólo valen los
+    textos. Con `keep_blank` las respuestas vacías ("") también cuentan como válidas.
+    """
+    values = values.astype(object)
+    lengths = (values.astype(str) if as_text else values).str.len()
+    valid = values.notna() & (lengths >= min_length)
+    if keep_blank:
+        valid |= lengths == 0
+    return valid
+
+
+def valid_texts(values, min_length=MIN_TEXT_LENGTH, as_text=True, keep_blank=False):
+    """Columna con las respuestas válidas (como texto con `as_text`) y None en el resto."""
+    valid = is_valid_text(values, min_length, as_text, keep_blank)
+    return (values.astype(str) if as_text else values.astype(object)).where(valid, None)
+
+
+def count_valid_answers(answers, valid, keys=("user", "trainingNamedId")):
+    """Respuestas válidas por (usuario, entrenamiento) y por entrenamiento, a partir de la máscara `valid`.
+
+    Devuelve (por_usuario, por_entrenamiento). por_usuario tiene, para cada (usuario, entrenamiento), el nº de
+    respuestas válidas ("valid"), el nº de respuestas ("answers") y la fracción válida ("share");
+    por_entrenamiento suma "valid" y "share" de sus usuarios (respuestas válidas y usuarios equivalentes con todas
+    sus respuestas válidas).
+    """
+    keys = list(keys)
+    per_user = answers[keys].assign(valid=valid.to_numpy(dtype=bool)).groupby(keys)["valid"].agg(["sum", "size"])
+    per_user = per_user.rename(columns={"sum": "valid", "size": "answers"})
+    per_user["share"] = per_user["valid"] / per_user["answers"]
+    per_training = per_user[["valid", "share"]].groupby(level=keys[-1]).sum()
+    return per_user, per_training
\ No newline at end of file
@@ -0,0 +1,212 @@
+# Description: Agregados de conexiones por (empresa, grupo, día), con vistas semanales y mensuales.
+#
+# Los agregados se construyen a partir del almacén de conexiones (scripts.connection_store) una vez por versión
+# de datos y se guardan en df["connection_rollups"]. Entre versiones sólo se pliegan las conexiones nuevas,
+# modificadas o borradas: se restan sus aportaciones anteriores y se suman las nuevas en los días afectados.
+#
+# Cada cubeta se identifica con un entero (clave de empresa y grupo << 32 | día). Se guardan dos tablas:
+#   - user_days: conexiones y duración por (cubeta, usuario), para contar usuarios distintos en cualquier periodo
+#   - daily: conexiones, duración total / nº de duraciones y usuarios activos por cubeta
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+_NAT = np.iinfo("int64").min
+_NS_PER_DAY = 86400 * 10**9
+_DAY_BITS = 32
+_DAY_OFFSET = 1 << 31
+
+# Claves estables (para todo el proceso) de cada par (empresa, grupo), con los nombres tal cual
+_segment_keys = {}
+_segment_names = []
+_segment_lock = threading.Lock()
+
+# Aportaciones por conexión de la última construcción de cada vista o partición (clave de build_connection_rollups),
+# para plegar sólo los cambios en su siguiente versión; se conservan las MAX_FOLD_STATES usadas más recientemente
+MAX_FOLD_STATES = 16
+_previous = OrderedDict()
+_rollups_lock = threading.Lock()
+
+
+def _segment_key_codes(segments):
+    """Clave estable de cada segmento del almacén (la última posición es la de las conexiones sin usuario)."""
+    names = list(zip(segments["company_name"], segments["group_name"])) + [(None, None)]
+    codes = []
+    with _segment_lock:
+        for company, group in names:
+            name = (None if pd.isna(company) else company, None if pd.isna(group) else group)
+            if name not in _segment_keys:
+                _segment_keys[name] = len(_segment_names)
+                _segment_names.append(name)
+            codes.append(_segment_keys[name])
+    return np.array(codes, dtype=np.int64)
+
+
+def connection_contributions(store):
+    """Aportación de cada conexión del almacén: id, cubeta (segmento y día), usuario y duración.
+
+    Las conexiones sin startDate no se asignan a ningún día y quedan fuera de los agregados;
+    las de usuarios desconocidos se cuentan con usuario -1 (no suman usuarios activos).
+    """
+    keys = _segment_key_codes(store["segments"])
+    dated = store["start"] != _NAT
+    start = store["start"][dated]
+    day = start // _NS_PER_DAY
+    return {
+        "id": pd.Series(store["connection_id"][dated]).to_numpy(dtype="int64", na_value=-1),
+        "bucket": (keys[store["segment"][dated]] << _DAY_BITS) | (day + _DAY_OFFSET),
+        "user": pd.Series(store["user_id"][dated]).to_numpy(dtype="int64", na_value=-1),
+        "duration": store["duration"][dated],
+    }
+
+
+def _subset(contributions, mask):
+    """Aportaciones de las conexiones seleccionadas por una máscara."""
+    return {name: values[mask] for name, values in contributions.items()}
+
+
+def _user_days(contributions, sign=1):
+    """Conexiones, duración total y nº de duraciones por (cubeta, usuario), con signo (+1 suma, -1 resta)."""
+    data = pd.DataFrame({
+        "bucket": contributions["bucket"],
+        "user_id": contributions["user"],
+        "connections": sign,
+        "duration_sum": np.where(np.isnan(contributions["duration"]), 0.0, contributions["duration"]) * sign,
+        "duration_n": (~np.isnan(contributions["duration"])).astype(np.int64) * sign,
+    })
+    return data.groupby(["bucket", "user_id"], sort=False).sum().reset_index()
+
+
+def _daily(user_days):
+    """Agregados por cubeta a partir de las filas (cubeta, usuario)."""
+    return user_days.assign(active_users=user_days["user_id"] >= 0).groupby("bucket")[
+        ["connections", "duration_sum", "duration_n", "active_users"]
+    ].sum()
+
+
+def fold_contributions(rollups, added, removed):
+    """Suma las aportaciones `added` y resta `removed` sólo en las cubetas afectadas y devuelve los nuevos agregados."""
+    delta = pd.concat([_user_days(added), _user_days(removed, -1)], ignore_index=True)
+    if delta.empty:
+        return rollups
+    touched = np.unique(delta["bucket"].to_numpy())
+    user_days, daily = rollups["user_days"], rollups["daily"]
+    affected = user_days["bucket"].isin(touched).to_numpy()
+    part = delta
+    if affected.any() or len(removed["id"]) or len(delta) > 1 and delta.duplicated(["bucket", "user_id"]).any():
+        part = pd.concat([user_days[affected], delta], ignore_index=True)
+        part = part.groupby(["bucket", "user_id"], sort=False).sum().reset_index()
+        part = part[part["connections"] != 0]
+    user_days = pd.concat([user_days[~affected], part], ignore_index=True)
+    daily = pd.concat([daily.drop(touched, errors="ignore"), _daily(part)]).sort_index()
+    return {"user_days": user_days, "daily": daily}
+
+
+def empty_rollups():
+    """Agregados sin ninguna conexión."""
+    user_days = pd.DataFrame({
+        "bucket": pd.Series(dtype="int64"), "user_id": pd.Series(dtype="int64"), "connections": pd.Series(dtype="int64"),
+        "duration_sum": pd.Series(dtype="float64"), "duration_n": pd.Series(dtype="int64"),
+    })
+    return {"user_days": user_days, "daily": _daily(user_days)}
+
+
+def _changes(previous, current):
+    """Aportaciones a sumar y a restar para pasar de `previous` a `current` (comparando por id de conexión)."""
+    if not len(previous["id"]):
+        return current, previous
+    index = pd.Index(previous["id"]).get_indexer(current["id"])
+    matched = index >= 0
+    old = np.where(matched, index, 0)
+    changed = matched & (
+        (previous["bucket"][old] != current["bucket"])
+        | (previous["user"][old] != current["user"])
+        | ~((previous["duration"][old] == current["duration"]) | (np.isnan(previous["duration"][old]) & np.isnan(current["duration"])))
+    )
+    kept = np.zeros(len(previous["id"]), dtype=bool)
+    kept[index[matched & ~changed]] = True
+    return _subset(current, ~matched | changed), _subset(previous, ~kept)
+
+
+def build_connection_rollups(store, key=None):
+    """Agregados de conexiones de un almacén, plegando sólo los cambios respecto a la última construcción con la
+    misma `key` (p. ej. ("main", empresa) para la vista principal completa o la partición de una empresa).
+
+    Sin `key`, la primera vez con una clave o si los ids de conexión no son únicos se agregan todas las conexiones.
+    """
+    current = connection_contributions(store)
+    unique = pd.Index(current["id"]).is_unique
+    with _rollups_lock:
+        previous = _previous.get(key) if key is not None else None
+        if previous is not None and previous["unique"] and unique:
+            added, removed = _changes(previous["contributions"], current)
+            rollups = fold_contributions(previous["rollups"], added, removed)
+        else:
+            rollups = fold_contributions(empty_rollups(), current, _subset(current, np.zeros(len(current["id"]), dtype=bool)))
+        if key is not None:
+            _previous[key] = {"contributions": current, "unique": unique, "rollups": rollups}
+            _previous.move_to_end(key)
+            while len(_previous) > MAX_FOLD_STATES:
+                _previous.popitem(last=False)
+    return rollups
+
+
+def _bucket_keys(buckets):
+    """Clave de empresa y grupo de cada cubeta."""
+    return buckets >> _DAY_BITS
+
+
+def _bucket_days(buckets):
+    """Día (días desde 1970-01-01) de cada cubeta."""
+    return (buckets & ((1 << _DAY_BITS) - 1)) - _DAY_OFFSET
+
+
+def _period_start(days, freq):
+    """Primer día (días desde 1970-01-01) del día, semana (lunes) o mes de cada día."""
+    if freq == "W":
+        return days - (days + 3) % 7
+    if freq == "M":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    return days
+
+
+def connection_trend(rollups, company_name=None, group_name=None, freq="D", fecha_inicio=None, fecha_fin=None):
+    """Serie de conexiones por día ("D"), semana ("W") o mes ("M") de una empresa y/o grupo.
+
+    Devuelve, por periodo, el nº de conexiones, la duración media y los usuarios activos distintos.
+    Las fechas filtran los días de las cubetas (días completos, ambos incluidos).
+    """
+    with _segment_lock:
+        names = pd.DataFrame(list(_segment_names), columns=["company_name", "group_name"])
+    keep = np.ones(len(names), dtype=bool)
+    if company_name:
+        keep &= names["company_name"].to_numpy() == company_name
+    if group_name:
+        keep &= names["group_name"].to_numpy() == group_name
+    keys = np.flatnonzero(keep)
+
+    def select(buckets):
+        days = _bucket_days(buckets)
+        mask = np.isin(_bucket_keys(buckets), keys)
+        if fecha_inicio is not None:
+            mask &= days >= pd.Timestamp(fecha_inicio).normalize().value // _NS_PER_DAY
+        if fecha_fin is not None:
+            mask &= days <= pd.Timestamp(fecha_fin).normalize().value // _NS_PER_DAY
+        return mask, _period_start(days, freq)
+
+    daily = rollups["daily"]
+    mask, periods = select(daily.index.to_numpy())
+    trend = daily[mask].groupby(periods[mask])[["connections", "duration_sum", "duration_n"]].sum()
+
+    user_days = rollups["user_days"]
+    mask, periods = select(user_days["bucket"].to_numpy())
+    users = pd.DataFrame({"period": periods[mask], "user_id": user_days["user_id"].to_numpy()[mask]})
+    users = users[users["user_id"] >= 0]
+    trend["active_users"] = users.drop_duplicates().groupby("period").size().reindex(trend.index, fill_value=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        trend["duration_mean"] = trend["duration_sum"] / trend["duration_n"].where(trend["duration_n"] > 0)
+    trend.index = pd.to_datetime(trend.index.to_numpy().astype("datetime64[D]"))
+    trend.index.name = "period"
+    return trend[["connections", "duration_mean", "active_users"]].reset_index()
@@ -0,0 +1,168 @@
+# Description: Almacén indexado de conexiones (series temporales por usuario) para la vista de conexiones.
+#
+# Las conexiones se ordenan una vez por versión de datos por (empresa, grupo, usuario, startDate) y se guardan
+# como arrays de numpy junto con los desplazamientos de cada segmento empresa / grupo y de cada usuario.
+# Las consultas (nº de conexiones, duración media, medias por empresa e histograma por día de la semana)
+# recortan esos arrays por segmento y rango de fechas, sin volver a unir conexiones con usuarios.
+import numpy as np
+import pandas as pd
+from scripts.user_dimension import user_positions
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_NAT = np.iinfo("int64").min
+_NS_PER_DAY = 86400 * 10**9
+
+
+def _codes(names):
+    """Códigos de categoría (-1 para nulos) y categorías de una columna de nombres."""
+    names = names.astype("category")
+    return names.cat.codes.to_numpy(dtype=np.int64), names.cat.categories
+
+
+def build_connection_store(df, last_start=None):
+    """Ordena las conexiones de la vista principal y construye sus índices por empresa, grupo y usuario.
+
+    `last_start` es la fecha de inicio de la última conexión de todos los datos (ver connection_horizon); en la
+    partición de una empresa no es la última de sus conexiones. Sin ella se toma la última de `df`.
+    """
+    dim = df["user_dim"]
+    company, companies = _codes(dim["company_name"])
+    group, groups = _codes(dim["group_name"])
+
+    # Orden de los usuarios de la dimensión por (empresa, grupo): rango de cada usuario en ese orden
+    user_order = np.lexsort((group, company))
+    user_rank = np.empty(len(dim), dtype=np.int64)
+    user_rank[user_order] = np.arange(len(dim))
+
+    # Conexiones ordenadas por (rango del usuario, startDate); las de usuarios fuera de la dimensión van primero
+    connections = df["connections"]
+    positions = user_positions(df, connections["user_id"])
+    rank = np.append(user_rank, -1)[positions]
+    start = connections["startDate"].to_numpy(dtype="datetime64[ns]").view("int64")
+    order = np.argsort(start, kind="stable")
+    order = order[np.argsort(rank[order], kind="stable")]
+    rank, start, positions = rank[order], start[order], positions[order]
+
+    # Desplazamientos: las conexiones del usuario de rango r son [user_offsets[r], user_offsets[r + 1])
+    user_offsets = np.searchsorted(rank, np.arange(len(dim) + 1))
+
+    # Segmentos (empresa, grupo): tramos consecutivos de usuarios con la misma empresa y grupo
+    segment_company, segment_group = company[user_order], group[user_order]
+    first = np.flatnonzero(np.r_[True, (np.diff(segment_company) != 0) | (np.diff(segment_group) != 0)]) if len(dim) else np.empty(0, dtype=np.int64)
+    bounds = user_offsets[np.r_[first, len(dim)]]
+    segments = pd.DataFrame({
+        "company_name": np.asarray(pd.Categorical.from_codes(segment_company[first], companies), dtype=object),
+        "group_name": np.asarray(pd.Categorical.from_codes(segment_group[first], groups), dtype=object),
+        "start": bounds[:-1],
+        "stop": bounds[1:],
+    })
+
+    # Segmento de cada conexión (-1 para las de usuarios fuera de la dimensión)
+    segment = np.r_[np.full(bounds[0], -1), np.repeat(np.arange(len(first)), np.diff(bounds))]
+
+    duration = connections["connectionDuration"].to_numpy(dtype="float64", na_value=np.nan)[order]
+    weekday = np.where(start == _NAT, -1, (start // _NS_PER_DAY + 3) % 7).astype(np.int8)
+    if last_start is None:
+        last_start = start.max() if len(start) else _NAT
+    return {
+        "start": start,
+        "last_start": int(last_start),
+        "duration": duration,
+        "weekday": weekday,
+        "company": np.append(company, -1)[positions],
+        "user_id": connections["user_id"].to_numpy()[order],
+        "connection_id": connections["connection_id"].to_numpy()[order],
+        "segment": segment,
+        "companies": companies,
+        "segments": segments,
+        "user_rank": user_rank,
+        "user_offsets": user_offsets,
+    }
+
+
+def select_connections(store, company_name=None, group_name=None, fecha_inicio=None, fecha_fin=None):
+    """Posiciones en el almacén de las conexiones de una empresa y/o grupo con startDate en [fecha_inicio, fecha_fin].
+
+    Sin filtro de empresa ni grupo se devuelven todas las conexiones (también las de usuarios sin empresa).
+    Las fechas son días completos: fecha_fin incluye todas las conexiones de ese día.
+    """
+    if company_name or group_name:
+        segments = store["segments"]
+        keep = np.ones(len(segments), dtype=bool)
+        if company_name:
+            keep &= segments["company_name"].to_numpy() == company_name
+        if group_name:
+            keep &= segments["group_name"].to_numpy() == group_name
+        segments = segments[keep]
+        positions = np.concatenate([np.arange(0, dtype=np.int64)] + [
+            np.arange(start, stop) for start, stop in zip(segments["start"], segments["stop"])
+        ])
+    else:
+        positions = np.arange(len(store["start"]))
+
+    if fecha_inicio is not None or fecha_fin is not None:
+        start = store["start"][positions]
+        keep = start != _NAT
+        if fecha_inicio is not None:
+            keep &= start >= pd.Timestamp(fecha_inicio).normalize().value
+        if fecha_fin is not None:
+            keep &= start < (pd.Timestamp(fecha_fin).normalize() + pd.Timedelta(days=1)).value
+        positions = positions[keep]
+    return positions
+
+
+def connection_horizon(store):
+    """Inicio (en nanosegundos) de la última conexión de todos los datos, o None si no hay ninguna fechada."""
+    last_start = store["last_start"] if "last_start" in store else (store["start"].max() if len(store["start"]) else _NAT)
+    return None if last_start == _NAT else int(last_start)
+
+
+def connection_date_range(store):
+    """Primera y última fecha de inicio de las conexiones (None si no hay ninguna)."""
+    start = store["start"][store["start"] != _NAT]
+    if not len(start):
+        return None, None
+    return pd.Timestamp(start.min()).date(), pd.Timestamp(start.max()).date()
+
+
+def connection_summary(store, positions):
+    """Número de conexiones y duración media (NaN si no hay duraciones) de las posiciones seleccionadas."""
+    duration = store["duration"][positions]
+    valid = ~np.isnan(duration)
+    return len(positions), duration[valid].mean() if valid.any() else np.nan
+
+
+def mean_duration_by_company(store, positions):
+    """Duración media por empresa (sólo empresas con conexiones seleccionadas), en el orden de las categorías."""
+    company, duration = store["company"][positions], store["duration"][positions]
+    assigned = company >= 0
+    company, duration = company[assigned], duration[assigned]
+    valid = ~np.isnan(duration)
+    size = len(store["companies"])
+    rows = np.bincount(company, minlength=size)
+    total = np.bincount(company[valid], weights=duration[valid], minlength=size)
+    count = np.bincount(company[valid], minlength=size)
+    present = np.flatnonzero(rows)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count[present] > 0, total[present] / count[present], np.nan)
+    return pd.DataFrame({"company_name": store["companies"][present], "connectionDuration": mean})
+
+
+def connections_by_weekday(store, positions):
+    """Nº de conexiones con duración por día de la semana (sólo los días con alguna conexión), de lunes a domingo."""
+    weekday, duration = store["weekday"][positions], store["duration"][positions]
+    dated = weekday >= 0
+    rows = np.bincount(weekday[dated], minlength=7)
+    count = np.bincount(weekday[dated & ~np.isnan(duration)], minlength=7)
+    present = np.flatnonzero(rows)
+    return pd.DataFrame({"day_of_week": np.array(DAY_NAMES)[present], "connectionDuration": count[present]})
+
+
+def user_connections(store, user_position):
+    """Serie temporal (startDate, duración) de las conexiones de un usuario, dada su posición en df["user_dim"]."""
+    rank = store["user_rank"][user_position]
+    start, stop = store["user_offsets"][rank], store["user_offsets"][rank + 1]
+    return pd.DataFrame({
+        "startDate": store["start"][start:stop].view("datetime64[ns]"),
+        "connectionDuration": store["duration"][start:stop],
+    })
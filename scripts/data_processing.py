@@ -1,6 +1,33 @@
+import hashlib
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import numpy as np
 import pandas as pd
 import streamlit as st
-from scripts.mongo_connector import get_collection_data
+from scripts.mongo_connector import get_collection_data, sync_collection_data, get_collection_fingerprint, get_max_value
+from scripts.object_ids import encode_object_ids, decode_object_ids, object_id_codes, touch_object_ids
+from scripts.user_dimension import USER_DIMENSION_KEYS, add_user_dimension
+from scripts.metrics import construir_cubo_recurrencia
+from scripts.connection_store import build_connection_store
+from scripts.connection_rollups import build_connection_rollups
+from scripts.training_content import build_training_content
+from scripts.nested_items import build_answer_items
+from scripts.answer_partitions import build_answer_partitions
+from scripts.translation_index import build_translation_index
+
+# Carga concurrente de colecciones (PARALLEL_LOAD = false en secrets.toml vuelve a la carga en serie)
+PARALLEL_LOAD = bool(st.secrets["mongodb"].get("PARALLEL_LOAD", True))
+LOAD_WORKERS = int(st.secrets["mongodb"].get("LOAD_WORKERS", 8))
+# Tiempo máximo de carga de cada colección en la carga concurrente (0: sin límite) y si una carga en la que fallan
+# algunas colecciones devuelve las que sí se cargaron (PARTIAL_LOAD = true) en lugar de fallar entera
+LOAD_TIMEOUT_S = float(st.secrets["mongodb"].get("LOAD_TIMEOUT_S", 300))
+PARTIAL_LOAD = bool(st.secrets["mongodb"].get("PARTIAL_LOAD", False))
+# Sincronización incremental de la capa en bruto al cambiar de versión de datos
+INCREMENTAL_SYNC = bool(st.secrets["mongodb"].get("INCREMENTAL_SYNC", True))
+# Cada cuántos segundos como mínimo se comprueba si los datos de MongoDB han cambiado
+VERSION_CHECK_INTERVAL_S = int(st.secrets["mongodb"].get("VERSION_CHECK_INTERVAL_S", 300))
 
 # Definir colecciones necesarias
 collection_names = ["companies", "groups", "users", "connections", "progress", "modules", "episodes", "exercises", "answers", "translations"
@@ -10,11 +37,13 @@ collection_names = ["companies", "groups", "users", "connections", "progress", "
 collection_columns = {
     "companies": {
         "keep": ["_id", "name"],
-        "rename": {"_id": "company_id", "name": "company_name"}
+        "rename": {"_id": "company_id", "name": "company_name"},
+        "categorical": ["name"]
     },
     "groups": {
         "keep": ["_id", "name"],
-        "rename": {"_id": "group_id", "name": "group_name"}
+        "rename": {"_id": "group_id", "name": "group_name"},
+        "categorical": ["name"]
     },
     "users": {
         "keep": ["_id", "group", "company", "email", "firstName", "lastName", "roles"],
@@ -22,15 +51,19 @@ collection_columns = {
     },
     "connections": {
         "keep": ["_id", "user", "address", "endDate", "connectionDuration", "startDate"],
-        "rename": {"_id": "connection_id", "user": "user_id"}
+        "rename": {"_id": "connection_id", "user": "user_id"},
+        "dtypes": {"endDate": "datetime64[ns]", "startDate": "datetime64[ns]"}
     },
     "progress": {
         "keep": ["_id", "user", "type", "completionDate", "createdAt", "updatedAt", "completed", "isViewed", "module", "exercise"],
-        "rename": {"_id": "progress_id", "user": "user_id", "type": "progress_type", "module": "module_id", "exercise": "exercise_id"}
+        "rename": {"_id": "progress_id", "user": "user_id", "type": "progress_type", "module": "module_id", "exercise": "exercise_id"},
+        "dtypes": {"completionDate": "datetime64[ns]", "createdAt": "datetime64[ns]", "updatedAt": "datetime64[ns]"},
+        "categorical": ["type"]
     },
     "modules": {
         "keep": ["_id", "namedId"],
-        "rename": {"_id": "module_id", "namedId": "module_name"}
+        "rename": {"_id": "module_id", "namedId": "module_name"},
+        "categorical": ["namedId"]
     },
     "episodes": {
         "keep": ["_id", "namedId", "isExclusiveToManagers", "replaces"],
@@ -50,20 +83,572 @@ collection_columns = {
     }
 }
 
-@st.cache_data
-def load_and_process_data():
-    """Carga datos de MongoDB y los procesa en DataFrames, excluyendo empresas y grupos no deseados."""
-    df = {col: get_collection_data(col) for col in collection_columns.keys()}
+# Empresas y grupos que no se muestran en el dashboard
+empresas_excluidas = ["Auren", "Demos Clientes"]
+grupos_excluidos = ["Cumplimentación"]
+
+def build_projection(fields):
+    """Construye la proyección de MongoDB para traer sólo los campos indicados."""
+    projection = {field: 1 for field in fields}
+    if "_id" not in projection:
+        projection["_id"] = 0
+    return projection
+
+# Filtros de empresas y grupos excluidos, comunes a todas las vistas
+dimension_filters = {
+    "companies": {"name": {"$nin": empresas_excluidas}},
+    "groups": {"name": {"$nin": grupos_excluidos}},
+}
+
+# Proyecciones y tipos de documento para las vistas de recurrencia, conexiones y cumplimentación
+collection_projections = {col: build_projection(columns["keep"]) for col, columns in collection_columns.items()}
+collection_types = {
+    "progress": ["progress_checkpoint", "progress_exercise"],
+}
+
+# Colecciones, proyecciones y tipos de documento para las vistas de entrenamientos y coach
+trainings_collection_names = [
+    "surveys", "connections", "progress", "companies", "groups", "answers",
+    "sessions", "trainings", "actions", "feedback", "users", "translations",
+    "threads"
+]
+trainings_projections = {
+    "companies": build_projection(["_id", "name"]),
+    "groups": build_projection(["_id", "name", "company"]),
+    "users": build_projection(["_id", "email", "firstName", "lastName", "company", "group", "hasUnlockedCoach"]),
+    "connections": build_projection(["_id", "user", "startDate", "endDate", "connectionDuration"]),
+    "progress": build_projection(["_id", "user", "type", "completed", "trainingNamedId"]),
+    "answers": build_projection([
+        "_id", "user", "type", "trainingNamedId", "items", "action", "input",
+        "notepad", "firstNoteInput", "secondNoteInput", "endingAffirmationInput"
+    ]),
+    "surveys": build_projection(["_id", "questions"]),
+    "trainings": build_projection(["_id", "namedId", "steps", "elements", "ideas", "actions", "questionnaire", "survey", "translations"]),
+    "translations": build_projection(["_id", "namedId", "content"]),
+}
+trainings_types = {
+    "progress": ["progress_training"],
+    "answers": [
+        "answer_survey_training", "answer_training_action",
+        "answer_training_notepad", "answer_training_questionnaire"
+    ],
+}
+
+# Vistas que se construyen sobre la capa de colecciones en bruto: (colecciones, proyecciones, tipos)
+views = {
+    "main": (list(collection_columns.keys()), collection_projections, collection_types),
+    "trainings": (trainings_collection_names, trainings_projections, trainings_types),
+}
+
+def _build_raw_specs():
+    """Calcula la proyección y el filtro de cada colección en bruto como la unión de lo que usan todas las vistas."""
+    projections, filters = {}, {}
+    names = []
+    for view_names, view_projections, view_types in views.values():
+        for col in view_names:
+            if col not in names:
+                names.append(col)
+    for col in names:
+        used_by = [spec for spec in views.values() if col in spec[0]]
+        if all(col in spec[1] for spec in used_by):
+            fields = []
+            for spec in used_by:
+                fields += [field for field, value in spec[1][col].items() if value and field not in fields]
+            projections[col] = build_projection(fields)
+        if col in dimension_filters:
+            filters[col] = dimension_filters[col]
+        elif all(col in spec[2] for spec in used_by):
+            types = []
+            for spec in used_by:
+                types += [t for t in spec[2][col] if t not in types]
+            filters[col] = {"type": {"$in": types}}
+    return names, projections, filters
+
+raw_collection_names, raw_projections, raw_filters = _build_raw_specs()
+
+# Colecciones de hechos, que con la carga por empresa (ver scripts.partitions) se descargan sólo para los usuarios
+# de una empresa; el resto (dimensiones) se cargan enteras
+fact_collection_names = ["connections", "progress", "answers", "threads"]
+
+# Tipos conocidos de las columnas de cada colección, aplicados al convertir el cursor
+raw_dtypes = {col: columns["dtypes"] for col, columns in collection_columns.items() if "dtypes" in columns}
+
+# Columnas con ObjectId de otras colecciones (o listas de ellos) que se codifican como enteros al cargar.
+# Los ids que sólo se referencian desde documentos anidados (traducciones, entrenamientos, encuestas) se dejan como ObjectId.
+id_columns = {
+    "companies": ["_id"],
+    "groups": ["_id", "company"],
+    "users": ["_id", "company", "group"],
+    "connections": ["_id", "user"],
+    "progress": ["_id", "user", "module", "exercise"],
+    "modules": ["_id"],
+    "episodes": ["_id", "replaces"],
+    "exercises": ["_id", "modules", "episodes", "replaces"],
+    "answers": ["_id", "user", "exercise"],
+    "threads": ["_id", "user"],
+}
+
+def view_id_columns(view, col):
+    """Nombres que tienen en una vista las columnas de ids codificados de una colección."""
+    columns = id_columns.get(col, [])
+    if view == "main" and col in collection_columns:
+        columns = [collection_columns[col]["rename"].get(column, column) for column in columns if column in collection_columns[col]["keep"]]
+    return columns
+
+class CollectionLoadError(RuntimeError):
+    """Error al cargar una o varias colecciones; el resto de colecciones sí se cargaron."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Error al cargar las colecciones: " + ", ".join(
+            f"{col} ({error!r})" for col, error in errors.items()
+        ))
+
+# Tiempos, filas y errores de la última carga de cada colección
+load_stats = {}
+_load_stats_lock = threading.Lock()
+
+def get_load_stats():
+    """Devuelve los tiempos de carga, filas y errores de la última carga de cada colección."""
+    with _load_stats_lock:
+        return {col: dict(stats) for col, stats in load_stats.items()}
+
+def _fetch_collection(col, projection, query, sync=None, dtypes=None):
+    """Carga una colección registrando su tiempo de carga y, si falla, el error.
+
+    Devuelve (datos, ids_cambiados). Con `sync` ("full" o "delta") la colección se sincroniza (ver
+    scripts.mongo_connector.sync_collection_data); si no, ids_cambiados es None y se carga entera.
+    """
+    start = time.perf_counter()
+    try:
+        if sync is None:
+            data, changed_ids = get_collection_data(col, projection, query, dtypes), None
+        else:
+            data, changed_ids = sync_collection_data(col, projection, query, dtypes, full=sync == "full")
+    except Exception as error:
+        with _load_stats_lock:
+            load_stats[col] = {"seconds": round(time.perf_counter() - start, 3), "rows": 0, "error": repr(error)}
+        raise
+    with _load_stats_lock:
+        load_stats[col] = {"seconds": round(time.perf_counter() - start, 3), "rows": len(data), "error": None}
+    return data, changed_ids
+
+def _fetch_collections(collection_names, projections, queries, parallel, modes=None, dtypes=None, timeout=None):
+    """Carga varias colecciones, en paralelo o en serie. Un fallo no interrumpe al resto.
+
+    `modes` indica, por colección, si se sincroniza ("full" o "delta", ver _fetch_collection).
+    En paralelo, una colección que no termina en `timeout` segundos (LOAD_TIMEOUT_S por defecto) cuenta como
+    fallida y no se espera a su hilo, que termina en segundo plano. En serie el límite es el SOCKET_TIMEOUT_MS
+    del cliente de MongoDB (ver scripts.mongo_connector).
+    """
+    modes = modes or {}
+    timeout = LOAD_TIMEOUT_S if timeout is None else timeout
+    results, errors = {}, {}
+    if parallel and LOAD_WORKERS > 1 and len(collection_names) > 1:
+        pool = ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(collection_names)))
+        try:
+            futures = {
+                col: pool.submit(
+                    _fetch_collection, col, projections.get(col), queries.get(col), modes.get(col), dtypes.get(col)
+                )
+                for col in collection_names
+            }
+            deadline = time.monotonic() + timeout if timeout else None
+            for col, future in futures.items():
+                try:
+                    results[col] = future.result(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+                except FuturesTimeoutError:
+                    errors[col] = TimeoutError(f"La colección {col} no se ha cargado en {timeout:g} s")
+                    with _load_stats_lock:
+                        load_stats[col] = {"seconds": timeout, "rows": 0, "error": repr(errors[col])}
+                except Exception as error:
+                    errors[col] = error
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        for col in collection_names:
+            try:
+                results[col] = _fetch_collection(
+                    col, projections.get(col), queries.get(col), modes.get(col), dtypes.get(col)
+                )
+            except Exception as error:
+                errors[col] = error
+    return results, errors
+
+def _sync_key(projection, query):
+    """Identifica la proyección y el filtro con los que se sincronizó la última versión de una colección."""
+    return repr((projection, query))
+
+def _apply_changes(base, delta, changed_ids, id_column_names):
+    """Sustituye en `base` (la versión anterior de una colección) las filas de los documentos `changed_ids`
+    por las de `delta` (los que aún cumplen el filtro). Si no ha cambiado nada (tampoco en los documentos que se
+    vuelven a descargar por compartir la marca de agua) devuelve `base` tal cual, sin copiarla.
+
+    Los ids de las filas que se conservan se marcan como vistos (ver scripts.object_ids.touch_object_ids): no se
+    vuelven a codificar, y sin marcarlos se olvidarían al cambiar de versión.
+    """
+    if len(changed_ids) and "_id" in base.columns:
+        changed = changed_ids if base["_id"].dtype == object else object_id_codes(changed_ids)
+        keep = ~base["_id"].isin(changed).to_numpy()
+        if len(delta) == (~keep).sum() and delta.columns.isin(base.columns).all():
+            previous = base[~keep].sort_values("_id").reset_index(drop=True)
+            missing = previous.drop(columns=delta.columns)
+            if missing.isna().all().all() and previous[delta.columns].astype(object).equals(
+                    delta.sort_values("_id").reset_index(drop=True).astype(object)):
+                delta = delta.iloc[:0]
+                keep[:] = True
+        if not keep.all():
+            base = base[keep].reset_index(drop=True)
+    if not delta.empty:
+        base = pd.concat([base, delta], ignore_index=True) if not base.empty else delta
+    for column in id_column_names:
+        if column in base.columns:
+            touch_object_ids(base[column])
+    return base
+
+def _finish_collections(fetched, modes, projections, queries, id_columns, bases):
+    """Codifica los ids de las colecciones descargadas (con `id_columns`) y, en las sincronizadas, aplica los
+    cambios a su versión anterior de `bases` y la sustituye por la nueva."""
+    data = {col: frame for col, (frame, _) in fetched.items()}
+    if id_columns:
+        data = encode_object_ids(data, id_columns)
+    for col, (_, changed_ids) in fetched.items():
+        if changed_ids is not None:
+            data[col] = _apply_changes(bases[col][1], data[col], changed_ids, (id_columns or {}).get(col, []))
+        if modes.get(col) is not None:
+            bases[col] = (_sync_key(projections.get(col), queries.get(col)), data[col])
+    return data
+
+def load_collections(collection_names, projections=None, filters=None, parallel=None, dimensions=None,
+                     incremental=False, dtypes=None, partial=False, id_columns=None, bases=None):
+    """Carga las colecciones de MongoDB aplicando proyección y filtro en el servidor.
+
+    Empresas y grupos se cargan primero para que los usuarios se filtren en MongoDB
+    por los ids de empresas y grupos válidos. El resto de colecciones se cargan en un
+    pool de hilos acotado (o en serie si `parallel` es False o PARALLEL_LOAD está desactivado).
+    Si alguna colección falla (o supera LOAD_TIMEOUT_S), se terminan de cargar las demás y se lanza
+    CollectionLoadError; con `partial=True` se devuelven sólo las que se han cargado.
+    `dimensions` permite pasar empresas y grupos ya cargados para filtrar los usuarios.
+    `dtypes` indica, por colección, los tipos de las columnas conocidas.
+    Con `id_columns` los ObjectId de esas columnas se sustituyen por códigos enteros (ver scripts.object_ids).
+    Con `incremental=True` y `bases` ({colección: (clave, DataFrame)}, la última versión cargada de cada colección,
+    que se actualiza aquí) cada colección sólo descarga los cambios desde su última carga y los aplica a esa
+    versión; las que no están en `bases` o se cargaron con otra proyección o filtro se cargan enteras.
+    """
+    projections = projections or {}
+    filters = filters or {}
+    dtypes = dtypes or {}
+    bases = {} if bases is None else bases
+    parallel = PARALLEL_LOAD if parallel is None else parallel
+
+    def sync_modes(names, queries):
+        if not incremental:
+            return {}
+        return {
+            col: "delta" if col in bases and bases[col][0] == _sync_key(projections.get(col), queries.get(col)) else "full"
+            for col in names
+        }
+
+    dimension_names = [col for col in ["companies", "groups"] if col in collection_names]
+    modes = sync_modes(dimension_names, filters)
+    fetched, errors = _fetch_collections(dimension_names, projections, filters, parallel, modes, dtypes)
+    df = _finish_collections(fetched, modes, projections, filters, id_columns, bases)
+    known = {**(dimensions or {}), **df}
+
+    queries = {}
+    for col in collection_names:
+        if col in dimension_names:
+            continue
+        query = dict(filters.get(col, {}))
+        if col == "users":
+            if "companies" in known and not known["companies"].empty:
+                query["company"] = {"$in": sorted(decode_object_ids(known["companies"]["_id"]).tolist())}
+            if "groups" in known and not known["groups"].empty:
+                query["group"] = {"$in": sorted(decode_object_ids(known["groups"]["_id"]).tolist())}
+        queries[col] = query
+
+    modes = sync_modes(queries, queries)
+    fetched, fact_errors = _fetch_collections(list(queries.keys()), projections, queries, parallel, modes, dtypes)
+    df.update(_finish_collections(fetched, modes, projections, queries, id_columns, bases))
+    errors.update(fact_errors)
+    if errors:
+        if not partial:
+            raise CollectionLoadError(errors)
+        print(CollectionLoadError(errors))
+
+    return {col: df[col] for col in collection_names if col in df}
+
+# Capa de colecciones en bruto compartida por todas las vistas: {(colección, versión de datos): DataFrame}
+_raw_cache = {}
+_raw_cache_lock = threading.Lock()
+_raw_load_lock = threading.Lock()
+# Última versión cargada de cada colección sincronizada de forma incremental (ver load_collections): es el mismo
+# DataFrame que el de la capa en bruto de esa versión, no una copia. Sólo se modifica con _raw_load_lock
+_sync_bases = {}
+# Inicio de la última conexión de todos los datos por versión (ver get_last_connection), con _raw_cache_lock
+_last_connections = {}
+
+# Versión de datos actual: hash de la huella de las colecciones en MongoDB (ver check_data_version)
+_data_version = None
+_version_state = {"fingerprint": {}, "last_check": 0.0, "checks": 0, "changes": 0, "error": None}
+_version_lock = threading.Lock()
+
+def get_data_fingerprint(collection_names=None, parallel=None):
+    """Huella de cada colección en bruto (ver get_collection_fingerprint), consultadas en paralelo."""
+    collection_names = collection_names or raw_collection_names
+    parallel = PARALLEL_LOAD if parallel is None else parallel
+    if parallel and LOAD_WORKERS > 1 and len(collection_names) > 1:
+        with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(collection_names))) as pool:
+            return dict(zip(collection_names, pool.map(get_collection_fingerprint, collection_names)))
+    return {col: get_collection_fingerprint(col) for col in collection_names}
+
+def fingerprint_version(fingerprint):
+    """Versión de datos (hash corto) a partir de las huellas de las colecciones."""
+    return hashlib.sha1(json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+def set_data_version(version):
+    """Fija la versión de datos sin consultar MongoDB (p. ej. la de la instantánea con la que arranca el proceso).
+
+    La siguiente comprobación periódica se hace VERSION_CHECK_INTERVAL_S segundos después.
+    """
+    global _data_version
+    with _version_lock:
+        _data_version = version
+        _version_state["last_check"] = time.time()
+
+def check_data_version(force=False):
+    """Recalcula la huella de los datos y pasa a una nueva versión sólo si ha cambiado. Devuelve True si cambió.
+
+    Sin `force`, la huella se recalcula como mucho cada VERSION_CHECK_INTERVAL_S segundos. Si MongoDB no
+    responde se mantiene la versión actual (o, si aún no hay ninguna, una basada en la hora de arranque).
+    """
+    global _data_version
+    with _version_lock:
+        if not force and _data_version is not None and time.time() - _version_state["last_check"] < VERSION_CHECK_INTERVAL_S:
+            return False
+        _version_state["last_check"] = time.time()
+    try:
+        fingerprint = get_data_fingerprint()
+    except Exception as error:
+        with _version_lock:
+            _version_state["error"] = repr(error)
+            if _data_version is None:
+                _data_version = str(int(time.time()))
+        return False
+    version = fingerprint_version(fingerprint)
+    with _version_lock:
+        changed = version != _data_version
+        _data_version = version
+        _version_state.update(fingerprint=fingerprint, error=None)
+        _version_state["checks"] += 1
+        _version_state["changes"] += changed
+    return changed
+
+def get_data_version():
+    """Devuelve la versión de datos actual, que forma parte de la clave de todas las cachés.
+
+    La primera llamada del proceso calcula la huella de los datos si aún no hay versión.
+    """
+    if _data_version is None:
+        check_data_version(force=True)
+    return _data_version
+
+def get_version_stats():
+    """Devuelve la versión de datos, la huella de cada colección y el resultado de la última comprobación."""
+    with _version_lock:
+        return {
+            "version": _data_version,
+            "last_check": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(_version_state["last_check"])),
+            "checks": _version_state["checks"],
+            "changes": _version_state["changes"],
+            "error": _version_state["error"],
+            "fingerprint": dict(_version_state["fingerprint"]),
+        }
+
+def invalidate_raw_cache():
+    """Descarta la capa en bruto y fuerza una nueva versión de datos aunque la huella no haya cambiado.
+
+    La siguiente carga vuelve a MongoDB; con INCREMENTAL_SYNC activo sólo descarga los documentos nuevos
+    o modificados. Para recargar sólo cuando los datos cambian, use check_data_version.
+    """
+    global _data_version
+    with _raw_cache_lock:
+        _raw_cache.clear()
+    with _version_lock:
+        _data_version = str(time.time_ns())
+        return _data_version
+
+def drop_raw_versions(data_version):
+    """Descarta de la capa en bruto las colecciones de versiones distintas de `data_version` (la que se pasa a
+    servir) y de la versión actual, que puede estar construyéndose. La llama el refresco al cambiar de versión."""
+    with _raw_cache_lock:
+        for key in [key for key in _raw_cache if key[1] not in (data_version, _data_version)]:
+            del _raw_cache[key]
+        for key in [key for key in _last_connections if key not in (data_version, _data_version)]:
+            del _last_connections[key]
+
+def _company_user_ids(raw, company_name):
+    """ObjectId de los usuarios (de la capa en bruto) de una empresa."""
+    company_ids = raw["companies"].loc[raw["companies"]["name"] == company_name, "_id"]
+    return decode_object_ids(raw["users"].loc[raw["users"]["company"].isin(company_ids), "_id"]).tolist()
+
+def get_last_connection(data_version=None):
+    """Inicio (en nanosegundos) de la última conexión de todos los usuarios en una versión de datos, o None.
+
+    Las particiones de empresa (ver scripts.partitions) sólo tienen las conexiones de sus usuarios; con esta fecha
+    sus métricas saben hasta dónde llegan los datos, igual que la vista completa. Se toma de la capa en bruto si
+    ya tiene las conexiones de esa versión y, si no, se pide a MongoDB (un único documento); una vez por versión.
+    """
+    data_version = data_version or get_data_version()
+    with _raw_cache_lock:
+        if data_version in _last_connections:
+            return _last_connections[data_version]
+        raw = _raw_cache.get(("connections", data_version))
+    if raw is not None and "startDate" in raw.columns:
+        last = raw["startDate"].max()
+    else:
+        last = get_max_value("connections", "startDate", raw_filters.get("connections"))
+    last = None if last is None or pd.isna(last) else pd.Timestamp(last).value
+    with _raw_cache_lock:
+        _last_connections[data_version] = last
+    return last
+
+def get_company_raw_collections(collection_names, company_name, data_version=None):
+    """Colecciones en bruto de una empresa: las dimensiones completas (de la capa compartida) y las de hechos
+    sólo con los documentos de sus usuarios, filtrados en MongoDB por sus ids. Los hechos no se guardan aquí
+    (la vista procesada de la empresa se guarda en scripts.partitions)."""
+    facts = [col for col in collection_names if col in fact_collection_names]
+    dimensions = [col for col in collection_names if col not in facts]
+    raw = get_raw_collections(list(dict.fromkeys(dimensions + ["companies", "users"])), data_version)
+    user_ids = _company_user_ids(raw, company_name)
+    queries = {col: {**raw_filters.get(col, {}), "user": {"$in": user_ids}} for col in facts}
+    loaded = encode_object_ids(load_collections(facts, raw_projections, queries, dtypes=raw_dtypes), id_columns)
+    return {col: loaded[col] if col in facts else raw[col] for col in collection_names}
+
+def get_raw_collections(collection_names, data_version=None, partial=None):
+    """Devuelve las colecciones en bruto para una versión de datos, descargando sólo las que faltan.
+
+    Cada colección se descarga una única vez por versión con la unión de campos y tipos de
+    documento que usan todas las vistas, de forma incremental si INCREMENTAL_SYNC está activo.
+    Al cargarlas, los ObjectId de `id_columns` se sustituyen por códigos enteros (ver scripts.object_ids).
+    Las colecciones de cada versión se guardan por separado: cargar una versión no descarta las de otras, que
+    se descartan al pasar a servir una nueva (ver drop_raw_versions).
+    Con `partial` (PARTIAL_LOAD por defecto) las colecciones que no se pueden cargar se devuelven vacías y no
+    se guardan: se vuelven a pedir en la siguiente llamada. Sin él, un fallo lanza CollectionLoadError.
+    """
+    data_version = data_version or get_data_version()
+    partial = PARTIAL_LOAD if partial is None else partial
+    with _raw_load_lock:
+        with _raw_cache_lock:
+            missing = [col for col in collection_names if (col, data_version) not in _raw_cache]
+            dimensions = {
+                col: _raw_cache[(col, data_version)]
+                for col in ["companies", "groups"] if (col, data_version) in _raw_cache
+            }
+        if missing:
+            loaded = load_collections(
+                missing, raw_projections, raw_filters, dimensions=dimensions, incremental=INCREMENTAL_SYNC,
+                dtypes=raw_dtypes, partial=partial, id_columns=id_columns, bases=_sync_bases
+            )
+            with _raw_cache_lock:
+                for col, data in loaded.items():
+                    _raw_cache[(col, data_version)] = data
+        with _raw_cache_lock:
+            return {
+                col: _raw_cache[(col, data_version)] if (col, data_version) in _raw_cache else pd.DataFrame()
+                for col in collection_names
+            }
+
+def select_columns(data, columns, dtypes=None):
+    """Columnas `columns` de `data` en un DataFrame nuevo que comparte los datos con `data`, sin copiarlos
+    (las vistas son de sólo lectura, ver scripts.shared_datasets). Las columnas que no están en `data` se crean
+    vacías; `dtypes` convierte las columnas indicadas."""
+    dtypes = dtypes or {}
+    selected = {}
+    for column in columns:
+        values = data[column] if column in data.columns else pd.Series(np.nan, index=data.index)
+        selected[column] = values.astype(dtypes[column], copy=False) if column in dtypes else values
+    return pd.DataFrame(selected, index=data.index, copy=False)
+
+def build_view(view, data_version=None, company_name=None):
+    """Construye una vista a partir de la capa en bruto: sólo sus columnas y sus tipos de documento.
+
+    Con `company_name`, las colecciones de hechos sólo tienen los documentos de los usuarios de esa empresa.
+    Las columnas de la vista comparten los datos de la capa en bruto: sólo se copian las filas que se filtran.
+    """
+    collection_names, projections, types = views[view]
+    if company_name is None:
+        raw = get_raw_collections(collection_names, data_version)
+    else:
+        raw = get_company_raw_collections(collection_names, company_name, data_version)
+    df = {}
+    for col in collection_names:
+        data = raw[col]
+        if not data.empty:
+            if col in types and "type" in data.columns:
+                mask = data["type"].isin(types[col])
+                if not mask.all():
+                    data = data[mask]
+            if col in projections:
+                data = select_columns(data, [field for field, value in projections[col].items() if value and field in data.columns])
+        df[col] = data.copy(deep=False)
+    return df
+
+# Tablas derivadas que se añaden a las vistas al cargarlas (se reconstruyen, no se guardan en las instantáneas)
+# y huella de los datos de la vista, que forma parte de la clave de la caché de métricas (ver scripts.memo)
+DERIVED_TABLES = USER_DIMENSION_KEYS + (
+    "recurrence_cube", "connection_store", "connection_rollups",
+    "training_content", "answer_items", "answer_partitions", "translation_index", "data_fingerprint"
+)
+
+def add_derived_tables(df, view, company_name=None, data_version=None):
+    """Añade a una vista la dimensión de usuarios (todas las métricas); en la principal, el cubo de recurrencia,
+    el almacén de conexiones y sus agregados por día, y en la de entrenamientos, su contenido en tablas planas
+    y los ítems de las respuestas aplanados, con sus índices por tipo de respuesta y el de las traducciones.
+    `company_name` es la empresa de la partición (None para la vista completa): los agregados de conexiones
+    se pliegan sobre los de la versión anterior de la misma vista o partición, y el almacén de conexiones guarda
+    la última conexión de todos los datos de `data_version` (ver get_last_connection)."""
+    add_user_dimension(df, view)
+    if view == "main":
+        df["recurrence_cube"] = construir_cubo_recurrencia(df)
+        last_start = get_last_connection(data_version) if company_name is not None else None
+        df["connection_store"] = build_connection_store(df, last_start)
+        df["connection_rollups"] = build_connection_rollups(df["connection_store"], key=(view, company_name))
+    elif view == "trainings":
+        df["training_content"] = build_training_content(df["trainings"])
+        df["answer_items"] = build_answer_items(df["answers"])
+        df["answer_partitions"] = build_answer_partitions(df["answers"], df["answer_items"])
+        df["translation_index"] = build_translation_index(df["translations"])
+    return df
+
+def _view_fingerprint(view, data_version, company_name):
+    """Huella de los datos de una vista completa o de la partición de una empresa."""
+    fingerprint = f"{view}:{data_version or get_data_version()}"
+    return fingerprint if company_name is None else f"{fingerprint}:company:{company_name}"
+
+def load_and_process_data(data_version=None, company_name=None):
+    """Carga datos de MongoDB y los procesa en DataFrames, excluyendo empresas y grupos no deseados.
+
+    No se cachea aquí: el resultado se guarda una vez por proceso y versión de datos en scripts.refresher
+    (o, con `company_name`, como partición de esa empresa en scripts.partitions).
+    """
+    df = build_view("main", data_version, company_name)
 
     for col, columns in collection_columns.items():
-        if not df[col].empty:
-            if "keep" in columns:
-                df[col] = df[col][columns["keep"]]
-            if "rename" in columns and columns["rename"]:
-                df[col] = df[col].rename(columns=columns["rename"])
+        if "keep" in columns:
+            # Los campos opcionales que no tiene ningún documento cargado (p. ej. sólo aparecen en tipos de documento
+            # que se filtran en MongoDB) quedan como columnas vacías, con su tipo si es conocido
+            missing = [column for column in columns["keep"] if column not in df[col].columns]
+            dtypes = {column: dtype for column, dtype in columns.get("dtypes", {}).items() if column in missing}
+            df[col] = select_columns(df[col], columns["keep"], {
+                **dtypes, **{column: "category" for column in columns.get("categorical", [])}
+            })
+        elif "categorical" in columns:
+            df[col] = df[col].astype({column: "category" for column in columns["categorical"]})
+        if "rename" in columns and columns["rename"]:
+            df[col] = df[col].rename(columns=columns["rename"], copy=False)
 
     # Filtrar empresas no deseadas
-    empresas_excluidas = ["Auren", "Demos Clientes"]
     df["companies"] = df["companies"][~df["companies"]["company_name"].isin(empresas_excluidas)]
 
     # Conservar sólo grupos de empresas válidas
@@ -73,28 +658,21 @@ def load_and_process_data():
 
     if not df["groups"].empty:
         df["groups"] = df["groups"][
-            df["groups"]["group_name"] != "Cumplimentación"
+            ~df["groups"]["group_name"].isin(grupos_excluidos)
         ]
         grupos_validos_ids = df["groups"]["group_id"]
         if not df["users"].empty:
             df["users"] = df["users"][df["users"]["group_id"].isin(grupos_validos_ids)]
 
-    return df
+    df["data_fingerprint"] = _view_fingerprint("main", data_version, company_name)
+    return add_derived_tables(df, "main", company_name, data_version)
 
-@st.cache_data
-def load_and_process_data_trainings():
+def load_and_process_data_trainings(data_version=None, company_name=None):
     """Carga datos de MongoDB y los procesa en DataFrames, excluyendo empresas y grupos no deseados."""
-    collection_names = [
-        "surveys", "connections", "progress", "companies", "groups", "answers",
-        "sessions", "trainings", "actions", "feedback", "users", "translations",
-        "threads"
-    ]
-
     # Cargar datos
-    df = {collection: get_collection_data(collection) for collection in collection_names}
+    df = build_view("trainings", data_version, company_name)
 
     # Filtrar empresas no deseadas
-    empresas_excluidas = ["Auren", "Demos Clientes"]
     if not df["companies"].empty:
         df["companies"] = df["companies"][~df["companies"]["name"].isin(empresas_excluidas)]
 
@@ -105,42 +683,45 @@ def load_and_process_data_trainings():
 
     # Filtrar grupos no deseados
     if not df["groups"].empty:
-        df["groups"] = df["groups"][df["groups"]["name"] != "Cumplimentación"]
+        df["groups"] = df["groups"][~df["groups"]["name"].isin(grupos_excluidos)]
         grupos_validos_ids = df["groups"]["_id"]
 
         # Filtrar usuarios por grupos válidos
         if not df["users"].empty:
             df["users"] = df["users"][df["users"]["group"].isin(grupos_validos_ids)]
 
-    return df
+    df["data_fingerprint"] = _view_fingerprint("trainings", data_version, company_name)
+    return add_derived_tables(df, "trainings", company_name, data_version)
 
-@st.cache_data
-def load_and_process_data_cumplimentacion():
-    """Carga datos de MongoDB y los procesa en DataFrames, excluyendo empresas y grupos no deseados."""
-    df = {col: get_collection_data(col) for col in collection_columns.keys()}
+def load_and_process_data_cumplimentacion(data_version=None, company_name=None):
+    """Datos de cumplimentación: misma vista que load_and_process_data."""
+    return load_and_process_data(data_version, company_name)
 
-    for col, columns in collection_columns.items():
-        if not df[col].empty:
-            if "keep" in columns:
-                df[col] = df[col][columns["keep"]]
-            if "rename" in columns and columns["rename"]:
-                df[col] = df[col].rename(columns=columns["rename"])
+def load_dimensions(data_version=None):
+    """Carga todas las colecciones de dimensiones en la capa en bruto y devuelve las empresas y grupos
+    (sin los excluidos) con las columnas de la vista de entrenamientos, para los filtros del dashboard."""
+    projections = views["trainings"][1]
+    raw = get_raw_collections([col for col in raw_collection_names if col not in fact_collection_names], data_version)
+    df = {}
+    for col, excluded in [("companies", empresas_excluidas), ("groups", grupos_excluidos)]:
+        data = raw[col]
+        if not data.empty:
+            data = data[~data["name"].isin(excluded)]
+            data = select_columns(data, [field for field, value in projections[col].items() if value and field in data.columns])
+        df[col] = data.copy(deep=False)
+    df["data_fingerprint"] = f"dimensions:{data_version or get_data_version()}"
+    return df
 
-    # Filtrar empresas no deseadas
-    empresas_excluidas = ["Auren", "Demos Clientes"]
-    df["companies"] = df["companies"][~df["companies"]["company_name"].isin(empresas_excluidas)]
+def list_company_names(df):
+    """Devuelve los nombres de empresas (ordenados) a partir de los datos cargados de entrenamientos."""
+    return sorted(df["companies"]["name"].tolist())
 
-    # Conservar sólo grupos de empresas válidas
-    empresas_validas_ids = df["companies"]["company_id"]
-    if not df["users"].empty:
-        df["users"] = df["users"][df["users"]["company_id"].isin(empresas_validas_ids)]
+def list_group_names(df, company_name):
+    """Devuelve los nombres de grupos (ordenados) de una empresa a partir de los datos cargados de entrenamientos."""
+    company_ids = df["companies"].loc[df["companies"]["name"] == company_name, "_id"]
+    groups_list = df["groups"].loc[df["groups"]["company"].isin(company_ids), "name"].tolist()
 
-    if not df["groups"].empty:
-        df["groups"] = df["groups"][
-            df["groups"]["group_name"] != "Cumplimentación"
-        ]
-        grupos_validos_ids = df["groups"]["group_id"]
-        if not df["users"].empty:
-            df["users"] = df["users"][df["users"]["group_id"].isin(grupos_validos_ids)]
+    if not groups_list:
+        print(f"No se encontraron grupos para la empresa {company_name}")
 
-    return df
\ No newline at end of file
+    return sorted(groups_list)
\ No newline at end of file
@@ -0,0 +1,159 @@
+# Description: Memoización de las métricas por (función, huella de los datos, filtros), compartida entre sesiones.
+#
+# Dos niveles: una LRU acotada en memoria (para todas las sesiones del proceso) y, opcionalmente, un directorio
+# en disco que sobrevive a los reinicios. La huella de los datos identifica la versión de datos de la vista
+# (df["data_fingerprint"], ver scripts.data_processing); al cambiar de versión las entradas antiguas dejan de
+# usarse y se descartan con invalidate_memo. Los resultados guardados se comparten entre sesiones como los
+# conjuntos de datos (ver scripts.shared_datasets): cada llamada recibe DataFrames nuevos que comparten los datos.
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+import pandas as pd
+import streamlit as st
+
+# Configuración (sección [memo] de secrets.toml)
+MEMO_ENABLED = bool(st.secrets.get("memo", {}).get("ENABLED", True))
+MEMO_MAX_ENTRIES = int(st.secrets.get("memo", {}).get("MAX_ENTRIES", 256))
+# Directorio del nivel en disco, p. ej. "memo_cache" ("" lo desactiva)
+MEMO_DISK_DIR = st.secrets.get("memo", {}).get("DISK_DIR", "")
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+_memo_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_writes": 0, "invalidations": 0}
+
+
+def _count(name, value=1):
+    """Suma `value` a un contador de la caché."""
+    with _memo_lock:
+        _memo_stats[name] += value
+
+
+def _hash(value):
+    """Hash estable entre procesos (a partir de repr) de una clave o una huella."""
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
+
+
+def _disk_path(fingerprint, key):
+    """Fichero del nivel en disco de una entrada: un directorio por huella de datos."""
+    return os.path.join(MEMO_DISK_DIR, _hash(fingerprint), _hash(key) + ".pkl")
+
+
+def _read_disk(fingerprint, key):
+    """Devuelve (encontrado, valor) del nivel en disco; un fichero ilegible cuenta como fallo."""
+    if not MEMO_DISK_DIR:
+        return False, None
+    try:
+        with open(_disk_path(fingerprint, key), "rb") as f:
+            stored_key, value = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return False, None
+    return stored_key == key, value
+
+
+def _write_disk(fingerprint, key, value):
+    """Guarda una entrada en disco (fichero temporal y os.replace, como las instantáneas)."""
+    if not MEMO_DISK_DIR:
+        return
+    path = _disk_path(fingerprint, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        return
+    _count("disk_writes")
+
+
+def _store(key, value):
+    """Guarda una entrada en la LRU y descarta las menos usadas por encima de MEMO_MAX_ENTRIES."""
+    with _memo_lock:
+        _memo[key] = value
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_MAX_ENTRIES:
+            _memo.popitem(last=False)
+            _memo_stats["evictions"] += 1
+
+
+def _shared_copy(value):
+    """Copia superficial de un resultado guardado: DataFrames y Series nuevos que comparten los datos con el guardado
+    (y tuplas, listas y diccionarios con sus elementos copiados igual); el resto de valores se devuelven tal cual."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_shared_copy(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _shared_copy(item) for key, item in value.items()}
+    return value
+
+
+def memoize(func):
+    """Memoiza una métrica cuyo primer argumento es el diccionario de DataFrames de una vista.
+
+    La clave es (función, df["data_fingerprint"], resto de argumentos normalizados con la firma de la función).
+    Si la vista no tiene huella o algún argumento no es hashable, la métrica se calcula sin caché.
+    Cada llamada devuelve una copia superficial del resultado guardado (sin copiar los datos): el llamante puede
+    renombrar, añadir o sustituir columnas, pero no modificar valores en su sitio (p. ej. fillna(inplace=True)).
+    """
+    signature = inspect.signature(func)
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(df, *args, **kwargs):
+        fingerprint = df.get("data_fingerprint") if isinstance(df, dict) else None
+        if not MEMO_ENABLED or fingerprint is None:
+            return func(df, *args, **kwargs)
+        bound = signature.bind(df, *args, **kwargs)
+        bound.apply_defaults()
+        key = (name, fingerprint, tuple(list(bound.arguments.items())[1:]))
+        try:
+            hash(key)
+        except TypeError:
+            return func(df, *args, **kwargs)
+
+        with _memo_lock:
+            found = key in _memo
+            if found:
+                _memo.move_to_end(key)
+                value = _memo[key]
+                _memo_stats["hits"] += 1
+        if not found:
+            found, value = _read_disk(fingerprint, key)
+            if found:
+                _count("disk_hits")
+                _store(key, value)
+        if not found:
+            _count("misses")
+            value = func(df, *args, **kwargs)
+            _store(key, value)
+            _write_disk(fingerprint, key, value)
+        return _shared_copy(value)
+
+    return wrapper
+
+
+def invalidate_memo(fingerprints=()):
+    """Descarta las entradas (en memoria y en disco) de huellas de datos distintas de `fingerprints`."""
+    keep = set(fingerprints)
+    with _memo_lock:
+        stale = [key for key in _memo if key[1] not in keep]
+        for key in stale:
+            del _memo[key]
+        _memo_stats["invalidations"] += len(stale)
+    if MEMO_DISK_DIR and os.path.isdir(MEMO_DISK_DIR):
+        keep_dirs = {_hash(fingerprint) for fingerprint in keep}
+        for name in os.listdir(MEMO_DISK_DIR):
+            if name not in keep_dirs:
+                shutil.rmtree(os.path.join(MEMO_DISK_DIR, name), ignore_errors=True)
+
+
+def get_memo_stats():
+    """Devuelve los aciertos, fallos, descartes y entradas de la caché de métricas."""
+    with _memo_lock:
+        return {**_memo_stats, "entries": len(_memo), "max_entries": MEMO_MAX_ENTRIES, "disk": MEMO_DISK_DIR or None}
@@ -1,39 +1,86 @@
+import numpy as np
 import pandas as pd
-
-def calcular_metricas_recurrencia(df, company_name=None, group_name=None):
-    # Unir datos de usuarios, grupos y empresas
-    df_recurrencia = df["users"].merge(df["groups"], how="left").merge(df["companies"], how="left")
-    
-    # Aplicar filtros si se especifican
-    if company_name:
-        df_recurrencia = df_recurrencia[df_recurrencia["company_name"] == company_name]
-    if group_name:
-        df_recurrencia = df_recurrencia[df_recurrencia["group_name"] == group_name]
-    
-    # Filtrar por tipo de progreso específico
-    df["progress"] = df["progress"].query("progress_type == 'progress_checkpoint'")
+from scripts.object_ids import decode_object_ids
+from scripts.memo import memoize
+from scripts.shared_datasets import read_only
+from scripts.user_dimension import select_users, users_of
+from scripts.connection_store import (
+    build_connection_store, select_connections, connection_summary, mean_duration_by_company, connections_by_weekday,
+    connection_horizon
+)
+from scripts.connection_rollups import build_connection_rollups, connection_trend
+from scripts.training_content import build_training_content
+from scripts.nested_items import flatten_items, build_answer_items, answer_items_of
+from scripts.answer_partitions import build_answer_partitions, rows_of_type
+from scripts.translation_index import DEFAULT_LANGUAGE, build_translation_index, translate
+from scripts.answer_validity import MIN_TEXT_LENGTH, is_valid_text, valid_texts, count_valid_answers
+
+def _rango_denso(values):
+    """Rango denso (0, 1, 2...) de cada valor de un array de enteros y los valores distintos ordenados."""
+    if len(values) and values.min() >= 0 and values.max() < 4 * len(values) + 1024:
+        # Enteros pequeños (p. ej. códigos de ObjectId): tabla de presencia, sin ordenar
+        present = np.zeros(values.max() + 1, dtype=bool)
+        present[values] = True
+        return (np.cumsum(present) - 1)[values], np.flatnonzero(present)
+    order = np.argsort(values)
+    ordered = values[order]
+    is_new = np.empty(len(ordered), dtype=bool)
+    is_new[:1] = True
+    np.not_equal(ordered[1:], ordered[:-1], out=is_new[1:])
+    rank = np.empty(len(values), dtype="int64")
+    rank[order] = np.cumsum(is_new) - 1
+    return rank, ordered[is_new]
+
+def _conexiones_tras_checkpoint(df_connections, checkpoint_date):
+    """Última conexión y nº de conexiones posteriores al último checkpoint de cada usuario con conexiones.
+
+    Las conexiones se ordenan por una clave (usuario, rango de la fecha de fin) y se guarda dónde empieza
+    el tramo de cada usuario (offsets tipo CSR). Las conexiones posteriores al checkpoint se cuentan con una
+    búsqueda binaria por usuario, sin unir cada conexión con los datos de su usuario.
+    Devuelve un DataFrame indexado por usuario con endDate y connection_count (NaN si no hay ninguna).
+    """
+    conexiones = df_connections[df_connections["user_id"].notna()]
+    user_rank, user_ids = _rango_denso(conexiones["user_id"].to_numpy(dtype="int64"))
+    end_rank, end_values = _rango_denso(conexiones["endDate"].to_numpy(dtype="datetime64[ns]").view("int64"))
+    step = len(end_values) + 1
+    key = np.sort(user_rank * step + end_rank)
+    offsets = np.searchsorted(key, np.arange(len(user_ids) + 1) * step)
+
+    # Última conexión: el último elemento de cada tramo (NaT es el menor entero y queda al principio)
+    end_date = end_values[key[offsets[1:] - 1] % step].view("datetime64[ns]")
+
+    # Primera conexión de cada tramo posterior al checkpoint del usuario
+    checkpoints = checkpoint_date.reindex(user_ids).to_numpy(dtype="datetime64[ns]")
+    limit = np.searchsorted(end_values, checkpoints.view("int64"), side="right")
+    first_after = np.searchsorted(key, np.arange(len(user_ids)) * step + limit, side="left")
+    connection_count = (offsets[1:] - first_after).astype("float64")
+    connection_count[np.isnat(checkpoints) | (connection_count == 0)] = np.nan
+
+    return pd.DataFrame({"endDate": end_date, "connection_count": connection_count}, index=user_ids)
+
+def _recurrencia_por_usuario(df):
+    """Checkpoints, conexiones posteriores y banderas de recurrencia de cada usuario de la dimensión (sin modificar df)."""
+    usuarios = df["user_dim"]["user_id"]
     
-    # Agregar cantidad de checkpoints y última fecha
-    df_progress_recurrencia = df["progress"].groupby("user_id").agg(
+    # Cantidad de checkpoints y última fecha de cada usuario
+    df_progress = df["progress"][df["progress"]["progress_type"] == "progress_checkpoint"]
+    df_progress_recurrencia = df_progress.groupby("user_id").agg(
         checkpoint_count=("progress_type", "size"),
         checkpoint_date=("completionDate", "max")
-    ).reset_index()
+    )
     
-    df_connections_recurrencia = df["connections"].merge(df_progress_recurrencia, how="left")
+    # Última conexión y conexiones posteriores al último checkpoint
+    df_connections_recurrencia = _conexiones_tras_checkpoint(df["connections"], df_progress_recurrencia["checkpoint_date"])
     
-    # Obtener la última fecha de conexión por usuario
-    df_connections_recurrencia = df_connections_recurrencia.groupby("user_id")["endDate"].max().reset_index().merge(
-        df_connections_recurrencia.query("endDate > checkpoint_date").groupby("user_id").agg(
-            connection_count=("user_id", "size")
-        ).reset_index(), how="left"
+    # Añadir los datos de cada usuario a la dimensión
+    df_recurrencia = df["user_dim"].assign(
+        checkpoint_count=df_progress_recurrencia["checkpoint_count"].reindex(usuarios).to_numpy(),
+        checkpoint_date=df_progress_recurrencia["checkpoint_date"].reindex(usuarios).to_numpy(),
+        endDate=df_connections_recurrencia["endDate"].reindex(usuarios).to_numpy(),
+        connection_count=df_connections_recurrencia["connection_count"].reindex(usuarios).to_numpy(),
     )
     
-    # Fusionar datos
-    df_recurrencia = df_recurrencia.merge(df_progress_recurrencia, how="left").merge(df_connections_recurrencia, how="left")
-    
-    # Calcular diferencia de días entre checkpoint y última conexión
-    df_recurrencia["checkpoint_date"] = pd.to_datetime(df_recurrencia["checkpoint_date"])
-    df_recurrencia["endDate"] = pd.to_datetime(df_recurrencia["endDate"])
+    # Calcular diferencia de días entre checkpoint y última conexión (las fechas ya son datetime64 desde la carga)
     df_recurrencia["days_since_completion"] = (df_recurrencia["endDate"] - df_recurrencia["checkpoint_date"]).dt.days
     
     # Generar banderas (flags)
@@ -42,9 +89,47 @@ def calcular_metricas_recurrencia(df, company_name=None, group_name=None):
     df_recurrencia.eval("is_finished = checkpoint_count > 1", inplace=True)
     df_recurrencia.eval("is_recurrent_2025 = is_active_2025 and is_finished and (days_since_completion > 0)", inplace=True)
     df_recurrencia.eval("is_recurrent = is_finished and (days_since_completion > 0)", inplace=True)
+    return df_recurrencia
+
+def construir_cubo_recurrencia(df):
+    """Cubo de recurrencia por (empresa, grupo, terminó el programa, recurrencia 2025).
+
+    Cada celda guarda el nº de usuarios y las sumas y recuentos de connection_count y days_since_completion,
+    de modo que cualquier filtro de empresa y grupo se responde sumando celdas. Se construye una vez por
+    versión de datos al cargar la vista principal.
+    """
+    columns = [
+        "company_name", "group_name", "is_finished", "is_recurrent_2025", "count",
+        "connection_count_sum", "connection_count_n", "days_since_completion_sum", "days_since_completion_n"
+    ]
+    # Sin checkpoints o sin conexiones cada usuario cuenta igual, como no terminado y no recurrente
+    if df["user_dim"].empty:
+        return pd.DataFrame(columns=columns)
+    df_recurrencia = _recurrencia_por_usuario(df)
+    # Nombres tal cual, como objetos (las categorías generarían celdas vacías en el groupby)
+    df_recurrencia["company_name"] = df_recurrencia["company_name"].astype(object)
+    df_recurrencia["group_name"] = df_recurrencia["group_name"].astype(object)
+    cubo = df_recurrencia.groupby(["company_name", "group_name", "is_finished", "is_recurrent_2025"], dropna=False).agg(
+        count=("is_finished", "size"),
+        connection_count_sum=("connection_count", "sum"),
+        connection_count_n=("connection_count", "count"),
+        days_since_completion_sum=("days_since_completion", "sum"),
+        days_since_completion_n=("days_since_completion", "count"),
+    ).reset_index()
+    return cubo[columns]
+
+@memoize
+@read_only
+def calcular_metricas_recurrencia(df, company_name=None, group_name=None):
+    # Celdas del cubo de recurrencia de la empresa y grupo seleccionados
+    cubo = df["recurrence_cube"] if "recurrence_cube" in df else construir_cubo_recurrencia(df)
+    if company_name:
+        cubo = cubo[cubo["company_name"] == company_name]
+    if group_name:
+        cubo = cubo[cubo["group_name"] == group_name]
     
     # Calcular métricas
-    metrics = df_recurrencia.groupby(["is_finished", "is_recurrent_2025"]).size().reset_index().rename(columns={0: "count"})
+    metrics = cubo.groupby(["is_finished", "is_recurrent_2025"])["count"].sum().astype("int64").reset_index()
     metrics.eval("percentage = (count / count.sum()) * 100", inplace=True)
     
     metrics.replace({False: "NO", True: "SÍ"}, inplace=True)
@@ -58,26 +143,85 @@ def calcular_metricas_recurrencia(df, company_name=None, group_name=None):
         }, inplace=True
     )
     
-    # Promedio de conexiones y días desde la finalización
-    promedios = df_recurrencia.query("is_recurrent_2025")[["connection_count", "days_since_completion"]].mean().to_frame().round(0)
+    # Promedio de conexiones y días desde la finalización (suma / nº de valores de las celdas con recurrencia)
+    recurrentes = cubo[cubo["is_recurrent_2025"] == True]
+    promedios = pd.Series({
+        column: recurrentes[f"{column}_sum"].sum() / recurrentes[f"{column}_n"].sum() if recurrentes[f"{column}_n"].sum() else np.nan
+        for column in ["connection_count", "days_since_completion"]
+    }, dtype="float64").to_frame().round(0)
     
     return metrics, promedios
 
-def calcular_metricas_connections(df, company_name=None, group_name=None):
-    df_connections = df["connections"].merge(df["users"], how="left", on="user_id").merge(
-        df["groups"], how="left"
-    ).merge(
-        df["companies"], how="left"
-    )
-  # Verificar el resultado del merge
-  # print("Después de merge de conexiones y usuarios:")
-  # print(df_connections.head())
-
-    # Aplicar filtros si se especifican
-    if company_name:
-        df_connections = df_connections[df_connections["company_name"] == company_name]
-    if group_name:
-        df_connections = df_connections[df_connections["group_name"] == group_name]
+def _semana(ns):
+    """Semana (nº de semanas desde el lunes 1969-12-29) de fechas en nanosegundos."""
+    return (ns // (86400 * 10**9) + 3) // 7
+
+@memoize
+@read_only
+def calcular_retencion_cohortes(df, company_name=None, group_name=None, semanas=12):
+    """Retención semanal por cohortes de check-out.
+
+    Cada usuario que ha terminado el programa (más de un checkpoint) entra en la cohorte de la semana de su
+    último checkpoint. Para cada cohorte se calcula el % de usuarios que se conectan en la semana +1, +2, ...
+    +`semanas` tras el check-out. Las conexiones de cada usuario se toman de su tramo en el almacén de
+    conexiones y se marcan en una matriz usuario × semana, sin bucles por usuario. Las semanas posteriores
+    a la última conexión registrada en todos los datos quedan vacías (NaN).
+    Devuelve un DataFrame indexado por el lunes de la cohorte con el nº de usuarios y una columna por semana.
+    """
+    columnas = ["Usuarios"] + [f"Semana +{k}" for k in range(1, semanas + 1)]
+    store = df["connection_store"] if "connection_store" in df else build_connection_store(df)
+
+    # Usuarios seleccionados y fecha de su último checkpoint (sólo los que han terminado el programa)
+    posiciones = select_users(df, company_name, group_name)
+    if posiciones is None:
+        posiciones = np.arange(len(df["user_dim"]))
+    df_progress = df["progress"][df["progress"]["progress_type"] == "progress_checkpoint"]
+    checkpoints = df_progress.groupby("user_id")["completionDate"].agg(["size", "max"])
+    checkpoints = checkpoints[(checkpoints["size"] > 1) & checkpoints["max"].notna()]
+    checkout = checkpoints["max"].reindex(df["user_dim"]["user_id"].to_numpy()[posiciones]).to_numpy(dtype="datetime64[ns]")
+    terminado = ~np.isnat(checkout)
+    posiciones, cohorte = posiciones[terminado], _semana(checkout[terminado].view("int64"))
+    if not len(posiciones):
+        return pd.DataFrame(columns=columnas, index=pd.DatetimeIndex([], name="Cohorte"))
+
+    # Tramo de conexiones de cada usuario en el almacén (ordenadas por usuario y fecha)
+    rangos = store["user_rank"][posiciones]
+    inicio, fin = store["user_offsets"][rangos], store["user_offsets"][rangos + 1]
+    n_conexiones = fin - inicio
+    usuario = np.repeat(np.arange(len(posiciones)), n_conexiones)
+    conexion = np.arange(n_conexiones.sum()) - np.repeat(np.cumsum(n_conexiones) - n_conexiones - inicio, n_conexiones)
+    fechas = store["start"][conexion]
+    fechada = fechas != np.iinfo("int64").min
+    usuario, desfase = usuario[fechada], _semana(fechas[fechada]) - cohorte[usuario[fechada]]
+
+    # Matriz usuario × semana tras el check-out: True si el usuario se conectó esa semana
+    en_rango = (desfase >= 1) & (desfase <= semanas)
+    activo = np.zeros((len(posiciones), semanas + 1), dtype=bool)
+    activo[usuario[en_rango], desfase[en_rango]] = True
+
+    # Sumar la matriz por cohorte (usuarios ordenados por cohorte)
+    orden = np.argsort(cohorte, kind="stable")
+    cohortes, primero, usuarios = np.unique(cohorte[orden], return_index=True, return_counts=True)
+    retenidos = np.add.reduceat(activo[orden].astype(np.int64), primero, axis=0)[:, 1:]
+    retencion = retenidos / usuarios[:, None] * 100
+
+    # Semanas aún no observadas: posteriores a la última conexión registrada en todos los datos (también en la
+    # partición de una empresa, cuyas conexiones pueden terminar antes)
+    ultima = connection_horizon(store)
+    if ultima is not None:
+        retencion[cohortes[:, None] + np.arange(1, semanas + 1) > _semana(ultima)] = np.nan
+
+    lunes = pd.to_datetime((cohortes * 7 - 3).astype("datetime64[D]"))
+    resultado = pd.DataFrame(retencion.round(1), index=pd.DatetimeIndex(lunes, name="Cohorte"), columns=columnas[1:])
+    resultado.insert(0, "Usuarios", usuarios)
+    return resultado
+
+@memoize
+@read_only
+def calcular_metricas_connections(df, company_name=None, group_name=None, fecha_inicio=None, fecha_fin=None):
+    # Conexiones de la empresa, grupo y rango de fechas seleccionados (recortes del almacén de conexiones)
+    store = df["connection_store"] if "connection_store" in df else build_connection_store(df)
+    positions = select_connections(store, company_name, group_name, fecha_inicio, fecha_fin)
 
     # Unir ejercicios con respuestas
    # df["exercises"] = df["exercises"].merge(df["answers"], how="left")
@@ -97,28 +241,46 @@ def calcular_metricas_connections(df, company_name=None, group_name=None):
     # Unir conexiones con ejercicios
   #  df_connections = df_connections.merge(df["exercises"], how="left")
     
-    # Seleccionar columnas específicas y guardarlas en un nuevo DataFrame
-    selected_columns = ["user_id", "connection_id", "connectionDuration", "group_name", "company_name", "startDate"]
-    df_selected = df_connections[selected_columns]
-
-    return df_selected
-
-def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, group_name=None):
-    df_companies = df["companies"][["_id", "name"]].rename(columns={"_id": "company", "name": "company_name"})
-    df_groups = df["groups"][["_id", "name", "company"]].rename(columns={"_id": "group", "name": "group_name"})
-    df_users = df["users"][[
-        '_id', 'company', 'group'
-    ]].rename(columns={"_id": "user"}).merge(df_groups).merge(df_companies)
-
-    df_trainings = pd.json_normalize(df["trainings"][[
-        'namedId',
-        'steps', 'elements', 'ideas', 'actions', 'questionnaire', 'survey',
-        'translations',
-    ]].explode('steps').explode('elements').explode('ideas').explode("actions").to_dict(orient="records"))
-    df_trainings = pd.json_normalize(
-        df_trainings.explode("questionnaire.affirmations").to_dict(orient="records")
-    )
-    df_translations = pd.json_normalize(df["translations"].to_dict(orient="records"))
+    # Número de conexiones, duración media, duración media por empresa y conexiones por día de la semana
+    total, duracion_media = connection_summary(store, positions)
+    por_empresa = mean_duration_by_company(store, positions).sort_values(by="connectionDuration", ascending=False)
+    por_dia = connections_by_weekday(store, positions)
+
+    return total, duracion_media, por_empresa, por_dia
+
+@memoize
+@read_only
+def calcular_tendencia_conexiones(df, company_name=None, group_name=None, frecuencia="W", fecha_inicio=None, fecha_fin=None):
+    # Serie de conexiones por día ("D"), semana ("W") o mes ("M") a partir de los agregados diarios
+    if "connection_rollups" in df:
+        rollups = df["connection_rollups"]
+    else:
+        rollups = build_connection_rollups(df["connection_store"] if "connection_store" in df else build_connection_store(df))
+    tendencia = connection_trend(rollups, company_name, group_name, frecuencia, fecha_inicio, fecha_fin)
+    tendencia["duration_mean"] = tendencia["duration_mean"].round(0)
+    return tendencia
+
+@memoize
+@read_only
+def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, group_name=None, min_text_length=MIN_TEXT_LENGTH,
+                                     language=DEFAULT_LANGUAGE):
+    # Las respuestas de texto de menos de min_text_length caracteres no cuentan como válidas (ver scripts.answer_validity).
+    # Las acciones, cuadernos y afirmaciones se muestran en `language`; las preguntas de la encuesta se identifican
+    # siempre por su título en español
+    df_users = df["user_dim"][["user", "company", "group", "group_name", "company_name"]]
+
+    # Acciones, cuadernos y afirmaciones de los entrenamientos en tablas planas (ver scripts.training_content)
+    training_content = df["training_content"] if "training_content" in df else build_training_content(df["trainings"])
+    # Ítems de las respuestas aplanados una vez por versión de datos (ver scripts.nested_items)
+    answer_items = df["answer_items"] if "answer_items" in df else build_answer_items(df["answers"])
+    # Respuestas e ítems partidos por tipo una vez por versión de datos: cada sub-métrica lee sólo su tipo
+    # (ver scripts.answer_partitions)
+    if "answer_partitions" in df:
+        answer_partitions = df["answer_partitions"]
+    else:
+        answer_partitions = build_answer_partitions(df["answers"], answer_items)
+    # Traducciones indexadas por ObjectId una vez por versión de datos (ver scripts.translation_index)
+    translation_index = df["translation_index"] if "translation_index" in df else build_translation_index(df["translations"])
     training_meta = pd.DataFrame({
         'valor-ser-curioso': [1, 1, "El valor de ser curioso"],
         'mis-monstruos': [1, 2, "Mis monstruos"],
@@ -148,15 +310,14 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     df_progress["Completado (%)"] = (100 * df_progress["Completado (#)"] / df_progress["Disponible (#)"]).round().astype(int)
     df_progress_summary = training_meta.merge(df_progress).drop(columns=["trainingNamedId"])
 
-    survey_questions_translations_title_oid = [str(x["translations"]["title"]) for x in df["surveys"]["questions"][0]]
-    survey_questions_oid_translations_title_oid = {str(x["_id"]): str(x["translations"]["title"]) for x in df["surveys"]["questions"][0]}
-    df_translations_survey_questions = df["translations"].astype({"_id": str}).query("_id in @survey_questions_translations_title_oid").copy()
-    df_translations_survey_questions["content"] = df_translations_survey_questions["content"].apply(lambda x: x["es"])
-    translation_oid_title_survey_questions = df_translations_survey_questions.set_index("_id")["content"].to_dict()
-    oid_title_survey_questions = {question: translation_oid_title_survey_questions[trans] for question, trans in survey_questions_oid_translations_title_oid.items()}
-    survey_answers = pd.json_normalize(
-        df["answers"].query("type == 'answer_survey_training'")[["user", "trainingNamedId", "items"]].explode("items").to_dict(orient="records")
-    )
+    survey_questions = df["surveys"]["questions"][0]
+    oid_title_survey_questions = dict(zip(
+        [str(x["_id"]) for x in survey_questions],
+        translate(translation_index, [x["translations"]["title"] for x in survey_questions], "es")
+    ))
+    survey_answers = answer_items_of(answer_items, answer_partitions["answer_items"], "answer_survey_training", [
+        "user", "trainingNamedId", "items.question", "items.type", "items.value", "items.input"
+    ])
     survey_answers.columns = survey_answers.columns.str.replace("items.", "")
     survey_answers["question"] = survey_answers["question"].astype(str).map(oid_title_survey_questions)
     survey_answers_summary = survey_answers.drop(columns=["user"]).query("type != 'input'").fillna("NS/NC").groupby(["trainingNamedId", "question"]).value_counts().to_frame().reset_index()[["trainingNamedId", "question", "value", "count"]]
@@ -187,8 +348,10 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
 ])  
     question = "¿Cambiarías alguna cosa del entrenamiento?"
     survey_answers_suggestions = survey_answers.query("question == @question")[["user", "trainingNamedId", "input"]]
-    survey_answers_suggestions["input"] = survey_answers_suggestions["input"].astype(str).apply(lambda x: None if len(x) <= 7 else x)
-    valid_survey_answers_suggestions_summary = survey_answers_suggestions.groupby("trainingNamedId")["input"].apply(lambda x: x.notna().sum()).to_frame().reset_index()
+    survey_answers_suggestions["input"] = valid_texts(survey_answers_suggestions["input"], min_text_length)
+    valid_survey_answers_suggestions_summary = count_valid_answers(
+        survey_answers_suggestions, survey_answers_suggestions["input"].notna()
+    )[1]["valid"].rename("input").reset_index()
     valid_survey_answers_suggestions_summary = training_meta.merge(valid_survey_answers_suggestions_summary).merge(df_progress)
     valid_survey_answers_suggestions_summary["input"] = valid_survey_answers_suggestions_summary["input"].fillna(0).astype(int)
     valid_survey_answers_suggestions_summary["Sugerencias (%)"] = (100 * valid_survey_answers_suggestions_summary["input"] / valid_survey_answers_suggestions_summary["Completado (#)"]).round().astype(int)
@@ -204,28 +367,20 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     ]).rename(columns={
         "user": "Usuario", "group_name": "Grupo", "company_name": "Empresa"
     })
+    valid_survey_answers_suggestions["Usuario"] = decode_object_ids(valid_survey_answers_suggestions["Usuario"])
     type = "answer_training_action"
-    training_actions = df["answers"].query("type == @type")[[
+    training_actions = rows_of_type(df["answers"], answer_partitions["answers"], type, [
         "user", 'trainingNamedId', 'action', 'input',
-    ]]
-    training_actions = training_actions.merge(
-        df_trainings[[
-        "actions._id", "actions.translations.name",
-    ]].drop_duplicates().merge(
-        df_translations[[
-            "_id", "content.es"
-        ]], left_on="actions.translations.name", right_on="_id", how="left"
-    ), left_on="action", right_on="actions._id", how="left"
-    )
-    training_actions = training_actions.drop(columns=["action", "_id", "actions._id", "actions.translations.name"])
-    training_actions.rename(columns={"content.es": "action"}, inplace=True)
-    training_actions["input"] = training_actions["input"].astype(str)
-    training_actions["input"] = training_actions["input"].apply(lambda x: None if len(x) <= 7 else x)
-    valid_training_actions_summary = training_actions.groupby(["user", "trainingNamedId"])["input"].apply(
-        lambda x: x.notna().mean()
-    ).groupby(
-        "trainingNamedId"
-    ).sum().to_frame().reset_index()
+    ])
+    action_names = training_content["actions"][["_id", "name"]].drop_duplicates().rename(columns={"_id": "action_id"})
+    action_names["name"] = translate(translation_index, action_names["name"], language)
+    training_actions = training_actions.merge(action_names, left_on="action", right_on="action_id", how="left")
+    training_actions = training_actions.drop(columns=["action", "action_id"])
+    training_actions.rename(columns={"name": "action"}, inplace=True)
+    training_actions["input"] = valid_texts(training_actions["input"], min_text_length)
+    valid_training_actions_summary = count_valid_answers(
+        training_actions, training_actions["input"].notna()
+    )[1]["share"].rename("input").reset_index()
     valid_training_actions_summary = training_meta.merge(valid_training_actions_summary).merge(df_progress)
     valid_training_actions_summary["input"] = valid_training_actions_summary["input"].fillna(0).astype(int)
     valid_training_actions_summary["¿Y ahora qué? (%)"] = (100 * valid_training_actions_summary["input"] / valid_training_actions_summary["Completado (#)"]).round().astype(int)
@@ -242,6 +397,7 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     ]).rename(columns={
         "user": "Usuario", "group_name": "Grupo", "company_name": "Empresa"
     })
+    valid_training_actions["Usuario"] = decode_object_ids(valid_training_actions["Usuario"])
     valid_training_actions = pd.pivot_table(
         valid_training_actions.sort_values(["Orden Entrenamiento", "Usuario", "Empresa", "Grupo"]),
         index=["Usuario", "Empresa", "Grupo"],
@@ -252,47 +408,27 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     )
     # valid_training_actions = valid_training_actions.drop(columns=valid_training_actions.columns[[7, 10]])
     type = "answer_training_notepad"
-    training_notepad = df["answers"].query("type == @type")[[
+    training_notepad = rows_of_type(df["answers"], answer_partitions["answers"], type, [
         "user", 'trainingNamedId', 'notepad', 'firstNoteInput', 'secondNoteInput',
-    ]]
-    training_notepad = training_notepad.merge(
-        df_trainings[[
-        "elements._id", "elements.translations.title", "elements.firstNote.translations.name", 'elements.secondNote.translations.name',
-    ]].drop_duplicates().merge(
-        df_translations[[
-            "_id", "content.es"
-        ]], left_on="elements.translations.title", right_on="_id", how="left"
-    ), left_on="notepad", right_on="elements._id", how="left"
-    ).drop(columns=["_id"]).rename(columns={
-        "content.es": "title"
-    }).merge(
-        df_translations[[
-            "_id", "content.es"
-        ]], left_on="elements.firstNote.translations.name", right_on="_id", how="left"
-    ).drop(columns=["_id"]).rename(columns={
-        "content.es": "firstNote"
-    }).merge(
-        df_translations[[
-            "_id", "content.es"
-        ]], left_on="elements.secondNote.translations.name", right_on="_id", how="left"
-    ).drop(columns=["_id"]).rename(columns={
-        "content.es": "secondNote"
-    }).drop(columns=[
-        "notepad", "elements._id", "elements.translations.title", "elements.firstNote.translations.name", 'elements.secondNote.translations.name'
     ])
+    notepad_names = training_content["elements"][["_id", "title", "firstNote", "secondNote"]].drop_duplicates().rename(columns={
+        "_id": "element_id"
+    })
+    for column in ["title", "firstNote", "secondNote"]:
+        notepad_names[column] = translate(translation_index, notepad_names[column], language)
+    training_notepad = training_notepad.merge(
+        notepad_names, left_on="notepad", right_on="element_id", how="left"
+    ).drop(columns=["notepad", "element_id"])
 
     training_notepad_one_note = training_notepad.query(
         "firstNote != firstNote and secondNote != secondNote"
     ).drop(columns=["firstNote", "secondNote", "secondNoteInput"])
     training_notepad_one_note
 
-    valid_training_notepad_one_note_summary = training_notepad_one_note.copy()
-    valid_training_notepad_one_note_summary["firstNoteInput"] = training_notepad_one_note["firstNoteInput"].apply(lambda x: None if len(x) <= 7 else x)
-    valid_training_notepad_one_note_summary = valid_training_notepad_one_note_summary.groupby(["user", "trainingNamedId"])["firstNoteInput"].apply(
-        lambda x: x.notna().mean()
-    ).groupby(
-        "trainingNamedId"
-    ).sum().to_frame().reset_index()
+    valid_training_notepad_one_note_summary = count_valid_answers(
+        training_notepad_one_note,
+        is_valid_text(training_notepad_one_note["firstNoteInput"], min_text_length, as_text=False)
+    )[1]["share"].rename("firstNoteInput").reset_index()
     valid_training_notepad_one_note_summary = training_meta.merge(valid_training_notepad_one_note_summary).merge(df_progress)
     valid_training_notepad_one_note_summary["firstNoteInput"] = valid_training_notepad_one_note_summary["firstNoteInput"].fillna(0).astype(int)
     valid_training_notepad_one_note_summary["firstNoteInput"] = (100 * (valid_training_notepad_one_note_summary["firstNoteInput"] / valid_training_notepad_one_note_summary["Completado (#)"])).round().astype(int)
@@ -309,6 +445,7 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     ]).rename(columns={
         "user": "Usuario", "group_name": "Grupo", "company_name": "Empresa"
     })
+    valid_training_notepad_one_note["Usuario"] = decode_object_ids(valid_training_notepad_one_note["Usuario"])
     valid_training_notepad_one_note = pd.pivot_table(
         valid_training_notepad_one_note.sort_values(["Orden Entrenamiento", "Usuario", "Empresa", "Grupo"]),
         index=["Usuario", "Empresa", "Grupo"],
@@ -321,13 +458,11 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     "firstNote == firstNote and secondNote == secondNote"
 )
 
-    valid_training_notepad_two_note_summary = training_notepad_two_note.copy()
-    valid_training_notepad_two_note_summary["firstNoteInput"] = training_notepad_two_note["firstNoteInput"].apply(lambda x: None if x and len(x) <= 7 else x)
-    valid_training_notepad_two_note_summary = valid_training_notepad_two_note_summary.groupby(["user", "trainingNamedId"])["firstNoteInput"].apply(
-        lambda x: x.notna().mean()
-    ).groupby(
-        "trainingNamedId"
-    ).sum().to_frame().reset_index()
+    # En los cuadernos de dos notas la primera nota vacía cuenta como respuesta
+    valid_training_notepad_two_note_summary = count_valid_answers(
+        training_notepad_two_note,
+        is_valid_text(training_notepad_two_note["firstNoteInput"], min_text_length, as_text=False, keep_blank=True)
+    )[1]["share"].rename("firstNoteInput").reset_index()
     valid_training_notepad_two_note_summary = training_meta.merge(valid_training_notepad_two_note_summary).merge(df_progress)
     valid_training_notepad_two_note_summary["firstNoteInput"] = valid_training_notepad_two_note_summary["firstNoteInput"].fillna(0).astype(int)
     valid_training_notepad_two_note_summary["firstNoteInput"] = (100 * (valid_training_notepad_two_note_summary["firstNoteInput"] / valid_training_notepad_two_note_summary["Completado (#)"])).round().astype(int)
@@ -351,6 +486,7 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     ]).rename(columns={
         "user": "Usuario", "group_name": "Grupo", "company_name": "Empresa"
     })
+    valid_training_notepad_two_note["Usuario"] = decode_object_ids(valid_training_notepad_two_note["Usuario"])
     valid_training_notepad_two_note = pd.pivot_table(
         valid_training_notepad_two_note.drop(columns=[
             "Cuaderno 2", "Respuesta 2"
@@ -378,42 +514,37 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
         axis=1
     )
     type = "answer_training_questionnaire"
-    training_affirmations = pd.json_normalize(df["answers"].query("type == @type")[[
-        "user", 'trainingNamedId', 'endingAffirmationInput', 'items',
-    ]].explode("items").to_dict(orient="records"))
+    training_affirmations = answer_items_of(answer_items, answer_partitions["answer_items"], type, [
+        "user", 'trainingNamedId', 'endingAffirmationInput', 'items.affirmation', 'items.isChecked',
+    ])
+    affirmation_names = training_content["affirmations"][["_id", "name"]].drop_duplicates().rename(columns={
+        "_id": "affirmation_id", "name": "affirmation"
+    })
+    affirmation_names["affirmation"] = translate(translation_index, affirmation_names["affirmation"], language)
     training_affirmations = training_affirmations.merge(
-            df_trainings[[
-            "questionnaire.affirmations._id", "questionnaire.affirmations.translations.name"
-        ]].drop_duplicates().merge(
-            df_translations[[
-                "_id", "content.es"
-            ]], left_on="questionnaire.affirmations.translations.name", right_on="_id", how="left"
-        ), left_on="items.affirmation", right_on="questionnaire.affirmations._id", how="left"
+        affirmation_names, left_on="items.affirmation", right_on="affirmation_id", how="left"
     )
 
     training_affirmations_summary = training_affirmations.query(
         "`items.isChecked` == True"
     ).copy()
-    training_affirmations_summary = training_affirmations_summary.groupby(["content.es", "trainingNamedId"])["items.isChecked"].sum().to_frame().reset_index()
+    training_affirmations_summary = training_affirmations_summary.groupby(["affirmation", "trainingNamedId"])["items.isChecked"].sum().to_frame().reset_index()
     training_affirmations_summary = training_meta.merge(training_affirmations_summary).merge(df_progress)
     training_affirmations_summary["items.isChecked"] = (100 * (training_affirmations_summary["items.isChecked"] / training_affirmations_summary["Completado (#)"])).round().astype(int)
     training_affirmations_summary = training_affirmations_summary.drop(columns=[
         "trainingNamedId", "Completado (#)", "Disponible (#)", "Completado (%)"
     ]).rename(columns={
-        "content.es": "¡Sigue tus avances!", "items.isChecked": "Check (%)"
+        "affirmation": "¡Sigue tus avances!", "items.isChecked": "Check (%)"
     })
     training_affirmations_summary_check = training_affirmations_summary.groupby([
     "Módulo", "Orden Entrenamiento", "Entrenamiento"
     ])["Check (%)"].mean().round().astype(int).reset_index()
 
     valid_training_affirmations = training_affirmations[["user", "trainingNamedId", "endingAffirmationInput"]].drop_duplicates()
-    valid_training_affirmations_summary = valid_training_affirmations.copy()
-    valid_training_affirmations_summary["endingAffirmationInput"] = valid_training_affirmations_summary["endingAffirmationInput"].astype(str).apply(lambda x: None if len(x) <= 7 else x)
-    valid_training_affirmations_summary = valid_training_affirmations_summary.groupby(["user", "trainingNamedId"])["endingAffirmationInput"].apply(
-        lambda x: x.notna().mean()
-    ).groupby(
-        "trainingNamedId"
-    ).sum().to_frame().reset_index()
+    valid_training_affirmations_summary = count_valid_answers(
+        valid_training_affirmations,
+        is_valid_text(valid_training_affirmations["endingAffirmationInput"], min_text_length)
+    )[1]["share"].rename("endingAffirmationInput").reset_index()
     valid_training_affirmations_summary = training_meta.merge(valid_training_affirmations_summary).merge(df_progress)
     valid_training_affirmations_summary["endingAffirmationInput"] = valid_training_affirmations_summary["endingAffirmationInput"].fillna(0).astype(int)
     valid_training_affirmations_summary["endingAffirmationInput"] = (100 * (valid_training_affirmations_summary["endingAffirmationInput"] / valid_training_affirmations_summary["Completado (#)"])).round().astype(int)
@@ -434,6 +565,7 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
     ]).rename(columns={
         "user": "Usuario", "group_name": "Grupo", "company_name": "Empresa"
     })
+    valid_training_affirmations["Usuario"] = decode_object_ids(valid_training_affirmations["Usuario"])
     valid_training_affirmations = pd.pivot_table(
         valid_training_affirmations.sort_values(["Orden Entrenamiento", "Usuario", "Empresa", "Grupo"]),
         index=["Usuario", "Empresa", "Grupo"],
@@ -466,56 +598,43 @@ def calcular_metricas_entrenamientos(df, module_name=None, company_name=None, gr
         df_trainings_summary = df_trainings_summary[df_progress_summary["Módulo"] == module_name]
     return df_trainings_summary, valid_training_actions, valid_training_notepad_one_note, valid_training_notepad_two_note, valid_training_affirmations, valid_survey_answers_suggestions, training_affirmations_summary
 
+@memoize
+@read_only
 def calcular_metricas_coach(df, company_name = None, group_name = None):
     
-    df_companies = df["companies"][["_id", "name"]].rename(columns={"_id": "company", "name": "company_name"})
-    df_groups = df["groups"][["_id", "name", "company"]].rename(columns={"_id": "group", "name": "group_name"})
-    df_users = df["users"][[
-        '_id', "email", "firstName", "lastName", 'company', 'group'
-    ]].rename(columns={"_id": "user"}).merge(df_groups).merge(df_companies)
-
-    df_users["name"] = df_users["firstName"] + " " + df_users["lastName"]
-    df_users.drop(columns=["firstName", "lastName"], inplace=True)
+    # Normalizar valores de entrada
+    company_name = company_name.strip() if company_name else None
+    group_name = group_name.strip() if group_name else None
+
+    # Usuarios de la empresa y grupo seleccionados, a partir de la dimensión de usuarios ("todas"/"todos" no filtran)
+    df_users = users_of(
+        df, company_name if company_name != "todas" else None, group_name if group_name != "todos" else None, strip=True
+    )[["user", "email", "firstName", "lastName", "company", "group", "group_name", "company_name"]]
+    df_users = df_users.assign(name=df_users["firstName"] + " " + df_users["lastName"]).drop(columns=["firstName", "lastName"])
     df_coach = df["threads"].merge(df_users)
     ignore_companies = ["Demos Clientes"]
     df_coach = df_coach.query(
         "company_name not in @ignore_companies"
     ).reset_index(drop=True)
 
-    # Normalizar DataFrame y valores de entrada
+    # Normalizar DataFrame
     df_coach["company_name"] = df_coach["company_name"].str.strip()
     df_coach["group_name"] = df_coach["group_name"].str.strip()
 
-    company_name = company_name.strip() if company_name else None
-    group_name = group_name.strip() if group_name else None
-
-    # Aplicar los filtros
-    if company_name and company_name != "todas":
-        df_coach = df_coach[df_coach["company_name"] == company_name]
-
-    if group_name and group_name != "todos":
-        df_coach = df_coach[df_coach["group_name"] == group_name]
-
     # Tabla de usuarios que recibieron mensajes del coach: Empresa, Grupo, Usuario (nº de usuarios)
     recibieron_msg_summary = df_coach.query("assistantMessagesAmount >= 0").groupby(["company_name", "group_name"]).size().to_frame("user_count").reset_index()
     recibieron_msg_summary = recibieron_msg_summary.rename(columns={
         "company_name": "Compañía", "group_name": "Grupo", "user_count": "# Usuarios"
     })
-    recibieron_msg_summary.to_excel("Alcanzados por el coach.xlsx")
-  
     respondieron_msg_summary = df_coach.query("userMessagesAmount >= 0").groupby(["company_name", "group_name"]).size().to_frame("user_count").reset_index()
     respondieron_msg_summary = respondieron_msg_summary.rename(columns={
         "company_name": "Compañía", "group_name": "Grupo", "user_count": "# Usuarios"
     })
-    respondieron_msg_summary.to_excel("Respondieron al coach.xlsx")
-   
     # Tabla de usuarios que respondieron mensajes del coach
-    respondieron_msg = pd.json_normalize(
-    df_coach.query("userMessagesAmount > 0").explode("messages").to_dict(orient="records")
-)
-    respondieron_msg = respondieron_msg[[
-        "company_name", "group_name", "name", "email", "messages.date", "messages.role", "messages.content"
-    ]]
+    respondieron_msg = flatten_items(
+        df_coach.query("userMessagesAmount > 0"), "messages", ["date", "role", "content"],
+        keep=["company_name", "group_name", "name", "email"]
+    )
     respondieron_msg["messages.role"] = respondieron_msg["messages.role"].replace({
         "user": "Usuario", "assistant": "Coach"
     })
@@ -528,54 +647,56 @@ def calcular_metricas_coach(df, company_name = None, group_name = None):
     return respondieron_msg,  recibieron_msg_summary,  respondieron_msg_summary
 
 
+@memoize
+@read_only
 def contar_usuarios_unicos(df, fecha_inicio='2025-02-28',  company_name = None, group_name = None):
-    df_companies = df["companies"][["_id", "name"]].rename(columns={"_id": "company", "name": "company_name"})
-    df_groups = df["groups"][["_id", "name", "company"]].rename(columns={"_id": "group", "name": "group_name"})
-    df_users = df["users"][[
-        '_id', "email", "firstName", "lastName", 'company', 'group', 'hasUnlockedCoach'
-    ]].rename(columns={"_id": "user"}).merge(df_groups).merge(df_companies)
-    df_users["name"] = df_users["firstName"] + " " + df_users["lastName"]
-    df_users.drop(columns=["firstName", "lastName"], inplace=True)
-    df_filtrado = df_users.merge(df["connections"], on="user", how="left")
-        # Normalizar DataFrame y valores de entrada
-    df_filtrado["company_name"] = df_filtrado["company_name"].str.strip()
-    df_filtrado["group_name"] = df_filtrado["group_name"].str.strip()
-
+    # Normalizar valores de entrada
     company_name = company_name.strip() if company_name else None
     group_name = group_name.strip() if group_name else None
 
-    # Aplicar los filtros
-    if company_name and company_name != "todas":
-        df_filtrado= df_filtrado[df_filtrado["company_name"] == company_name]
+    # Usuarios de la empresa y grupo seleccionados que desbloquearon el coach ("todas"/"todos" no filtran)
+    df_users = users_of(
+        df, company_name if company_name != "todas" else None, group_name if group_name != "todos" else None, strip=True
+    )
+    usuarios = df_users.loc[df_users["hasUnlockedCoach"] == True, "user"]
 
-    if group_name and group_name != "todos":
-        df_filtrado= df_filtrado[df_filtrado["group_name"] == group_name]
-    # Filtrar por fecha y usuarios que desbloquearon el coach
-    df_filtrado = df_filtrado.query("hasUnlockedCoach == True and startDate > @fecha_inicio")
+    # Filtrar sus conexiones por fecha
+    fecha_inicio = pd.Timestamp(fecha_inicio)
+    df_filtrado = df["connections"][df["connections"]["user"].isin(usuarios) & (df["connections"]["startDate"] > fecha_inicio)]
 
     # Contar usuarios únicos
     return df_filtrado["user"].nunique()
 
 
 def obtener_resumen_progreso(df, company_name=None, group_name=None, include_zero_progress=False):
+    """Cumplimentación por usuario y módulo y ejercicios ordenados por nº de veces completados.
+
+    Los ejercicios de episodios que aún no han empezado no cuentan. La hora sólo influye en qué episodios han
+    empezado, así que el resultado se memoiza por la fecha de inicio del último episodio ya empezado: cambia en
+    cuanto empieza otro, no cada vez que se llama.
+    """
     from datetime import datetime
-    import pandas as pd
 
-    # Unir usuarios con grupos y empresas
-    users = df["users"].merge(df["groups"], on="group_id", how="left") \
-                       .merge(df["companies"], on="company_id", how="left")
+    inicio_episodios = None
+    if "startDate" in df["episodes"].columns:
+        fechas = pd.to_datetime(df["episodes"]["startDate"], errors="coerce")
+        empezados = fechas[fechas <= datetime.now()]
+        inicio_episodios = empezados.max() if len(empezados) else None
+    return _resumen_progreso(df, company_name, group_name, include_zero_progress, inicio_episodios)
 
-    # --- FILTROS POR EMPRESA Y GRUPO ---
-    if company_name:
-        users = users[users["company_name"] == company_name]
-    if group_name:
-        users = users[users["group_name"] == group_name]
 
-    # Excluir ejercicios con episodios que empiezan en el futuro
+@memoize
+@read_only
+def _resumen_progreso(df, company_name, group_name, include_zero_progress, inicio_episodios):
+    # --- USUARIOS CON GRUPO Y EMPRESA, FILTRADOS POR EMPRESA Y GRUPO (dimensión de usuarios) ---
+    users = users_of(df, company_name, group_name)
+
+    # Excluir ejercicios con episodios que empiezan después del último episodio empezado (en el futuro)
     episodios = df["episodes"].copy()
     if "startDate" in episodios.columns:
         episodios["startDate"] = pd.to_datetime(episodios["startDate"], errors="coerce")
-        episodios = episodios[episodios["startDate"].isnull() | (episodios["startDate"] <= datetime.now())]
+        empezados = episodios["startDate"] <= inicio_episodios if inicio_episodios is not None else False
+        episodios = episodios[episodios["startDate"].isnull() | empezados]
 
     # Unir ejercicios con episodios válidos
     ejercicios = df["exercises"].explode("episode_id").merge(
@@ -647,7 +768,9 @@ def obtener_resumen_progreso(df, company_name=None, group_name=None, include_zer
         "company_name", "group_name", "user_id", "user_first_name", "user_last_name",
         "module_name", "progress_percent", "completed_exercises", "total_exercises"
     ]
-    resultado = resultado[columnas_finales].sort_values(
+    resultado = resultado[columnas_finales].assign(
+        user_id=lambda x: decode_object_ids(x["user_id"])
+    ).sort_values(
         by=["company_name", "group_name", "user_id", "module_name"]
     )
 
@@ -665,7 +788,10 @@ def obtener_resumen_progreso(df, company_name=None, group_name=None, include_zer
         on="exercise_id", how="left"
     )
 
-    resumen_ejercicios = conteo.sort_values(by=["module_name", "completed_count"], ascending=[True, False])
+    resumen_ejercicios = conteo.sort_values(by=["module_name", "completed_count"], ascending=[True, False]).assign(
+        module_id=lambda x: decode_object_ids(x["module_id"]),
+        exercise_id=lambda x: decode_object_ids(x["exercise_id"])
+    )
     # --- Porcentaje de cumplimentación por ejercicio ---
     # Total de usuarios (filtrados por empresa o grupo si se proporciona)
     total_usuarios = len(users)
@@ -1,8 +1,13 @@
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 import os
+import atexit
+import threading
+import time
 from dotenv import load_dotenv
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 # load_dotenv()  # Cargar variables de entorno
 
@@ -10,16 +15,516 @@ import streamlit as st
 MONGO_URI = st.secrets["mongodb"]["MONGO_URI"]
 DB_NAME = st.secrets["mongodb"]["MONGO_DB"]
 
+# Configuración del pool de conexiones (se puede sobrescribir en secrets.toml, sección [mongodb])
+MAX_POOL_SIZE = int(st.secrets["mongodb"].get("MAX_POOL_SIZE", 50))
+MIN_POOL_SIZE = int(st.secrets["mongodb"].get("MIN_POOL_SIZE", 0))
+MAX_IDLE_TIME_MS = int(st.secrets["mongodb"].get("MAX_IDLE_TIME_MS", 300000))
+SERVER_SELECTION_TIMEOUT_MS = int(st.secrets["mongodb"].get("SERVER_SELECTION_TIMEOUT_MS", 10000))
+CONNECT_TIMEOUT_MS = int(st.secrets["mongodb"].get("CONNECT_TIMEOUT_MS", 10000))
+SOCKET_TIMEOUT_MS = int(st.secrets["mongodb"].get("SOCKET_TIMEOUT_MS", 120000))
+BATCH_SIZE = int(st.secrets["mongodb"].get("BATCH_SIZE", 1000))
+# Columnas con tipos de Arrow (pd.ArrowDtype) en lugar de objetos de Python cuando sea posible
+ARROW_BACKEND = bool(st.secrets["mongodb"].get("ARROW_BACKEND", False))
+
+# Sincronización incremental: cada cuánto se hace una recarga completa para reflejar borrados
+FULL_SYNC_INTERVAL_S = int(st.secrets["mongodb"].get("FULL_SYNC_INTERVAL_S", 6 * 3600))
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Cuenta los eventos del pool de conexiones para poder medir la rotación de conexiones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "pools_created": 0,
+            "pools_cleared": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checked_out": 0,
+        }
+
+    def _incr(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def pool_created(self, event):
+        self._incr("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.stats["checkouts"] += 1
+            self.stats["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self._incr("checked_out", -1)
+
+
+_client = None
+_client_lock = threading.Lock()
+_pool_listener = PoolStatsListener()
+
+
+def get_mongo_client():
+    """Devuelve el MongoClient compartido por todo el proceso, creándolo la primera vez.
+
+    MongoClient es thread-safe y mantiene su propio pool de conexiones, así que todas las
+    sesiones de Streamlit y todas las funciones de este módulo reutilizan la misma instancia.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MAX_POOL_SIZE,
+                    minPoolSize=MIN_POOL_SIZE,
+                    maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                    serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=SOCKET_TIMEOUT_MS,
+                    event_listeners=[_pool_listener],
+                )
+    return _client
+
+
+def close_mongo_connection():
+    """Cierra el cliente compartido y su pool de conexiones (se llama también al salir del proceso)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_mongo_connection)
+
+
+def get_pool_stats():
+    """Devuelve las estadísticas del pool de conexiones del cliente compartido."""
+    with _pool_listener._lock:
+        stats = dict(_pool_listener.stats)
+    stats["open_connections"] = stats["connections_created"] - stats["connections_closed"]
+    stats["max_pool_size"] = MAX_POOL_SIZE
+    stats["client_active"] = _client is not None
+    return stats
+
+
 def get_mongo_connection():
-    """Devuelve una conexión a la base de datos MongoDB."""
-    client = MongoClient(MONGO_URI)
-    return client[DB_NAME]
+    """Devuelve la base de datos MongoDB usando el cliente compartido."""
+    return get_mongo_client()[DB_NAME]
 
-def get_collection_data(collection_name):
-    """Obtiene los datos de una colección en MongoDB y los convierte en un DataFrame."""
-    db = get_mongo_connection()
-    data = list(db[collection_name].find())
-    return pd.DataFrame(data) if data else pd.DataFrame()
+def _typed_values(values, dtype):
+    """Convierte los valores de un lote (array de objetos) al tipo conocido de la columna."""
+    if dtype.startswith("datetime"):
+        return pd.to_datetime(values).to_numpy(dtype=dtype)
+    return pd.Series(values, dtype=object).astype(dtype).to_numpy()
+
+
+# Tipos que se guardan en arrays de numpy; el resto de columnas son objetos de Python (o texto de Arrow)
+_NUMPY_KINDS = ("int64", "float64", "bool", "datetime64[ns]")
+
+
+def _common_kind(kind, other):
+    """Tipo en el que caben los valores de dos tipos de columna (enteros y decimales -> decimales; si no, objetos)."""
+    if kind == other:
+        return kind
+    if {kind, other} == {"int64", "float64"}:
+        return "float64"
+    return "object"
+
+
+def _nullable_kind(kind):
+    """Tipo de una columna de tipo `kind` que además tiene valores nulos, como lo inferiría pandas."""
+    return {"int64": "float64", "bool": "object"}.get(kind, kind)
+
+
+class _ColumnBuffer:
+    """Buffer de una columna de cursor_to_dataframe, preasignado para `capacity` filas en el tipo de la columna.
+
+    Cada lote se convierte a su tipo antes de copiarse: el fijado en `dtype` o, si no, el que inferiría pandas
+    (enteros, decimales, booleanos y fechas en arrays de numpy; el resto como objetos de Python, o como texto de
+    Arrow con `arrow`). Si un lote no cabe en el tipo del buffer (p. ej. decimales en una columna de enteros), el
+    buffer se convierte una vez al tipo común; si hay más filas de las previstas, se amplía al doble.
+    """
+
+    def __init__(self, capacity, dtype=None, arrow=False):
+        self.capacity = max(capacity, 1)
+        self.kind = dtype
+        self.fixed = dtype is not None
+        self.arrow = arrow
+        self.rows = 0
+        self.values = None
+        self.chunks = []
+        # Lotes sin ningún valor leídos antes de conocer el tipo de la columna: (fila inicial, valores)
+        self.pending = []
+        if self.fixed:
+            self._allocate()
+
+    def _convert(self, values):
+        """Valores de un lote convertidos al tipo de la columna, y su tipo (None si todos son nulos)."""
+        if self.fixed:
+            return _typed_values(values, self.kind), self.kind
+        if pd.isna(values).all():
+            return values, None
+        if self.arrow and pd.api.types.infer_dtype(values, skipna=True) == "string":
+            return pa.array(values, type=pa.string(), from_pandas=True), "string"
+        typed = pd.Series(values, dtype=object).infer_objects()
+        if str(typed.dtype) in _NUMPY_KINDS:
+            return typed.to_numpy(), str(typed.dtype)
+        return values, "object"
+
+    def _allocate(self):
+        """Crea el buffer del tipo de la columna con las filas ya leídas, todas nulas."""
+        if self.kind != "string":
+            self.values = np.empty(max(self.capacity, self.rows), dtype=self.kind)
+        self._fill_nulls(0, self.rows)
+        if self.kind == "object":
+            for start, values in self.pending:
+                self.values[start:start + len(values)] = values
+        self.pending = []
+
+    def _fill_nulls(self, start, stop, values=None):
+        """Filas nulas [start, stop): NaT en fechas, NaN en números y el valor original (None o NaN) en objetos."""
+        if stop <= start:
+            return
+        if self.kind == "string":
+            self.chunks.append(pa.nulls(stop - start, pa.string()))
+        elif self.kind == "object" and values is not None:
+            self.values[start:stop] = values
+        else:
+            self.values[start:stop] = np.datetime64("NaT") if self.kind.startswith("datetime") else np.nan
+
+    def _promote(self, kind):
+        """Convierte las filas ya leídas al tipo `kind`."""
+        if self.kind == "string":
+            current = pa.chunked_array(self.chunks, pa.string()).to_numpy(zero_copy_only=False)
+            self.chunks = []
+        elif self.kind.startswith("datetime"):
+            # Fechas de Python (datetime), como las devuelve pymongo; NaT pasa a None
+            current = self.values[:self.rows].astype("datetime64[us]").astype(object)
+        else:
+            current = self.values[:self.rows]
+        values = np.empty(max(self.capacity, self.rows), dtype=kind)
+        values[:self.rows] = current
+        self.values, self.kind = values, kind
+
+    def _reserve(self, rows):
+        """Amplía el buffer al doble si no caben `rows` filas."""
+        if self.kind != "string" and rows > len(self.values):
+            values = np.empty(max(rows, 2 * len(self.values)), dtype=self.kind)
+            values[:len(self.values)] = self.values
+            self.values = values
+            self.capacity = len(values)
+
+    def append(self, start, values):
+        """Añade las filas de un lote (array de objetos) que empieza en la fila `start` del resultado."""
+        stop = start + len(values)
+        typed, kind = self._convert(values)
+        if self.kind is None and kind is None:
+            self.pending.append((start, values))
+            self.rows = stop
+            return
+        if self.kind is None:
+            # Si hay filas anteriores son nulas: el tipo es el que admite nulos
+            self.kind = _nullable_kind(kind) if start else kind
+            self._allocate()
+        elif kind is None and _nullable_kind(self.kind) != self.kind:
+            self._promote(_nullable_kind(self.kind))
+        elif kind is not None and kind != self.kind:
+            self._promote(_common_kind(self.kind, kind))
+        if self.kind != "string" and start > self.rows:
+            self._reserve(start)
+        self._fill_nulls(self.rows, start)
+        self._reserve(stop)
+        if kind is None:
+            self._fill_nulls(start, stop, values)
+        elif self.kind == "string":
+            self.chunks.append(typed)
+        else:
+            # En una columna de objetos se guardan los valores originales del lote, como en pd.DataFrame
+            self.values[start:stop] = values if self.kind == "object" and kind != "object" else typed
+        self.rows = stop
+
+    def to_series(self, rows):
+        """Columna final de `rows` filas (las que falten al final, nulas); libera la capacidad que sobra."""
+        if self.kind is None:
+            values = np.full(rows, np.nan, dtype=object)
+            for start, pending in self.pending:
+                values[start:start + len(pending)] = pending
+            return pd.Series(values, dtype=object).infer_objects()
+        self._reserve(rows)
+        self._fill_nulls(self.rows, rows)
+        if self.kind == "string":
+            return pd.Series(pd.arrays.ArrowExtensionArray(pa.chunked_array(self.chunks, pa.string())))
+        values, self.values = self.values, None
+        values.resize(rows, refcheck=False)
+        return pd.Series(values)
+
+
+def cursor_to_dataframe(cursor, batch_size=BATCH_SIZE, dtypes=None, arrow=ARROW_BACKEND, expected_rows=None):
+    """Convierte un cursor de MongoDB en un DataFrame leyendo los documentos por lotes.
+
+    En lugar de materializar todo el cursor en una lista de diccionarios, cada lote de
+    `batch_size` documentos se vuelca en buffers por columna y se libera antes de leer el
+    siguiente, así que los diccionarios de los documentos nunca están todos en memoria a la vez.
+    Cada columna de un lote se convierte a su tipo final antes de copiarse en el buffer (ver _ColumnBuffer):
+    el de `dtypes` (p. ej. fechas) o el que inferiría `pd.DataFrame(lista_de_documentos)`. Los buffers se
+    preasignan para `expected_rows` filas (p. ej. el nº estimado de documentos de la colección). Con
+    `arrow=True` las columnas de texto, números y fechas quedan respaldadas por Arrow.
+    """
+    dtypes = dtypes or {}
+    capacity = expected_rows or batch_size
+    buffers = {}
+    rows = 0
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            _append_batch(buffers, batch, rows, dtypes, capacity, arrow)
+            rows += len(batch)
+            batch = []
+    if batch:
+        _append_batch(buffers, batch, rows, dtypes, capacity, arrow)
+        rows += len(batch)
+    if not rows:
+        return pd.DataFrame()
+
+    data = {column: buffers.pop(column).to_series(rows) for column in list(buffers)}
+    data = pd.DataFrame(data)
+    if arrow:
+        data = data.convert_dtypes(dtype_backend="pyarrow")
+    return data
+
+
+def _append_batch(buffers, batch, rows, dtypes, capacity, arrow):
+    """Añade un lote de documentos, que empieza en la fila `rows`, a los buffers por columna."""
+    for document in batch:
+        for key in document:
+            if key not in buffers:
+                buffers[key] = _ColumnBuffer(capacity, dtypes.get(key), arrow)
+    for key, buffer in buffers.items():
+        values = np.empty(len(batch), dtype=object)
+        for i, document in enumerate(batch):
+            # Campo ausente en el documento: NaN, igual que pd.DataFrame(lista_de_documentos)
+            values[i] = document.get(key, np.nan)
+        buffer.append(rows, values)
+
+
+def get_collection_data(collection_name, projection=None, query=None, dtypes=None, preallocate=True):
+    """Obtiene los datos de una colección en MongoDB y los convierte en un DataFrame.
+
+    `projection` y `query` se envían tal cual a `find()`, de modo que el servidor sólo devuelve
+    los campos y documentos necesarios (para descargar sólo los cambios, ver sync_collection_data).
+    El cursor se convierte por lotes (ver cursor_to_dataframe); `dtypes` fija el tipo de las
+    columnas conocidas. Con `preallocate=False` (consultas que devuelven pocos documentos, como los
+    cambios de una sincronización incremental) no se reservan los buffers para toda la colección.
+    """
+    collection = get_mongo_connection()[collection_name]
+    # Los buffers por columna se preasignan con el nº estimado de documentos (de los metadatos de la colección)
+    expected_rows = collection.estimated_document_count() if preallocate else None
+    cursor = collection.find(query or {}, projection, batch_size=BATCH_SIZE)
+    return cursor_to_dataframe(cursor, BATCH_SIZE, dtypes, expected_rows=expected_rows)
+
+
+def get_max_value(collection_name, field, query=None):
+    """Mayor valor de `field` en los documentos de `query` (None si no hay ninguno). Lo calcula el servidor, que
+    sólo devuelve un documento; sin un índice por `field` recorre los documentos de `query`."""
+    collection = get_mongo_connection()[collection_name]
+    latest = list(collection.aggregate([{"$match": query or {}}, {"$group": {"_id": None, "value": {"$max": f"${field}"}}}]))
+    return latest[0].get("value") if latest else None
+
+
+def _has_index_on(collection, field):
+    """Indica si la colección tiene un índice que empieza por `field` (con el que ordenar por él no la recorre)."""
+    return any(info["key"][0][0] == field for info in collection.index_information().values())
+
+
+# Por colección: si tiene índice por `updatedAt` y, si no lo tiene, su mayor `updatedAt` (calculado recorriéndola),
+# con la hora de la consulta. Se renuevan cada FULL_SYNC_INTERVAL_S segundos (ver get_collection_fingerprint)
+_updated_at_info = {}
+_updated_at_lock = threading.Lock()
+
+
+def _updated_at_of(collection):
+    """Índice por `updatedAt` de la colección y, sin índice, su mayor `updatedAt` (como mucho con FULL_SYNC_INTERVAL_S
+    segundos de antigüedad): {"indexed": bool, "updatedAt": str o None, "checked": hora de la consulta}."""
+    with _updated_at_lock:
+        info = _updated_at_info.get(collection.name)
+    if info is not None and time.time() - info["checked"] < FULL_SYNC_INTERVAL_S:
+        return info
+    info = {"indexed": _has_index_on(collection, "updatedAt"), "updatedAt": None, "checked": time.time()}
+    if not info["indexed"]:
+        latest = get_max_value(collection.name, "updatedAt")
+        info["updatedAt"] = str(latest) if latest is not None else None
+    with _updated_at_lock:
+        _updated_at_info[collection.name] = info
+    return info
+
+
+def get_collection_fingerprint(collection_name):
+    """Huella barata de una colección: nº estimado de documentos, mayor `_id` y mayor `updatedAt`.
+
+    El recuento sale de los metadatos de la colección y el mayor `_id` del índice de `_id` (un documento).
+    Un documento nuevo cambia el `_id` y el recuento y uno borrado el recuento; uno modificado, el `updatedAt`,
+    así que la huella sólo cambia cuando cambian los datos. Si hay un índice que empiece por `updatedAt`, el mayor
+    se consulta en cada comprobación; si no, ordenar por `updatedAt` recorrería la colección entera, así que se
+    calcula como mucho cada FULL_SYNC_INTERVAL_S segundos y los documentos modificados se detectan con ese retraso.
+    El resultado de index_information también se guarda ese tiempo. Límite: en las colecciones sin `updatedAt`
+    un documento modificado no cambia la huella.
+    """
+    collection = get_mongo_connection()[collection_name]
+    count = collection.estimated_document_count()
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+    fingerprint = {"count": count, "_id": str(last["_id"]) if last else None}
+    info = _updated_at_of(collection)
+    if info["indexed"]:
+        updated = collection.find_one({}, {"updatedAt": 1}, sort=[("updatedAt", pymongo.DESCENDING)])
+        fingerprint["updatedAt"] = str(updated.get("updatedAt")) if updated and updated.get("updatedAt") is not None else None
+    else:
+        fingerprint["updatedAt"] = info["updatedAt"]
+    return fingerprint
+
+
+# Estado de la sincronización incremental por (colección, proyección, filtro): marcas de agua y contadores, no los
+# datos (la única copia de los datos es la de quien sincroniza, ver scripts.data_processing). Un cerrojo por clave
+# protege la lectura y la escritura de su estado; las descargas de distintas colecciones no se esperan entre sí.
+_sync_state = {}
+_sync_locks = {}
+_sync_lock = threading.Lock()
+
+
+def _key_lock(key):
+    """Cerrojo del estado de sincronización de una clave."""
+    with _sync_lock:
+        return _sync_locks.setdefault(key, threading.Lock())
+
+
+def _max(a, b):
+    """Mayor de dos marcas de agua (None si falta)."""
+    return b if a is None else a if b is None else max(a, b)
+
+
+def get_watermarks(data):
+    """Devuelve el mayor `updatedAt` y el mayor `_id` de un DataFrame (None si no hay)."""
+    updated_at = None
+    if "updatedAt" in data.columns and data["updatedAt"].notna().any():
+        updated_at = data["updatedAt"].max()
+    max_id = data["_id"].max() if "_id" in data.columns and not data.empty else None
+    return updated_at, max_id
+
+
+def sync_collection_data(collection_name, projection=None, query=None, dtypes=None, full=False):
+    """Descarga los cambios de una colección desde la última llamada con los mismos argumentos.
+
+    Se guarda una marca de agua por (colección, proyección, filtro): el mayor `updatedAt` (documentos
+    modificados) y el mayor `_id` (documentos nuevos, cuyo ObjectId crece con la fecha de inserción).
+    Devuelve (datos, ids_cambiados):
+
+    - En una recarga completa, ids_cambiados es None y los datos son toda la colección (con `query`). Se hace
+      la primera vez, con `full=True`, cada FULL_SYNC_INTERVAL_S segundos (para reflejar los documentos
+      borrados) y siempre en las colecciones cuyos documentos no tienen `updatedAt`: en ellas un documento
+      modificado no se puede detectar, así que no se sincronizan de forma incremental.
+    - Si no, los datos son los documentos nuevos o modificados que cumplen `query` e ids_cambiados los `_id` de
+      todos los nuevos o modificados, lo cumplan o no. Quien guarda los datos sustituye las filas de esos ids
+      por las de los datos: así un documento que deja de cumplir `query` (p. ej. cambia de tipo) desaparece.
+
+    Límites: un borrado sólo se refleja en la siguiente recarga completa, y un cambio que no actualiza
+    `updatedAt` no se detecta hasta entonces.
+    """
+    key = (collection_name, repr(projection), repr(query))
+    fetch_projection = projection
+    if projection and any(projection.values()):
+        # Proyección de inclusión: hacen falta `_id` y `updatedAt` para las marcas de agua
+        fetch_projection = {**projection, "_id": 1, "updatedAt": 1}
+    drop_columns = [
+        field for field in ["_id", "updatedAt"]
+        if fetch_projection is not projection and not projection.get(field)
+    ]
+
+    lock = _key_lock(key)
+    with lock:
+        state = _sync_state.get(key)
+    now = time.time()
+    if full or state is None or not state["incremental"] or now - state["last_full_sync"] > FULL_SYNC_INTERVAL_S:
+        data = get_collection_data(collection_name, fetch_projection, query, dtypes=dtypes)
+        changed_ids = None
+        updated_at, max_id = get_watermarks(data)
+        state = {
+            "last_full_sync": now, "full_syncs": 1 if state is None else state["full_syncs"] + 1, "delta_rows": 0,
+            "incremental": updated_at is not None,
+        }
+    else:
+        updated_at, max_id = state["watermarks"]
+        conditions = [{"_id": {"$gt": max_id}}] if max_id is not None else []
+        conditions.append({"updatedAt": {"$gte": updated_at}})
+        changed = {"$or": conditions}
+        data = get_collection_data(
+            collection_name, fetch_projection, {"$and": [query, changed]} if query else changed,
+            dtypes=dtypes, preallocate=False
+        )
+        if query:
+            # Los cambiados que ya no cumplen el filtro sólo se descargan con su _id (y su updatedAt)
+            changed_docs = pd.DataFrame(list(
+                get_mongo_connection()[collection_name].find(changed, {"_id": 1, "updatedAt": 1})
+            ))
+        else:
+            changed_docs = data
+        changed_ids = changed_docs["_id"].tolist() if "_id" in changed_docs.columns else []
+        changed_updated_at, changed_max_id = get_watermarks(changed_docs)
+        updated_at, max_id = _max(updated_at, changed_updated_at), _max(max_id, changed_max_id)
+        state = {**state, "delta_rows": state["delta_rows"] + len(data)}
+    state.update(watermarks=(updated_at, max_id), last_sync=now, last_rows=len(data))
+    with lock:
+        _sync_state[key] = state
+
+    if drop_columns:
+        # Sin copiar los datos: un DataFrame nuevo con las mismas columnas salvo las de las marcas de agua
+        data = pd.DataFrame({col: data[col] for col in data.columns if col not in drop_columns}, index=data.index, copy=False)
+    return data, changed_ids
+
+
+def get_sync_stats():
+    """Devuelve, por colección, las filas de la última descarga, las filas descargadas en sincronizaciones
+    incrementales, si se sincroniza de forma incremental, las marcas de agua y la última recarga completa."""
+    states = dict(_sync_state)
+    return {
+        key[0]: {
+            "last_rows": state["last_rows"],
+            "delta_rows": state["delta_rows"],
+            "full_syncs": state["full_syncs"],
+            "incremental": state["incremental"],
+            "updatedAt": str(state["watermarks"][0]),
+            "_id": str(state["watermarks"][1]),
+            "last_full_sync": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state["last_full_sync"])),
+        }
+        for key, state in states.items()
+    }
 
 def get_company_names():
     """Obtiene la lista de nombres de empresas disponibles en la base de datos."""
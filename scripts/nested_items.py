@@ -0,0 +1,60 @@
+# Description: Aplanado por columnas de listas de documentos anidados (ítems de respuestas, mensajes de hilos).
+#
+# Sustituye a pd.json_normalize(frame.explode(columna).to_dict(orient="records")): en lugar de convertir cada fila
+# en un diccionario y volver a construir el DataFrame, se calculan las longitudes de las listas (los desplazamientos
+# de cada fila padre), se repiten las columnas del padre con un único take y cada campo de los ítems se extrae a
+# un array del tamaño final. Las respuestas de la vista de entrenamientos se aplanan una vez por versión de datos
+# (df["answer_items"]) y todas las métricas de respuestas con ítems leen de esa tabla.
+from itertools import chain
+import numpy as np
+import pandas as pd
+from scripts.answer_partitions import rows_of_type
+
+# Campos de los ítems de las respuestas (encuestas y cuestionarios) y columnas de la respuesta que se conservan
+answer_item_paths = ["question", "type", "value", "input", "affirmation", "isChecked"]
+answer_item_parent_columns = ["user", "trainingNamedId", "type", "endingAffirmationInput"]
+
+
+def _is_items(value):
+    """Si un valor es una lista no vacía de ítems (las vacías y los nulos dan una fila sin ítem, como explode)."""
+    return isinstance(value, list) and len(value) > 0
+
+
+def _get(item, keys):
+    """Campo anidado de un ítem; NaN si falta (como json_normalize), None si el campo existe y es nulo."""
+    for key in keys:
+        if not isinstance(item, dict) or key not in item:
+            return np.nan
+        item = item[key]
+    return item
+
+
+def flatten_items(frame, column, paths, keep=()):
+    """Explota la columna de listas `column` de `frame` y extrae de cada ítem los campos `paths` ("a" o "a.b").
+
+    Devuelve un DataFrame con las columnas `keep` del padre (repetidas en cada ítem) y f"{column}.{path}",
+    con el mismo contenido que json_normalize sobre explode: una fila por ítem y una fila con NaN por cada padre
+    sin ítems. El índice es un RangeIndex.
+    """
+    values = frame[column].tolist() if column in frame.columns else [None] * len(frame)
+    lengths = np.fromiter((len(value) if _is_items(value) else 1 for value in values), dtype=np.int64, count=len(values))
+    parents = np.repeat(np.arange(len(values)), lengths)
+    size = int(lengths.sum())
+
+    flat = frame[[name for name in keep if name in frame.columns]].take(parents).reset_index(drop=True)
+    items = list(chain.from_iterable(value if _is_items(value) else (None,) for value in values))
+    for path in paths:
+        keys = path.split(".")
+        flat[f"{column}.{path}"] = np.fromiter((_get(item, keys) for item in items), dtype=object, count=size)
+    return flat.infer_objects()
+
+
+def build_answer_items(answers):
+    """Ítems de todas las respuestas de la vista de entrenamientos, con el usuario, el entrenamiento y el tipo."""
+    return flatten_items(answers, "items", answer_item_paths, answer_item_parent_columns)
+
+
+def answer_items_of(answer_items, type_index, answer_type, columns):
+    """Columnas `columns` de los ítems de las respuestas de un tipo (con su índice por tipo, ver
+    scripts.answer_partitions), con los tipos de datos de ese tipo de respuesta."""
+    return rows_of_type(answer_items, type_index, answer_type, columns).reset_index(drop=True).infer_objects()
\ No newline at end of file
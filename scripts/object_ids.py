@@ -0,0 +1,239 @@
+# Description: Códigos enteros densos para los ObjectId de MongoDB, con diccionario inverso.
+#
+# Todas las columnas de ids del proceso comparten el mismo diccionario, así que los merges, groupby e isin
+# entre colecciones trabajan sobre enteros. Los códigos nuevos se asignan en el orden de los ObjectId,
+# de modo que ordenar por código equivale (salvo ids antiguos que aparezcan tarde) a ordenar por ObjectId.
+# Al pasar a servir una nueva versión de datos (ver prune_object_ids) se olvidan los ObjectId que ya no aparecen
+# en los datos cargados; sus códigos no se reutilizan, para que los datos que aún los tengan no cambien de id.
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+# Diccionario de códigos: ObjectId -> código y código -> ObjectId
+_codes = {}
+_object_ids = []
+_object_id_array = np.empty(0, dtype=object)
+# Índice de los ObjectId por código, para codificar columnas enteras (se rehace al registrar ObjectId nuevos)
+_object_id_index = pd.Index([], dtype=object)
+# Generación (nº de cambios de versión servida) en la que se registró o codificó cada código por última vez
+_generation = 0
+_seen = np.empty(0, dtype=np.int64)
+_codes_lock = threading.Lock()
+# Generación de los códigos olvidados (nunca se vuelven a podar)
+_PRUNED = np.iinfo(np.int64).max
+
+logger = logging.getLogger(__name__)
+
+
+def _sync_arrays(forgotten=False):
+    """Ajusta el array de ObjectId, su índice y el de generaciones a la lista de códigos (con _codes_lock).
+
+    Con `forgotten` (se han olvidado códigos) rehace el índice aunque no haya códigos nuevos.
+    """
+    global _object_id_array, _object_id_index, _seen
+    if len(_object_id_array) != len(_object_ids):
+        _object_id_array = np.empty(len(_object_ids), dtype=object)
+        _object_id_array[:] = _object_ids
+        _seen = np.concatenate([_seen, np.full(len(_object_ids) - len(_seen), _generation, dtype=np.int64)])
+        forgotten = True
+    if forgotten:
+        # Los códigos olvidados se indexan por su código negativo, para que el índice no tenga repetidos
+        indexed = _object_id_array.copy()
+        missing = np.equal(indexed, None)
+        indexed[missing] = -1 - np.flatnonzero(missing)
+        _object_id_index = pd.Index(indexed, dtype=object)
+
+
+def register_object_ids(values):
+    """Asigna código a los ObjectId que aún no lo tienen (en orden ascendente) y devuelve el nº de códigos.
+
+    Todos los ObjectId recibidos, nuevos o no, cuentan como vistos en la generación actual (ver prune_object_ids).
+    """
+    values = {value for value in values if isinstance(value, ObjectId)}
+    with _codes_lock:
+        for value in sorted(values.difference(_codes)):
+            _codes[value] = len(_object_ids)
+            _object_ids.append(value)
+        _sync_arrays()
+        _seen[np.fromiter((_codes[value] for value in values), dtype=np.int64, count=len(values))] = _generation
+        return len(_object_ids)
+
+
+def prune_object_ids():
+    """Olvida los ObjectId que no se han registrado ni codificado en la generación actual ni en la anterior y pasa
+    a la siguiente generación; se llama al pasar a servir una nueva versión de datos (ver scripts.refresher).
+
+    Cada versión vuelve a codificar todos sus ids al cargarse, así que se conservan los de la versión nueva y los
+    de la anterior, que las sesiones pueden seguir usando mientras terminan. Los códigos olvidados no se reutilizan
+    y se decodifican como None. Devuelve el nº de ObjectId olvidados.
+    """
+    global _generation
+    with _codes_lock:
+        stale = np.flatnonzero(_seen < _generation - 1)
+        for code in stale:
+            del _codes[_object_ids[code]]
+            _object_ids[code] = None
+        _object_id_array[stale] = None
+        _sync_arrays(forgotten=len(stale) > 0)
+        _seen[stale] = _PRUNED
+        _generation += 1
+        return len(stale)
+
+
+def object_id_codes(values):
+    """Códigos de una lista de ObjectId, sin registrar los que no tienen (-1)."""
+    with _codes_lock:
+        return np.fromiter((_codes.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+
+
+def touch_object_ids(values):
+    """Marca como vistos en la generación actual (ver prune_object_ids) los códigos de una columna ya codificada,
+    de escalares o de listas, que se sigue usando sin volver a codificarla."""
+    if values.dtype == object:
+        codes = np.fromiter((
+            value for value in _iter_object_ids(values)
+            if isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+        ), dtype=np.int64)
+    else:
+        codes = values.dropna().to_numpy(dtype=np.int64)
+    with _codes_lock:
+        codes = codes[(codes >= 0) & (codes < len(_seen))]
+        codes = codes[_seen[codes] != _PRUNED]
+        _seen[codes] = _generation
+
+
+def get_object_ids():
+    """Copia de la lista de ObjectId del proceso, en orden de código, con None en los códigos olvidados (para
+    publicarla con una instantánea)."""
+    with _codes_lock:
+        return list(_object_ids)
+
+
+def adopt_object_ids(object_ids):
+    """Incorpora los códigos asignados por otro proceso (el que publica las instantáneas compartidas).
+
+    Si los ObjectId del proceso coinciden con el principio de `object_ids`, los códigos recibidos valen tal cual:
+    se añaden los que faltan, se olvidan los que el otro proceso ha olvidado (None, ver prune_object_ids) y se
+    devuelve None. Si no, se registran los ObjectId recibidos y se devuelve el array que traduce cada código
+    recibido al código de este proceso (-1 en los olvidados).
+    """
+    with _codes_lock:
+        known = len(_object_ids)
+        if known <= len(object_ids) and all(
+            theirs is None or mine == theirs for mine, theirs in zip(_object_ids, object_ids[:known])
+        ):
+            forgotten = False
+            for code, value in enumerate(object_ids[:known]):
+                if value is None and _object_ids[code] is not None:
+                    del _codes[_object_ids[code]]
+                    _object_ids[code] = None
+                    _object_id_array[code] = None
+                    _seen[code] = _PRUNED
+                    forgotten = True
+            for value in object_ids[known:]:
+                if value is not None:
+                    _codes[value] = len(_object_ids)
+                _object_ids.append(value)
+            _sync_arrays(forgotten)
+            _seen[[code for code, value in enumerate(_object_ids) if value is not None]] = _generation
+            return None
+    register_object_ids(object_ids)
+    return np.array([_codes.get(value, -1) for value in object_ids], dtype=np.int64)
+
+
+def _iter_object_ids(values):
+    """Recorre los ObjectId de una columna, tanto escalares como dentro de listas."""
+    for value in values:
+        if isinstance(value, list):
+            yield from value
+        else:
+            yield value
+
+
+def _other_values(values):
+    """Valores de una columna de ids (o de sus listas) que no son ObjectId ni nulos."""
+    return [
+        value for value in _iter_object_ids(values)
+        if not isinstance(value, ObjectId) and not (value is None or (np.ndim(value) == 0 and value != value))
+    ]
+
+
+def _encode_value(value):
+    """Código de un ObjectId (ya registrado); el resto de valores se devuelven tal cual."""
+    return _codes[value] if isinstance(value, ObjectId) else value
+
+
+def encode_column(values, others=()):
+    """Sustituye los ObjectId de una columna por sus códigos (ya registrados).
+
+    Las columnas escalares pasan a int64 (o Int64 si hay nulos); las de listas conservan las listas, con códigos.
+    Si la columna tiene otros valores (`others`, ver _other_values) se dejan tal cual y la columna es de objetos.
+    """
+    if values.map(lambda value: isinstance(value, list)).any():
+        return values.map(lambda value: [_encode_value(item) for item in value] if isinstance(value, list) else _encode_value(value))
+    if len(others):
+        return values.map(_encode_value)
+    # Búsqueda vectorizada en el índice de los ObjectId (los nulos quedan como -1)
+    codes = _object_id_index.get_indexer(values.to_numpy())
+    if (codes >= 0).all():
+        return pd.Series(codes, index=values.index, name=values.name, dtype="int64")
+    codes = pd.array(codes, dtype="Int64")
+    codes[codes < 0] = pd.NA
+    return pd.Series(codes, index=values.index, name=values.name)
+
+
+def encode_object_ids(datasets, id_columns):
+    """Codifica las columnas de ids de varias colecciones: {colección: DataFrame} -> {colección: DataFrame}.
+
+    Todos los ObjectId nuevos se registran juntos antes de codificar, para que los códigos respeten su orden.
+    Si una columna tiene otros valores además de ObjectId, sólo se codifican los ObjectId y se avisa; los enteros
+    no se pueden distinguir de los códigos, así que en ese caso se lanza ValueError. Las columnas sin ningún
+    ObjectId ni nulo se dejan sin codificar. No modifica los DataFrames de entrada.
+    """
+    columns = {
+        col: [column for column in id_columns.get(col, []) if column in data.columns and data[column].dtype == object]
+        for col, data in datasets.items()
+    }
+    others = {}
+    for col, names in columns.items():
+        for column in names:
+            values = _other_values(datasets[col][column])
+            if values and not any(isinstance(value, ObjectId) for value in _iter_object_ids(datasets[col][column])):
+                continue
+            if any(isinstance(value, (int, np.integer)) and not isinstance(value, bool) for value in values):
+                raise ValueError(f"La columna de ids {col}.{column} tiene enteros, que se confundirían con los códigos de los ObjectId")
+            if values:
+                logger.warning(
+                    "La columna de ids %s.%s tiene %d valores que no son ObjectId: se dejan sin codificar", col, column, len(values)
+                )
+            others[(col, column)] = values
+    columns = {col: [column for column in names if (col, column) in others] for col, names in columns.items()}
+    register_object_ids(
+        value for col, names in columns.items() for column in names for value in _iter_object_ids(datasets[col][column])
+    )
+    return {
+        col: data.assign(**{column: encode_column(data[column], others[(col, column)]) for column in columns[col]})
+        if columns[col] else data
+        for col, data in datasets.items()
+    }
+
+
+def _decode_value(value):
+    """ObjectId de un código (o de los códigos de una lista); el resto de valores se devuelven tal cual."""
+    if isinstance(value, list):
+        return [_decode_value(item) for item in value]
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return _object_ids[value]
+    return value
+
+
+def decode_object_ids(values):
+    """Devuelve los ObjectId de una columna de códigos (nulos como NaN). Los valores sin codificar se devuelven tal cual."""
+    if values.dtype == object:
+        return values.map(_decode_value)
+    missing = values.isna().to_numpy()
+    decoded = _object_id_array[values.to_numpy(dtype="int64", na_value=0)]
+    decoded[missing] = np.nan
+    return pd.Series(decoded, index=values.index, name=values.name)
\ No newline at end of file
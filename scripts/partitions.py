@@ -0,0 +1,150 @@
+# Description: Carga perezosa por empresa de los datos del dashboard, con una LRU de particiones.
+#
+# Con [partitions] ENABLED (y sin instantáneas, SNAPSHOT_MODE = "off"), la versión servida (ver scripts.refresher)
+# sólo carga las colecciones de dimensiones. Las de hechos (conexiones, progreso, respuestas, hilos) se descargan
+# la primera vez que se consulta una empresa, filtradas en MongoDB por los ids de sus usuarios, y la vista procesada
+# de esa empresa se guarda como una partición independiente. Así el tiempo hasta el primer gráfico de una empresa
+# depende del tamaño de esa empresa. "Todas" (la opción por defecto del dashboard) y los entrenamientos son la
+# partición None, con todos los datos: su primera carga cuesta lo mismo que la carga completa sin particiones.
+# Se mide en get_partition_stats (segundos de carga de cada partición) y, como las demás, se vuelve a cargar en
+# segundo plano al cambiar de versión (warm_partitions), así que sólo se espera la primera vez que se abre.
+#
+# Las particiones se cargan para la versión servida o para la que se está preparando: antes de cambiar de versión
+# se cargan para la nueva las que estaban en caché (start_warming, warm_partitions) mientras las sesiones siguen
+# usando las de la servida, y al cambiar se descartan las de la anterior (drop_partitions). Una sesión que aún
+# pide una versión anterior recibe la de la actual.
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+from scripts.data_processing import load_and_process_data, load_and_process_data_trainings
+from scripts.snapshots import SNAPSHOT_MODE
+from scripts.shared_datasets import freeze_dataset
+
+# Configuración (sección [partitions] de secrets.toml)
+PARTITIONS_ENABLED = bool(st.secrets.get("partitions", {}).get("ENABLED", False)) and SNAPSHOT_MODE == "off"
+PARTITIONS_MAX = int(st.secrets.get("partitions", {}).get("MAX_PARTITIONS", 8))
+
+# Particiones: {(versión de datos, empresa o None): conjuntos de datos}, de la menos a la más usada
+_partitions = OrderedDict()
+_partitions_lock = threading.Lock()
+# Un cerrojo por partición en carga, para que las sesiones que piden la misma empresa esperen a una única carga
+_loading = {}
+_partition_stats = {"hits": 0, "loads": 0, "evictions": 0, "stale_requests": 0}
+# Segundos de carga de cada partición en caché
+_load_seconds = {}
+# Versión de datos servida (ver drop_partitions) y versión cuyas particiones se están cargando antes de servirla
+# (ver start_warming)
+_served_version = None
+_warming_version = None
+
+
+def load_partition(company_name, data_version):
+    """Carga y procesa los conjuntos de datos de una empresa (o de todas, con None)."""
+    main = load_and_process_data(data_version, company_name)
+    return freeze_dataset({
+        "df": main,
+        "df_trainings": load_and_process_data_trainings(data_version, company_name),
+        "df_cumplimentacion": main,
+    })
+
+
+def get_partition(company_name, data_version):
+    """Devuelve la partición de una empresa (None: todas) para una versión de datos, cargándola si hace falta.
+
+    Por encima de PARTITIONS_MAX particiones se descartan las menos usadas; las de la versión que se está
+    preparando no cuentan hasta servirla, para no desplazar a las de la servida. Las versiones anteriores a la
+    servida ya no se cargan (los datos de MongoDB son los de la versión servida): se devuelve la partición de la
+    servida.
+    """
+    with _partitions_lock:
+        if (_served_version is not None and data_version not in (_served_version, _warming_version)
+                and (data_version, company_name) not in _partitions):
+            data_version = _served_version
+            _partition_stats["stale_requests"] += 1
+        key = (data_version, company_name)
+        if key in _partitions:
+            _partitions.move_to_end(key)
+            _partition_stats["hits"] += 1
+            return _partitions[key]
+        lock = _loading.setdefault(key, threading.Lock())
+    with lock:
+        with _partitions_lock:
+            if key in _partitions:
+                _partitions.move_to_end(key)
+                _partition_stats["hits"] += 1
+                return _partitions[key]
+        start = time.perf_counter()
+        try:
+            datasets = load_partition(company_name, data_version)
+        except Exception:
+            with _partitions_lock:
+                _loading.pop(key, None)
+            raise
+        with _partitions_lock:
+            _partitions[key] = datasets
+            _load_seconds[key] = round(time.perf_counter() - start, 3)
+            _partition_stats["loads"] += 1
+            counted = [key for key in _partitions if key[0] != _warming_version]
+            for evicted in counted[:max(len(counted) - PARTITIONS_MAX, 0)]:
+                del _partitions[evicted]
+                _load_seconds.pop(evicted, None)
+                _partition_stats["evictions"] += 1
+            _loading.pop(key, None)
+    return datasets
+
+
+def start_warming(data_version):
+    """Empieza a preparar `data_version` y devuelve las empresas de las particiones en caché de la versión servida,
+    de la más a la menos usada, para cargarlas con warm_partitions antes de pasar a servirla."""
+    global _warming_version
+    with _partitions_lock:
+        _warming_version = data_version
+        return list(dict.fromkeys(company for version, company in reversed(_partitions) if version == _served_version))
+
+
+def warm_partitions(data_version, companies):
+    """Carga para `data_version` las particiones de `companies` (las que devuelve start_warming).
+
+    El refresco la llama en segundo plano antes de pasar a servir una nueva versión, para que las empresas
+    consultadas ya estén cargadas al cambiar: mientras tanto las sesiones siguen usando las particiones de la
+    versión servida. Se detiene si se empieza a preparar otra versión. Un fallo no interrumpe al resto; esa
+    empresa se cargará cuando se pida.
+    """
+    for company_name in companies:
+        if data_version not in (_warming_version, _served_version):
+            return
+        try:
+            get_partition(company_name, data_version)
+        except Exception as error:
+            print(f"Error al recargar la partición {company_name or 'Todas'} de la versión {data_version}: {error!r}")
+
+
+def drop_partitions(data_version):
+    """Pasa a servir `data_version`: descarta las particiones de otras versiones de datos (las de la nueva ya se
+    han cargado con warm_partitions) y devuelve las huellas de las particiones que quedan."""
+    global _served_version, _warming_version
+    with _partitions_lock:
+        _served_version = data_version
+        if _warming_version == data_version:
+            _warming_version = None
+        for key in [key for key in _partitions if key[0] != data_version]:
+            del _partitions[key]
+            _load_seconds.pop(key, None)
+        return {data["data_fingerprint"] for datasets in _partitions.values() for data in datasets.values()}
+
+
+def get_partition_stats():
+    """Devuelve las particiones en caché (versión, empresa y segundos de carga), los aciertos, las cargas, los
+    descartes y las peticiones de versiones anteriores."""
+    with _partitions_lock:
+        return {
+            **_partition_stats,
+            "enabled": PARTITIONS_ENABLED,
+            "max_partitions": PARTITIONS_MAX,
+            "served_version": _served_version,
+            "warming_version": _warming_version,
+            "partitions": [
+                f"{version}: {company or 'Todas'} ({_load_seconds.get((version, company))} s)" for version, company in _partitions
+            ],
+        }
@@ -0,0 +1,195 @@
+# Description: Refresco en segundo plano de los conjuntos de datos del dashboard (stale-while-revalidate).
+#
+# El proceso sirve una única versión de datos a todas las sesiones. Un hilo de fondo comprueba cada
+# REFRESH_INTERVAL_S segundos la huella de MongoDB (ver scripts.data_processing.check_data_version) y, si los
+# datos han cambiado, construye los conjuntos de datos de la nueva versión mientras las sesiones siguen usando
+# los de la versión servida; al terminar, la versión servida se sustituye de una sola vez. Sólo la primera carga
+# del proceso (el calentamiento) espera a que se construyan los datos; con el hilo desactivado, la recarga se lanza
+# en un hilo aparte desde la petición que detecta el cambio, que tampoco la espera. En modo "shared" (ver scripts.snapshots) el
+# hilo no consulta MongoDB: sigue la instantánea que publica el proceso publicador, así que en ese modo conviene un
+# REFRESH_INTERVAL_S corto (leer el fichero CURRENT no cuesta nada).
+import threading
+import time
+from datetime import datetime
+import streamlit as st
+from scripts.data_processing import (
+    VERSION_CHECK_INTERVAL_S, check_data_version, get_data_version, set_data_version, load_dimensions, drop_raw_versions
+)
+from scripts.snapshots import SNAPSHOT_MODE, load_datasets, serving_snapshot, published_version
+from scripts.memo import invalidate_memo
+from scripts.object_ids import prune_object_ids
+from scripts.shared_datasets import freeze_dataset
+from scripts.partitions import PARTITIONS_ENABLED, start_warming, warm_partitions, drop_partitions
+
+# Configuración (sección [refresh] de secrets.toml); con ENABLED = false los datos se comprueban dentro de la propia
+# petición, como mucho cada VERSION_CHECK_INTERVAL_S segundos, y se recargan en un hilo aparte
+REFRESH_ENABLED = bool(st.secrets.get("refresh", {}).get("ENABLED", True))
+REFRESH_INTERVAL_S = int(st.secrets.get("refresh", {}).get("INTERVAL_S", VERSION_CHECK_INTERVAL_S))
+
+# Versión servida: {"version", "datasets", "as_of", "seconds"}; los datos son de sólo lectura y todas las sesiones
+# usan los mismos objetos (ver scripts.shared_datasets)
+_served = None
+_served_lock = threading.Lock()
+# Sólo se construye una versión a la vez (calentamiento, refresco en segundo plano o recarga síncrona)
+_build_lock = threading.Lock()
+
+_refresher = None
+_refresher_lock = threading.Lock()
+# Recarga lanzada desde una petición cuando el hilo de refresco está desactivado (ver get_served_datasets)
+_reload = None
+_wake = threading.Event()
+_refresh_stats = {"refreshes": 0, "errors": 0, "last_error": None, "refreshing": False, "last_check": None}
+_refresh_stats_lock = threading.Lock()
+
+
+def _update_stats(**values):
+    """Actualiza las estadísticas del refresco."""
+    with _refresh_stats_lock:
+        _refresh_stats.update(values)
+
+
+def _build(version):
+    """Construye los conjuntos de datos de una versión y la fecha de los datos.
+
+    La fecha es la de creación de la instantánea si se sirve desde ella y, si no, la del inicio de la carga.
+    Con la carga por empresa (ver scripts.partitions) sólo se cargan las dimensiones ("df_dimensions"); después
+    se recargan para la nueva versión las particiones en caché de la servida, que las sesiones siguen usando
+    mientras tanto: al servir la nueva (ver _serve) ya están cargadas.
+    """
+    start = time.perf_counter()
+    as_of = datetime.now()
+    if PARTITIONS_ENABLED:
+        datasets = freeze_dataset({"df_dimensions": load_dimensions(version)})
+        warm_partitions(version, start_warming(version))
+    else:
+        datasets = freeze_dataset(load_datasets(version))
+    manifest = serving_snapshot(version)
+    if manifest is not None:
+        as_of = datetime.fromisoformat(manifest["created_at"])
+    return {"version": version, "datasets": datasets, "as_of": as_of, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def _serve(served):
+    """Pasa a servir una nueva versión (con sus particiones ya cargadas, ver _build) y después descarta las
+    particiones, las métricas en caché, la capa en bruto y los ObjectId (ver scripts.object_ids.prune_object_ids)
+    de las anteriores. En modo "shared" los ObjectId olvidados son los del proceso publicador, que llegan con la
+    instantánea."""
+    global _served
+    with _served_lock:
+        _served = served
+    partitions = drop_partitions(served["version"])
+    invalidate_memo({data["data_fingerprint"] for data in served["datasets"].values()} | partitions)
+    drop_raw_versions(served["version"])
+    if SNAPSHOT_MODE != "shared":
+        prune_object_ids()
+
+
+def _check_version(force):
+    """Actualiza la versión de datos: en modo "shared", la de la instantánea publicada; si no, la huella de MongoDB."""
+    if SNAPSHOT_MODE == "shared":
+        set_data_version(published_version())
+    else:
+        check_data_version(force=force)
+
+
+def refresh_datasets(force=True):
+    """Comprueba la huella de los datos y, si la versión servida ya no es la actual, construye y sirve la nueva.
+
+    Mientras se construye, las sesiones siguen usando la versión servida; si la carga falla se sigue sirviendo
+    y el error queda en las estadísticas. Devuelve True si se ha pasado a una nueva versión.
+    """
+    with _build_lock:
+        try:
+            _check_version(force)
+            _update_stats(last_check=datetime.now())
+            version = get_data_version()
+            if _served is not None and _served["version"] == version:
+                return False
+            _update_stats(refreshing=True)
+            served = _build(version)
+        except Exception as error:
+            with _refresh_stats_lock:
+                _refresh_stats["errors"] += 1
+                _refresh_stats["last_error"] = repr(error)
+            return False
+        finally:
+            _update_stats(refreshing=False)
+        _serve(served)
+        with _refresh_stats_lock:
+            _refresh_stats["refreshes"] += 1
+        return True
+
+
+def _run():
+    """Bucle del hilo de refresco: comprueba los datos cada REFRESH_INTERVAL_S segundos o cuando se pide."""
+    while True:
+        _wake.wait(REFRESH_INTERVAL_S)
+        _wake.clear()
+        refresh_datasets()
+
+
+def start_refresher():
+    """Arranca (una vez por proceso) el hilo de refresco, salvo que esté desactivado o en modo "offline"."""
+    global _refresher
+    if not REFRESH_ENABLED or SNAPSHOT_MODE == "offline":
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_run, name="data-refresher", daemon=True)
+            _refresher.start()
+
+
+def request_refresh():
+    """Pide al hilo de refresco una comprobación inmediata de los datos, sin esperar a que termine."""
+    _wake.set()
+
+
+def _reload_in_background():
+    """Sin hilo de refresco: construye y sirve la versión actual en un hilo aparte (uno a la vez), para que la
+    petición que detecta el cambio siga con la versión servida en lugar de esperar a la recarga."""
+    global _reload
+    with _refresher_lock:
+        if _reload is None or not _reload.is_alive():
+            _reload = threading.Thread(target=refresh_datasets, kwargs={"force": False}, name="data-reload", daemon=True)
+            _reload.start()
+
+
+def get_served_datasets(refresh=False):
+    """Devuelve la versión servida: {"version", "datasets", "as_of", "seconds"}.
+
+    La primera llamada del proceso construye los datos (calentamiento) y arranca el hilo de refresco.
+    `refresh` (botón "Actualizar datos") pide una comprobación inmediata: con el refresco en segundo plano se
+    hace en el hilo de fondo sin esperar; sin él, en la propia petición, y si los datos cambiaron la recarga se
+    lanza en un hilo aparte (ver _reload_in_background): la petición recibe la versión servida.
+    """
+    if _served is None:
+        with _build_lock:
+            if _served is None:
+                _serve(_build(get_data_version()))
+    start_refresher()
+    if _refresher is not None:
+        if refresh:
+            request_refresh()
+    elif SNAPSHOT_MODE != "offline":
+        _check_version(refresh)
+        if get_data_version() != _served["version"]:
+            _reload_in_background()
+    with _served_lock:
+        return _served
+
+
+def get_refresh_stats():
+    """Devuelve la versión servida, la fecha de sus datos y el estado del refresco en segundo plano."""
+    with _served_lock:
+        served = _served
+    with _refresh_stats_lock:
+        stats = dict(_refresh_stats)
+    return {
+        "enabled": _refresher is not None,
+        "interval_s": REFRESH_INTERVAL_S,
+        "served_version": served["version"] if served else None,
+        "as_of": served["as_of"].isoformat(timespec="seconds") if served else None,
+        "build_seconds": served["seconds"] if served else None,
+        **stats,
+        "last_check": stats["last_check"].isoformat(timespec="seconds") if stats["last_check"] else None,
+    }
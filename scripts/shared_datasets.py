@@ -0,0 +1,86 @@
+# Description: Conjuntos de datos de sólo lectura compartidos por todas las sesiones del proceso.
+#
+# Los DataFrames procesados se cargan una vez por versión de datos (ver scripts.refresher) y todas las sesiones
+# usan los mismos objetos, sin copias. Por eso las métricas no pueden modificarlos: los diccionarios de la vista
+# no admiten asignaciones y, con CHECK_MUTATIONS activo (sección [datasets] de secrets.toml; por defecto sólo en
+# los tests), cada métrica decorada con read_only comprueba que los DataFrames y arrays que recibe siguen igual al
+# terminar.
+import functools
+import hashlib
+import sys
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+DATASETS_CHECK_MUTATIONS = bool(st.secrets.get("datasets", {}).get("CHECK_MUTATIONS", "pytest" in sys.modules))
+
+
+class DatasetMutationError(RuntimeError):
+    """Una métrica ha modificado un conjunto de datos compartido."""
+
+
+class ReadOnlyDataset(dict):
+    """Diccionario de DataFrames de una vista que no admite asignaciones ni borrados.
+
+    copy() devuelve un dict normal, para quien necesite añadir o sustituir tablas en una copia propia.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Los conjuntos de datos se comparten entre sesiones y son de sólo lectura; use .copy()")
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    __ior__ = _read_only
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return ReadOnlyDataset, (dict(self),)
+
+
+def freeze_dataset(data):
+    """Versión de sólo lectura de un diccionario de conjuntos de datos (y de los diccionarios que contiene)."""
+    return ReadOnlyDataset({key: freeze_dataset(value) if isinstance(value, dict) else value for key, value in data.items()})
+
+
+def _digest(values):
+    """Hash del contenido de una Series o un Index (las columnas con listas se comparan por su repr)."""
+    try:
+        hashed = pd.util.hash_pandas_object(values, index=False)
+    except TypeError:
+        hashed = pd.util.hash_pandas_object(pd.Series(values).map(repr), index=False)
+    return hashlib.sha1(hashed.to_numpy().tobytes()).hexdigest()
+
+
+def _state(value):
+    """Identidad, forma y hash del contenido de un valor de un conjunto de datos, para detectar cambios."""
+    if isinstance(value, dict):
+        return {key: _state(item) for key, item in value.items()}
+    if isinstance(value, pd.DataFrame):
+        return (id(value), value.shape, list(map(str, value.columns)), list(map(str, value.dtypes)), _digest(value.index),
+                [_digest(value.iloc[:, i]) for i in range(value.shape[1])])
+    if isinstance(value, (pd.Series, pd.Index)):
+        return (id(value), len(value), str(value.dtype), _digest(value))
+    if isinstance(value, np.ndarray):
+        return (id(value), value.shape, str(value.dtype), hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest())
+    return (id(value), repr(value))
+
+
+def read_only(func):
+    """Con DATASETS_CHECK_MUTATIONS activo, lanza DatasetMutationError si `func` modifica el conjunto de datos
+    que recibe como primer argumento. Desactivado, devuelve la función sin cambios (sin coste)."""
+    if not DATASETS_CHECK_MUTATIONS:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(df, *args, **kwargs):
+        before = _state(df)
+        result = func(df, *args, **kwargs)
+        after = _state(df)
+        changed = sorted(str(key) for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+        if changed:
+            raise DatasetMutationError(f"{func.__qualname__} ha modificado los datos compartidos: {', '.join(changed)}")
+        return result
+
+    return wrapper
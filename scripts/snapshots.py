@@ -0,0 +1,350 @@
+# Description: Instantáneas en disco (Parquet o Arrow) de los datos procesados, para arrancar sin consultar MongoDB
+# y para servir los mismos datos a varias réplicas del dashboard.
+#
+# Uso desde la raíz del proyecto:
+#   python -m scripts.snapshots build      # carga los datos de MongoDB y guarda una nueva instantánea
+#   python -m scripts.snapshots publish    # publica una instantánea Arrow cada vez que cambian los datos (modo "shared")
+#   python -m scripts.snapshots info       # muestra el manifiesto de la instantánea actual
+#
+# En modo "shared" un único proceso publicador consulta MongoDB y publica instantáneas Arrow sin comprimir en un
+# directorio compartido; cada réplica las abre con memory-map (las columnas numéricas no se copian: todas las
+# réplicas comparten las mismas páginas de la caché del sistema) y pasa a la nueva versión cuando cambia CURRENT.
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from bson import ObjectId, json_util
+from scripts.mongo_connector import get_watermarks
+from scripts.object_ids import encode_object_ids, decode_object_ids, get_object_ids, adopt_object_ids, prune_object_ids
+from scripts.data_processing import (
+    load_and_process_data, load_and_process_data_trainings, get_raw_collections, drop_raw_versions,
+    raw_collection_names, get_data_version, check_data_version, set_data_version,
+    view_id_columns, add_derived_tables, DERIVED_TABLES, VERSION_CHECK_INTERVAL_S
+)
+
+# Configuración (sección [snapshots] de secrets.toml)
+# MODE: "off" (sólo MongoDB), "startup" (arranca desde la instantánea y pasa a MongoDB al actualizar),
+#       "offline" (sólo instantáneas, sin MongoDB) o "shared" (sigue las instantáneas que publica
+#       `python -m scripts.snapshots publish`, sin MongoDB)
+# FORMAT: "parquet" (comprimido, para copias de seguridad y arranques) o "arrow" (sin comprimir, con memory-map)
+SNAPSHOT_DIR = st.secrets.get("snapshots", {}).get("DIR", "snapshots")
+SNAPSHOT_MODE = st.secrets.get("snapshots", {}).get("MODE", "off")
+SNAPSHOT_KEEP = int(st.secrets.get("snapshots", {}).get("KEEP", 3))
+SNAPSHOT_FORMAT = st.secrets.get("snapshots", {}).get("FORMAT", "parquet")
+
+# Conjuntos de datos que se guardan en cada instantánea
+snapshot_datasets = {
+    "main": load_and_process_data,
+    "trainings": load_and_process_data_trainings,
+}
+
+def _encode_column(values):
+    """Prepara una columna para Parquet y devuelve (columna, codificación, tipo de nulo).
+
+    Las columnas de tipos nativos se guardan tal cual; los ObjectId como texto; los textos tal cual;
+    y el resto (listas, diccionarios, tipos mezclados) como Extended JSON de BSON.
+    """
+    if values.dtype != object:
+        return values, "native", None
+    null_kinds = {"nan" if isinstance(value, float) else "none" for value in values[values.isna()]}
+    if len(null_kinds) <= 1:
+        null_kind = next(iter(null_kinds), None)
+        non_null = values[values.notna()]
+        if not non_null.empty and all(isinstance(value, ObjectId) for value in non_null):
+            return values.map(lambda value: str(value) if isinstance(value, ObjectId) else None), "objectid", null_kind
+        if all(isinstance(value, str) for value in non_null):
+            return values.where(values.notna(), None), "string", null_kind
+    return values.map(json_util.dumps), "bson", None
+
+
+def _decode_column(values, encoding, null_kind):
+    """Deshace la codificación de _encode_column."""
+    if encoding == "objectid":
+        values = values.map(lambda value: ObjectId(value) if isinstance(value, str) else None)
+    elif encoding == "bson":
+        return values.map(json_util.loads).astype(object)
+    if null_kind == "nan":
+        values = values.astype(object).where(values.notna(), np.nan)
+    return values
+
+
+def _write_table(table, path, snapshot_format):
+    """Escribe una tabla como Parquet comprimido (zstd) o como fichero Arrow IPC sin comprimir."""
+    if snapshot_format == "arrow":
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, path, compression="zstd")
+
+
+def _read_table(path):
+    """Lee una tabla de una instantánea con memory-map; las Arrow se convierten a pandas sin copiar las columnas numéricas."""
+    if path.endswith(".arrow"):
+        return pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas(split_blocks=True)
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+
+def save_snapshot(datasets, watermarks=None, snapshot_dir=SNAPSHOT_DIR, data_version=None, snapshot_format=SNAPSHOT_FORMAT):
+    """Guarda los conjuntos de datos en una nueva instantánea y la marca como actual.
+
+    Cada DataFrame se escribe como un Parquet comprimido (zstd) o, con `snapshot_format="arrow"`, como un
+    fichero Arrow sin comprimir que los lectores abren con memory-map. El manifiesto guarda el esquema,
+    las filas, la fecha de carga y las marcas de agua de las colecciones de origen. La instantánea
+    se escribe en un directorio temporal y se publica sustituyendo el fichero CURRENT, de modo que
+    los lectores nunca ven una instantánea a medias. En Parquet los ids codificados se guardan como ObjectId,
+    porque los códigos sólo son válidos dentro del proceso que los asignó; en Arrow se guardan los códigos
+    junto con la lista de ObjectId del proceso (object_ids.arrow), que los lectores adoptan al cargarla.
+    """
+    # Los ids se ordenan como las fechas de creación (microsegundos con ceros a la izquierda): prune_snapshots
+    # los ordena como texto
+    now = datetime.now()
+    snapshot_id = now.strftime("%Y%m%d-%H%M%S-%f")
+    tmp_path = os.path.join(snapshot_dir, f".tmp-{snapshot_id}")
+    os.makedirs(tmp_path, exist_ok=True)
+    manifest = {
+        "snapshot_id": snapshot_id,
+        "data_version": data_version,
+        "created_at": now.isoformat(timespec="seconds"),
+        "format": snapshot_format,
+        "watermarks": watermarks or {},
+        "datasets": {},
+    }
+    for name, df in datasets.items():
+        os.makedirs(os.path.join(tmp_path, name), exist_ok=True)
+        manifest["datasets"][name] = {}
+        for col, data in df.items():
+            if col in DERIVED_TABLES:
+                continue
+            encoded, schema = {}, {}
+            ids = [column for column in view_id_columns(name, col) if column in data.columns]
+            # En Arrow las columnas de códigos escalares se guardan tal cual (las de listas, como ObjectId)
+            codes = [column for column in ids if snapshot_format == "arrow" and data[column].dtype != object]
+            for column in data.columns:
+                values = decode_object_ids(data[column]) if column in ids and column not in codes else data[column]
+                encoded[column], encoding, null_kind = _encode_column(values)
+                schema[column] = {
+                    "dtype": str(data[column].dtype), "encoding": encoding, "null": null_kind,
+                    "ids": column in ids and column not in codes, "codes": column in codes,
+                }
+            table = pa.Table.from_pandas(pd.DataFrame(encoded, index=data.index, columns=data.columns), preserve_index=True)
+            file_name = f"{name}/{col}.{'arrow' if snapshot_format == 'arrow' else 'parquet'}"
+            _write_table(table, os.path.join(tmp_path, file_name), snapshot_format)
+            manifest["datasets"][name][col] = {"file": file_name, "rows": len(data), "columns": schema}
+    if snapshot_format == "arrow":
+        object_ids = pa.array([value.binary if value is not None else None for value in get_object_ids()], type=pa.binary(12))
+        _write_table(pa.table({"object_id": object_ids}), os.path.join(tmp_path, "object_ids.arrow"), "arrow")
+        manifest["object_ids"] = "object_ids.arrow"
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+
+    os.replace(tmp_path, os.path.join(snapshot_dir, snapshot_id))
+    current_tmp = os.path.join(snapshot_dir, "CURRENT.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(snapshot_id)
+    os.replace(current_tmp, os.path.join(snapshot_dir, "CURRENT"))
+    prune_snapshots(snapshot_dir)
+    return manifest
+
+
+def prune_snapshots(snapshot_dir=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """Borra las instantáneas antiguas, conservando las `keep` más recientes y la actual."""
+    current = read_manifest(snapshot_dir)
+    snapshots = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if os.path.isfile(os.path.join(snapshot_dir, name, "manifest.json"))
+    )
+    for name in snapshots[:-keep] if keep > 0 else snapshots:
+        if current is None or name != current["snapshot_id"]:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+
+def read_manifest(snapshot_dir=SNAPSHOT_DIR):
+    """Devuelve el manifiesto de la instantánea actual, o None si no hay ninguna."""
+    try:
+        with open(os.path.join(snapshot_dir, "CURRENT"), encoding="utf-8") as f:
+            snapshot_id = f.read().strip()
+        with open(os.path.join(snapshot_dir, snapshot_id, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remap_codes(values, mapping):
+    """Traduce una columna de códigos de otro proceso a los de este (los nulos y los códigos olvidados pasan a nulos)."""
+    if mapping is None:
+        return values
+    codes = mapping[values.to_numpy(dtype="int64", na_value=0)]
+    missing = values.isna().to_numpy() | (codes < 0)
+    codes = pd.Series(codes, index=values.index, name=values.name)
+    return codes.astype("Int64").mask(missing) if missing.any() else codes
+
+
+def load_snapshot(snapshot_id, snapshot_dir=SNAPSHOT_DIR):
+    """Carga los conjuntos de datos de una instantánea (los ficheros se leen con memory-map).
+
+    Las columnas de ids guardadas como ObjectId se vuelven a codificar con los códigos del proceso (ver
+    scripts.object_ids); las guardadas como códigos (Arrow) se usan tal cual si el proceso adopta los códigos
+    del publicador, o se traducen si no. Las tablas derivadas (dimensión de usuarios, cubo de recurrencia)
+    se reconstruyen. Límite: sólo las columnas numéricas de Arrow se comparten entre réplicas; las de objetos
+    (textos, listas, BSON) y las tablas derivadas ocupan memoria propia en cada réplica. La huella de los datos es la de la instantánea, así que la caché de métricas en disco
+    sigue valiendo tras reiniciar.
+    """
+    path = os.path.join(snapshot_dir, snapshot_id)
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    mapping = None
+    if manifest.get("object_ids"):
+        object_ids = pa.ipc.open_file(pa.memory_map(os.path.join(path, manifest["object_ids"]))).read_all()
+        mapping = adopt_object_ids([
+            ObjectId(value) if value is not None else None for value in object_ids.column("object_id").to_pylist()
+        ])
+    datasets = {}
+    for name, collections in manifest["datasets"].items():
+        datasets[name] = {}
+        for col, info in collections.items():
+            data = _read_table(os.path.join(path, info["file"]))
+            for column, schema in info["columns"].items():
+                if schema["encoding"] != "native":
+                    data[column] = _decode_column(data[column], schema["encoding"], schema["null"])
+                elif schema.get("codes") and mapping is not None:
+                    data[column] = _remap_codes(data[column], mapping)
+            datasets[name][col] = data
+        datasets[name] = encode_object_ids(datasets[name], {
+            col: [column for column, schema in info["columns"].items() if schema.get("ids")]
+            for col, info in collections.items()
+        })
+        add_derived_tables(datasets[name], name)
+        datasets[name]["data_fingerprint"] = f"{name}:snapshot:{snapshot_id}"
+    return datasets
+
+
+def build_snapshot(snapshot_dir=SNAPSHOT_DIR, snapshot_format=SNAPSHOT_FORMAT, data_version=None):
+    """Carga los datos de MongoDB con los loaders habituales y guarda una nueva instantánea.
+
+    La versión de datos de la instantánea es la huella actual de MongoDB (ver check_data_version),
+    que se comprueba aquí salvo que se indique `data_version`.
+    """
+    if data_version is None:
+        check_data_version(force=True)
+        data_version = get_data_version()
+    datasets = {name: loader(data_version) for name, loader in snapshot_datasets.items()}
+    raw = get_raw_collections(raw_collection_names, data_version)
+    watermarks = {}
+    for col, data in raw.items():
+        if "_id" in data.columns:
+            data = data.assign(_id=decode_object_ids(data["_id"]))
+        updated_at, max_id = get_watermarks(data)
+        watermarks[col] = {"updatedAt": updated_at, "_id": max_id, "rows": len(data)}
+    return save_snapshot(datasets, watermarks, snapshot_dir, data_version, snapshot_format)
+
+
+def publish_snapshots(snapshot_dir=SNAPSHOT_DIR, interval=VERSION_CHECK_INTERVAL_S):
+    """Proceso publicador del modo "shared": cada `interval` segundos comprueba la huella de MongoDB y,
+    si no coincide con la de la instantánea actual, publica una nueva instantánea Arrow.
+
+    Es el único proceso que consulta MongoDB, así que la carga sobre MongoDB no depende del nº de réplicas;
+    al seguir vivo entre versiones, las cargas siguientes son incrementales (ver INCREMENTAL_SYNC).
+    Si una publicación falla (MongoDB no responde, disco lleno...) se muestra el error y se reintenta tras una
+    espera que se duplica con cada fallo seguido, hasta 8 veces `interval`; las réplicas siguen con la
+    instantánea actual.
+    """
+    failures = 0
+    while True:
+        try:
+            check_data_version(force=True)
+            data_version = get_data_version()
+            manifest = read_manifest(snapshot_dir)
+            if manifest is None or manifest.get("data_version") != data_version or manifest.get("format") != "arrow":
+                start = time.perf_counter()
+                manifest = build_snapshot(snapshot_dir, "arrow", data_version)
+                print(f"Instantánea {manifest['snapshot_id']} publicada en {time.perf_counter() - start:.1f} s", flush=True)
+                # La capa en bruto sólo conserva la versión publicada. Los lectores olvidan los mismos ObjectId al
+                # adoptar los códigos de la siguiente instantánea
+                drop_raw_versions(data_version)
+                prune_object_ids()
+            failures = 0
+        except Exception as error:
+            failures += 1
+            print(f"Error al publicar la instantánea ({failures} seguidos): {error!r}", flush=True)
+        time.sleep(interval * min(2 ** failures, 8))
+
+
+def serving_snapshot(data_version):
+    """Manifiesto de la instantánea con la que se sirve una versión de datos (None si se sirve desde MongoDB).
+
+    En modo "startup" se sirve la instantánea mientras la versión de datos sea la suya (el proceso arranca
+    con ella) y se pasa a MongoDB cuando la huella de los datos cambia. En modos "offline" y "shared" siempre
+    se sirve la instantánea actual.
+    """
+    manifest = read_manifest() if SNAPSHOT_MODE in ("startup", "offline", "shared") else None
+    if manifest is not None and (SNAPSHOT_MODE in ("offline", "shared") or data_version == manifest.get("data_version")):
+        return manifest
+    return None
+
+
+def load_datasets(data_version):
+    """Devuelve los conjuntos de datos del dashboard desde la instantánea o desde MongoDB según SNAPSHOT_MODE
+    (ver serving_snapshot). En modos "offline" y "shared" nunca se consulta MongoDB.
+    """
+    manifest = serving_snapshot(data_version)
+    if manifest is not None:
+        datasets = load_snapshot(manifest["snapshot_id"])
+        return {"df": datasets["main"], "df_trainings": datasets["trainings"], "df_cumplimentacion": datasets["main"]}
+    if SNAPSHOT_MODE in ("offline", "shared"):
+        raise FileNotFoundError(f"No hay ninguna instantánea en {SNAPSHOT_DIR} (ejecute python -m scripts.snapshots build o publish)")
+    main = load_and_process_data(data_version)
+    return {"df": main, "df_trainings": load_and_process_data_trainings(data_version), "df_cumplimentacion": main}
+
+
+def published_version():
+    """Versión de datos del modo "shared": el id de la instantánea publicada actual (o "shared" si aún no hay)."""
+    manifest = read_manifest()
+    return manifest["snapshot_id"] if manifest is not None else "shared"
+
+
+# En modos "startup" y "offline" el proceso arranca con la versión de datos de la instantánea actual, sin consultar
+# MongoDB; en "startup" la primera comprobación de cambios se hace VERSION_CHECK_INTERVAL_S segundos después.
+# En modo "shared" la versión es la instantánea publicada (ver scripts.refresher)
+if SNAPSHOT_MODE == "shared":
+    set_data_version(published_version())
+elif SNAPSHOT_MODE in ("startup", "offline"):
+    _manifest = read_manifest()
+    if _manifest is not None and _manifest.get("data_version"):
+        set_data_version(_manifest["data_version"])
+    elif SNAPSHOT_MODE == "offline":
+        set_data_version("offline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Instantáneas en disco de los datos del dashboard")
+    parser.add_argument("command", choices=["build", "publish", "info"],
+                        help="build: crea o refresca la instantánea; publish: publica instantáneas Arrow al cambiar los datos; info: muestra la actual")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="Directorio de las instantáneas")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default=SNAPSHOT_FORMAT, help="Formato de la instantánea (build)")
+    parser.add_argument("--interval", type=int, default=VERSION_CHECK_INTERVAL_S, help="Segundos entre comprobaciones (publish)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        manifest = build_snapshot(args.dir, args.format)
+        print(f"Instantánea {manifest['snapshot_id']} guardada en {time.perf_counter() - start:.1f} s")
+    elif args.command == "publish":
+        publish_snapshots(args.dir, args.interval)
+    else:
+        manifest = read_manifest(args.dir)
+        if manifest is None:
+            print(f"No hay ninguna instantánea en {args.dir}")
+        else:
+            print(json.dumps({
+                "snapshot_id": manifest["snapshot_id"],
+                "created_at": manifest["created_at"],
+                "rows": {name: {col: info["rows"] for col, info in cols.items()} for name, cols in manifest["datasets"].items()},
+                "watermarks": manifest["watermarks"],
+            }, ensure_ascii=False, indent=2))
@@ -0,0 +1,62 @@
+# Description: Contenido de los entrenamientos (acciones, cuadernos, afirmaciones y traducciones) en tablas planas.
+#
+# Cada documento de entrenamiento tiene varias listas anidadas independientes (elementos, acciones, afirmaciones
+# del cuestionario...). En lugar de explotarlas en cadena, que genera el producto cartesiano de todas las listas de
+# cada entrenamiento, y normalizar el resultado, se recorre cada entrenamiento una vez y se emite una tabla plana
+# por tipo de contenido con el namedId del entrenamiento: su tamaño es lineal en el número de elementos.
+# Las tablas se construyen una vez por versión de datos al cargar la vista de entrenamientos (df["training_content"]).
+import pandas as pd
+
+# Columnas de cada tabla: el namedId del entrenamiento, el _id del elemento y los ObjectId de sus traducciones
+training_content_columns = {
+    "actions": ["namedId", "_id", "name"],
+    "elements": ["namedId", "_id", "title", "firstNote", "secondNote"],
+    "affirmations": ["namedId", "_id", "name"],
+    "translations": ["namedId", "field", "translation"],
+}
+
+
+def _get(document, *path):
+    """Valor de un campo anidado de un documento (None si falta algún nivel)."""
+    for key in path:
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+def _items(value):
+    """Diccionarios de una lista de un documento (ninguno si el campo falta o no es una lista)."""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def _column(trainings, column):
+    """Valores de una columna de los entrenamientos (None en todas las filas si la colección no la tiene)."""
+    return trainings[column].tolist() if column in trainings.columns else [None] * len(trainings)
+
+
+def build_training_content(trainings):
+    """Recorre cada entrenamiento una vez y devuelve {tabla: DataFrame} con las tablas de training_content_columns.
+
+    - actions: acciones ("¿Y ahora qué?") con el ObjectId de la traducción de su nombre.
+    - elements: elementos (cuadernos) con las traducciones de su título y de sus notas primera y segunda.
+    - affirmations: afirmaciones del cuestionario con la traducción de su nombre.
+    - translations: traducciones del propio entrenamiento (campo -> ObjectId de la traducción).
+    """
+    rows = {table: [] for table in training_content_columns}
+    for named_id, elements, actions, questionnaire, translations in zip(
+        _column(trainings, "namedId"), _column(trainings, "elements"), _column(trainings, "actions"),
+        _column(trainings, "questionnaire"), _column(trainings, "translations")
+    ):
+        for action in _items(actions):
+            rows["actions"].append((named_id, action.get("_id"), _get(action, "translations", "name")))
+        for element in _items(elements):
+            rows["elements"].append((
+                named_id, element.get("_id"), _get(element, "translations", "title"),
+                _get(element, "firstNote", "translations", "name"), _get(element, "secondNote", "translations", "name")
+            ))
+        for affirmation in _items(_get(questionnaire, "affirmations")):
+            rows["affirmations"].append((named_id, affirmation.get("_id"), _get(affirmation, "translations", "name")))
+        if isinstance(translations, dict):
+            rows["translations"] += [(named_id, field, translation) for field, translation in translations.items()]
+    return {table: pd.DataFrame(rows[table], columns=columns) for table, columns in training_content_columns.items()}
\ No newline at end of file
@@ -0,0 +1,51 @@
+# Description: Índice de traducciones (ObjectId -> texto en cada idioma) de la vista de entrenamientos.
+#
+# Los textos de entrenamientos y encuestas (nombres de acciones, títulos de cuadernos, afirmaciones, preguntas)
+# son ObjectId de la colección de traducciones, cuyo "content" tiene un texto por idioma. El índice se construye
+# una vez por versión de datos (df["translation_index"]): un pd.Index de los ObjectId y un array de textos por
+# idioma, alineados. Traducir una columna de ids es una búsqueda en el índice por hash y un take, sin normalizar
+# ni convertir a texto toda la colección; todos los idiomas cuestan lo mismo.
+import numpy as np
+import pandas as pd
+
+# Idioma de los textos del dashboard
+DEFAULT_LANGUAGE = "es"
+
+
+def build_translation_index(translations):
+    """Índice de la colección de traducciones: {"ids": pd.Index de ObjectId, "content": {idioma: array de textos}}.
+
+    Los textos que faltan en un idioma son NaN. Si un ObjectId se repite, cuenta su primera traducción.
+    """
+    if translations.empty or "_id" not in translations.columns:
+        return {"ids": pd.Index([], dtype=object), "content": {}}
+    translations = translations.drop_duplicates(subset="_id")
+    contents = translations["content"].tolist() if "content" in translations.columns else [None] * len(translations)
+    languages = sorted({language for content in contents if isinstance(content, dict) for language in content})
+    return {
+        "ids": pd.Index(translations["_id"], dtype=object),
+        "content": {
+            language: np.array([
+                content.get(language, np.nan) if isinstance(content, dict) else np.nan for content in contents
+            ], dtype=object)
+            for language in languages
+        },
+    }
+
+
+def translate(translation_index, ids, language=DEFAULT_LANGUAGE, fallback=DEFAULT_LANGUAGE):
+    """Textos en `language` de una columna (o lista) de ObjectId de traducciones.
+
+    Los textos que no existen en `language` se toman de `fallback`; NaN si tampoco hay traducción.
+    """
+    ids = pd.Series(ids, dtype=object)
+    texts = np.full(len(ids), np.nan, dtype=object)
+    if len(ids):
+        positions = translation_index["ids"].get_indexer(ids)
+        found = positions >= 0
+        for lang in dict.fromkeys([language, fallback]):
+            content = translation_index["content"].get(lang)
+            if content is not None:
+                missing = found & pd.isna(texts)
+                texts[missing] = content[positions[missing]]
+    return pd.Series(texts, index=ids.index, dtype=object)
\ No newline at end of file
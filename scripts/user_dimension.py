@@ -0,0 +1,96 @@
+# Description: Dimensión de usuarios (usuarios × grupos × empresas) e índices por empresa y grupo.
+#
+# La dimensión se construye una vez por versión de datos al cargar cada vista y se guarda en el propio
+# diccionario de DataFrames (df["user_dim"] y df["user_index"]). Las métricas seleccionan los usuarios
+# de una empresa o grupo con una búsqueda en los índices, en lugar de volver a unir usuarios, grupos y empresas.
+import numpy as np
+import pandas as pd
+
+# Claves del diccionario de la vista que no son colecciones (no se guardan en las instantáneas)
+USER_DIMENSION_KEYS = ("user_dim", "user_index")
+
+
+def build_user_dimension(df, view):
+    """Une usuarios, grupos y empresas de una vista y devuelve (dimensión, columna de usuario).
+
+    Cada vista conserva su forma de unir: en "main" los usuarios sin grupo o empresa se mantienen (left);
+    en "trainings" sólo los usuarios cuyo grupo y empresa existen y coinciden (inner).
+    """
+    if view == "main":
+        if df["users"].empty:
+            return pd.DataFrame(columns=["user_id", "group_name", "company_name"]), "user_id"
+        return df["users"].merge(df["groups"], how="left").merge(df["companies"], how="left"), "user_id"
+
+    if df["users"].empty:
+        return pd.DataFrame(columns=["user", "company", "group", "group_name", "company_name"]), "user"
+    df_companies = df["companies"][["_id", "name"]].rename(columns={"_id": "company", "name": "company_name"})
+    df_groups = df["groups"][["_id", "name", "company"]].rename(columns={"_id": "group", "name": "group_name"})
+    df_users = df["users"][[
+        "_id", "email", "firstName", "lastName", "company", "group", "hasUnlockedCoach"
+    ]].rename(columns={"_id": "user"}).merge(df_groups).merge(df_companies)
+    return df_users, "user"
+
+
+def _name_index(names, strip=False):
+    """{nombre (sin espacios en los extremos con `strip`): posiciones de sus filas en la dimensión}."""
+    names = names.astype(object)
+    if strip:
+        names = names.str.strip()
+    return names.groupby(names).indices
+
+
+def build_user_index(dim, key):
+    """Índices de la dimensión: usuario -> posición, y empresa / grupo -> posiciones de sus usuarios, por el
+    nombre exacto y por el nombre sin espacios en los extremos ("stripped")."""
+    return {
+        "key": key,
+        "users": pd.Index(dim[key]),
+        "company_name": _name_index(dim["company_name"]),
+        "group_name": _name_index(dim["group_name"]),
+        "stripped": {
+            "company_name": _name_index(dim["company_name"], strip=True),
+            "group_name": _name_index(dim["group_name"], strip=True),
+        },
+    }
+
+
+def add_user_dimension(df, view):
+    """Añade al diccionario de la vista la dimensión de usuarios y sus índices."""
+    dim, key = build_user_dimension(df, view)
+    df["user_dim"] = dim
+    df["user_index"] = build_user_index(dim, key)
+    return df
+
+
+def select_users(df, company_name=None, group_name=None, strip=False):
+    """Posiciones en df["user_dim"] de los usuarios de una empresa y/o grupo, o None si no se filtra.
+
+    Los nombres se comparan tal cual o, con `strip`, sin espacios en los extremos (los de la dimensión y los pedidos).
+    """
+    index = df["user_index"]["stripped"] if strip else df["user_index"]
+    if strip:
+        company_name = company_name.strip() if company_name else None
+        group_name = group_name.strip() if group_name else None
+    positions = None
+    if company_name:
+        positions = index["company_name"].get(company_name, np.empty(0, dtype=np.intp))
+    if group_name:
+        group_positions = index["group_name"].get(group_name, np.empty(0, dtype=np.intp))
+        positions = group_positions if positions is None else np.intersect1d(positions, group_positions)
+    return positions
+
+
+def users_of(df, company_name=None, group_name=None, strip=False):
+    """Filas de la dimensión de usuarios de una empresa y/o grupo (todas si no se filtra; `strip` como en select_users)."""
+    positions = select_users(df, company_name, group_name, strip)
+    return df["user_dim"] if positions is None else df["user_dim"].take(positions)
+
+
+def user_columns(df, positions, columns):
+    """Columnas de la dimensión para cada posición (NaN donde la posición es -1)."""
+    return df["user_dim"][columns].reset_index(drop=True).reindex(positions)
+
+
+def user_positions(df, user_ids):
+    """Posición en df["user_dim"] de cada id de usuario (-1 si el usuario no está en la dimensión)."""
+    return df["user_index"]["users"].get_indexer(user_ids)
\ No newline at end of file
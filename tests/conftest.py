@@ -0,0 +1,143 @@
+# Description: Datos de prueba en un MongoDB en memoria (mongomock) para los tests de carga y de métricas.
+#
+# Los tests se ejecutan desde la raíz del proyecto (python -m pytest), que es donde Streamlit busca
+# .streamlit/secrets.toml. Cada test usa una base de datos nueva y una versión de datos propia: no comparte
+# la capa en bruto, la sincronización incremental ni la caché de métricas con los demás.
+import datetime as dt
+import os
+import sys
+from collections import OrderedDict
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+mongomock = pytest.importorskip("mongomock")
+from bson import ObjectId
+
+TRAININGS = ["valor-ser-curioso", "mis-monstruos", "circulos-influencia"]
+TEXTS = ["ok", "", "nada", "me ha gustado mucho", "cambiaría el formato del vídeo", "excelente contenido práctico"]
+
+
+def build_database(db_name, users_per_group=4):
+    """Base de datos `db_name` de prueba: tres empresas (una excluida), dos grupos por empresa (uno excluido) y,
+    para cada usuario, conexiones, progreso, respuestas de entrenamientos y un hilo del coach."""
+    client = mongomock.MongoClient()
+    db = client[db_name]
+    base = dt.datetime(2025, 1, 6, 9, 0)
+    docs = {name: [] for name in [
+        "companies", "groups", "users", "connections", "progress", "modules", "episodes", "exercises",
+        "answers", "translations", "surveys", "trainings", "threads", "sessions", "actions", "feedback"
+    ]}
+
+    def translation(text):
+        doc = {"_id": ObjectId(), "namedId": f"t-{len(docs['translations'])}", "content": {"es": text, "en": f"{text} (en)"}}
+        docs["translations"].append(doc)
+        return doc["_id"]
+
+    for name in ["transformacion-intrapersonal", "transformacion-interpersonal"]:
+        docs["modules"].append({"_id": ObjectId(), "namedId": name})
+    for i in range(2):
+        docs["episodes"].append({"_id": ObjectId(), "namedId": f"ep{i}", "isExclusiveToManagers": False, "replaces": None,
+                                 "startDate": base + dt.timedelta(days=30 * i)})
+    for i, name in enumerate(["capacidades-adaptacion", "conoce-ego", "feedback", "mapa-relaciones"]):
+        docs["exercises"].append({"_id": ObjectId(), "namedId": name, "modules": [docs["modules"][i % 2]["_id"]],
+                                  "episodes": [docs["episodes"][i % 2]["_id"]], "isExclusiveToManagers": False, "replaces": None})
+
+    questions = [{"_id": ObjectId(), "translations": {"title": translation(title)}} for title in [
+        "¿Te ha resultado claro?", "¿Te ha sido útil el contenido de este entrenamiento?",
+        "¿Cambiarías alguna cosa del entrenamiento?"
+    ]]
+    docs["surveys"].append({"_id": ObjectId(), "questions": questions})
+    content = {}
+    for named_id in TRAININGS:
+        actions = [{"_id": ObjectId(), "translations": {"name": translation(f"Acción {named_id} {j}")}} for j in range(2)]
+        one = {"_id": ObjectId(), "translations": {"title": translation(f"Cuaderno {named_id}")}}
+        two = {"_id": ObjectId(), "translations": {"title": translation(f"Cuaderno doble {named_id}")},
+               "firstNote": {"translations": {"name": translation(f"Nota 1 {named_id}")}},
+               "secondNote": {"translations": {"name": translation(f"Nota 2 {named_id}")}}}
+        affirmations = [{"_id": ObjectId(), "translations": {"name": translation(f"Afirmación {named_id} {j}")}} for j in range(2)]
+        docs["trainings"].append({
+            "_id": ObjectId(), "namedId": named_id, "steps": [{"x": 1}, {"x": 2}], "elements": [one, two], "ideas": [{"i": 1}],
+            "actions": actions, "questionnaire": {"affirmations": affirmations}, "survey": docs["surveys"][0]["_id"],
+            "translations": {"name": translation(named_id)}
+        })
+        content[named_id] = (actions, one, two, affirmations)
+
+    n = 0
+    for company_name in ["Acme", "Globex", "Auren"]:
+        company = {"_id": ObjectId(), "name": company_name}
+        docs["companies"].append(company)
+        for group_name in ["Equipo A", "Cumplimentación"]:
+            group = {"_id": ObjectId(), "name": group_name, "company": company["_id"]}
+            docs["groups"].append(group)
+            for _ in range(users_per_group):
+                n += 1
+                user = {"_id": ObjectId(), "group": group["_id"], "company": company["_id"], "email": f"u{n}@x.com",
+                        "firstName": f"Nombre{n}", "lastName": f"Apellido{n}", "roles": ["user"], "hasUnlockedCoach": n % 2 == 0}
+                docs["users"].append(user)
+                _add_user_facts(docs, user, n, base, content, questions)
+    for name, collection_docs in docs.items():
+        db[name].insert_many(collection_docs or [{"_id": ObjectId()}])
+    return client
+
+
+def _add_user_facts(docs, user, n, base, content, questions):
+    """Conexiones, progreso, respuestas e hilo del coach del usuario número `n`."""
+    for k in range(n % 5 + 1):
+        start = base + dt.timedelta(days=9 * k + n, hours=n % 7)
+        docs["connections"].append({"_id": ObjectId(), "user": user["_id"], "address": "1.2.3.4", "startDate": start,
+                                    "endDate": start + dt.timedelta(minutes=10 + n), "connectionDuration": 10 + n})
+    for k in range(n % 3):
+        date = base + dt.timedelta(days=20 * k + n)
+        docs["progress"].append({"_id": ObjectId(), "user": user["_id"], "type": "progress_checkpoint", "completionDate": date,
+                                 "createdAt": date, "updatedAt": date, "completed": True, "isViewed": True})
+    for k, exercise in enumerate(docs["exercises"][:n % 4 + 1]):
+        docs["progress"].append({"_id": ObjectId(), "user": user["_id"], "type": "progress_exercise", "completionDate": base,
+                                 "createdAt": base, "updatedAt": base, "completed": (n + k) % 3 != 0, "isViewed": True,
+                                 "module": exercise["modules"][0], "exercise": exercise["_id"]})
+    for k, named_id in enumerate(TRAININGS[:n % 3 + 1]):
+        docs["progress"].append({"_id": ObjectId(), "user": user["_id"], "type": "progress_training", "trainingNamedId": named_id,
+                                 "completed": (n + k) % 2 == 0, "createdAt": base, "updatedAt": base})
+        actions, one, two, affirmations = content[named_id]
+        text = TEXTS[(n + k) % len(TEXTS)]
+        docs["answers"].append({"_id": ObjectId(), "user": user["_id"], "type": "answer_survey_training", "trainingNamedId": named_id,
+                                "exercise": None, "items": [
+                                    {"question": questions[0]["_id"], "type": "boolean", "value": n % 2 == 0},
+                                    {"question": questions[1]["_id"], "type": "boolean", "value": (n + k) % 2 == 0},
+                                    {"question": questions[2]["_id"], "type": "input", "input": text},
+                                ]})
+        for action in actions:
+            docs["answers"].append({"_id": ObjectId(), "user": user["_id"], "type": "answer_training_action",
+                                    "trainingNamedId": named_id, "action": action["_id"], "input": text})
+        docs["answers"].append({"_id": ObjectId(), "user": user["_id"], "type": "answer_training_notepad", "trainingNamedId": named_id,
+                                "notepad": one["_id"], "firstNoteInput": text, "secondNoteInput": None})
+        docs["answers"].append({"_id": ObjectId(), "user": user["_id"], "type": "answer_training_notepad", "trainingNamedId": named_id,
+                                "notepad": two["_id"], "firstNoteInput": text, "secondNoteInput": TEXTS[n % len(TEXTS)]})
+        docs["answers"].append({"_id": ObjectId(), "user": user["_id"], "type": "answer_training_questionnaire",
+                                "trainingNamedId": named_id, "endingAffirmationInput": text,
+                                "items": [{"affirmation": a["_id"], "isChecked": (n + j) % 2 == 0} for j, a in enumerate(affirmations)]})
+    docs["answers"].append({"_id": ObjectId(), "user": user["_id"], "type": "answer_exercise",
+                            "exercise": docs["exercises"][n % 4]["_id"], "items": []})
+    messages = [{"date": base + dt.timedelta(days=j), "role": "user" if j % 2 else "assistant", "content": f"m{j}"}
+                for j in range(n % 3 + 1)]
+    docs["threads"].append({"_id": ObjectId(), "user": user["_id"], "messages": messages,
+                            "assistantMessagesAmount": n % 3, "userMessagesAmount": n % 2})
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """Base de datos de prueba servida por scripts.mongo_connector, con una versión de datos nueva."""
+    import scripts.mongo_connector as mongo_connector
+    import scripts.data_processing as data_processing
+    import scripts.connection_rollups as connection_rollups
+
+    client = build_database(mongo_connector.DB_NAME)
+    monkeypatch.setattr(mongo_connector, "_client", client)
+    monkeypatch.setattr(mongo_connector, "_sync_state", {})
+    monkeypatch.setattr(mongo_connector, "_updated_at_info", {})
+    monkeypatch.setattr(data_processing, "_raw_cache", {})
+    monkeypatch.setattr(data_processing, "_sync_bases", {})
+    monkeypatch.setattr(data_processing, "_last_connections", {})
+    monkeypatch.setattr(connection_rollups, "_previous", OrderedDict())
+    data_processing.set_data_version(f"test-{ObjectId()}")
+    return client[mongo_connector.DB_NAME]
\ No newline at end of file
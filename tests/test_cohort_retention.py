@@ -0,0 +1,78 @@
+# Description: Retención semanal por cohortes de check-out (scripts.metrics.calcular_retencion_cohortes) comparada con
+# un cálculo directo con pandas sobre las conexiones unidas con los checkpoints.
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pytest
+from bson import ObjectId
+import scripts.data_processing as data_processing
+import scripts.partitions as partitions
+from scripts.metrics import calcular_retencion_cohortes
+
+FILTERS = [(None, None), ("Acme", None), ("Globex", "Equipo A"), ("Nadie", None)]
+
+
+@pytest.fixture
+def returning(mongo):
+    """Conexiones en distintas semanas tras el último checkpoint de cada usuario que ha terminado el programa."""
+    checkpoints = {}
+    for doc in mongo["progress"].find({"type": "progress_checkpoint"}):
+        checkpoints.setdefault(doc["user"], []).append(doc["completionDate"])
+    for i, (user, dates) in enumerate(sorted(checkpoints.items())):
+        for k in range(i % 4):
+            start = max(dates) + dt.timedelta(days=3 + 8 * k * (i % 3 + 1), hours=i)
+            mongo["connections"].insert_one({"_id": ObjectId(), "user": user, "address": "1.2.3.4", "startDate": start,
+                                             "endDate": start + dt.timedelta(minutes=5), "connectionDuration": 5})
+    return mongo
+
+
+def retencion_referencia(df, company_name=None, group_name=None, semanas=12):
+    """% de usuarios de cada cohorte (lunes de la semana del último checkpoint) conectados en cada semana posterior."""
+    lunes = lambda fechas: fechas.dt.to_period("W-SUN").dt.start_time
+    users = df["user_dim"]
+    if company_name:
+        users = users[users["company_name"] == company_name]
+    if group_name:
+        users = users[users["group_name"] == group_name]
+    progress = df["progress"][df["progress"]["progress_type"] == "progress_checkpoint"]
+    checkout = progress.groupby("user_id")["completionDate"].agg(["size", "max"]).query("size > 1")["max"].dropna()
+    cohortes = lunes(checkout[checkout.index.isin(users["user_id"])]).rename("Cohorte").reset_index()
+
+    conexiones = df["connections"].dropna(subset=["startDate"]).merge(cohortes, on="user_id")
+    conexiones["semana"] = (lunes(conexiones["startDate"]) - conexiones["Cohorte"]).dt.days // 7
+    conexiones = conexiones[conexiones["semana"].between(1, semanas)].drop_duplicates(["user_id", "semana"])
+
+    usuarios = cohortes.groupby("Cohorte").size()
+    retenidos = conexiones.groupby(["Cohorte", "semana"]).size().unstack(fill_value=0)
+    retenidos = retenidos.reindex(index=usuarios.index, columns=range(1, semanas + 1), fill_value=0)
+    retencion = (retenidos.div(usuarios, axis=0) * 100).round(1)
+    ultima = lunes(df["connections"]["startDate"].dropna()).max()
+    for k in range(1, semanas + 1):
+        retencion.loc[retencion.index + pd.Timedelta(weeks=k) > ultima, k] = np.nan
+    retencion.columns = [f"Semana +{k}" for k in range(1, semanas + 1)]
+    retencion.insert(0, "Usuarios", usuarios)
+    return retencion
+
+
+@pytest.mark.parametrize("company_name, group_name", FILTERS)
+def test_cohort_retention_matches_pandas(returning, company_name, group_name):
+    df = data_processing.load_and_process_data()
+    resultado = calcular_retencion_cohortes(df, company_name, group_name)
+    expected = retencion_referencia(df, company_name, group_name)
+    if company_name is None:
+        assert len(resultado) and resultado.iloc[:, 1:].fillna(0).to_numpy().any()
+    pd.testing.assert_frame_equal(resultado, expected, check_dtype=False, check_index_type=False, check_names=False)
+
+
+@pytest.mark.parametrize("company_name", ["Acme", "Globex"])
+def test_partition_matches_the_full_dataset(returning, company_name):
+    # Las conexiones de la empresa terminan antes que las de todos los datos: el horizonte no puede salir de ellas.
+    # La partición se carga antes que la vista completa, sin las conexiones de todos en la capa en bruto
+    partition = partitions.load_partition(company_name, data_processing.get_data_version())["df"]
+    assert ("connections", data_processing.get_data_version()) not in data_processing._raw_cache
+    df = data_processing.load_and_process_data()
+    assert partition["connection_store"]["start"].max() < df["connection_store"]["start"].max()
+
+    pd.testing.assert_frame_equal(
+        calcular_retencion_cohortes(partition, company_name), calcular_retencion_cohortes(df, company_name)
+    )
\ No newline at end of file
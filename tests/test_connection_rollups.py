@@ -0,0 +1,65 @@
+# Description: Agregados de conexiones (scripts.connection_rollups): plegar sólo los cambios entre versiones de datos da
+# lo mismo que agregar de nuevo todas las conexiones.
+import datetime as dt
+import threading
+import pandas as pd
+import pytest
+from bson import ObjectId
+import scripts.connection_rollups as connection_rollups
+import scripts.data_processing as data_processing
+from scripts.connection_rollups import build_connection_rollups, connection_trend
+
+
+def sorted_rollups(rollups):
+    user_days = rollups["user_days"].sort_values(["bucket", "user_id"]).reset_index(drop=True)
+    return user_days, rollups["daily"].sort_index()
+
+
+def change_connections(mongo):
+    """Conexión modificada, movida de día, cambiada de usuario (y de empresa), borrada y nueva."""
+    def users_of(company_name):
+        company = mongo["companies"].find_one({"name": company_name})["_id"]
+        group = mongo["groups"].find_one({"company": company, "name": "Equipo A"})["_id"]
+        return [user["_id"] for user in mongo["users"].find({"group": group})]
+
+    acme_user = max(users_of("Acme"), key=lambda user: mongo["connections"].count_documents({"user": user}))
+    globex_user = users_of("Globex")[0]
+    first, second, third, fourth = mongo["connections"].find({"user": acme_user}).limit(4)
+    mongo["connections"].update_one({"_id": first["_id"]}, {"$set": {"connectionDuration": 500}})
+    mongo["connections"].update_one({"_id": second["_id"]}, {"$set": {"startDate": second["startDate"] + dt.timedelta(days=3)}})
+    mongo["connections"].update_one({"_id": third["_id"]}, {"$set": {"user": globex_user}})
+    mongo["connections"].delete_one({"_id": fourth["_id"]})
+    mongo["connections"].insert_one({"_id": ObjectId(), "user": globex_user, "address": "1.2.3.4",
+                                     "startDate": dt.datetime(2025, 3, 3, 10), "endDate": dt.datetime(2025, 3, 3, 11)})
+
+
+@pytest.mark.parametrize("company_name", [None, "Acme"])
+def test_folded_rollups_match_a_full_build(mongo, monkeypatch, company_name):
+    data_processing.load_and_process_data("v1", company_name)
+    change_connections(mongo)
+
+    folds = []
+    changes = connection_rollups._changes
+    monkeypatch.setattr(connection_rollups, "_changes", lambda *args: folds.append(1) or changes(*args))
+    df = data_processing.load_and_process_data("v2", company_name)
+    assert folds, "la segunda versión debe plegar los cambios sobre la anterior"
+
+    expected = build_connection_rollups(df["connection_store"])
+    for result, full in zip(sorted_rollups(df["connection_rollups"]), sorted_rollups(expected)):
+        pd.testing.assert_frame_equal(result, full, check_dtype=False)
+    for args in [(None, None, "D"), ("Acme", None, "W"), ("Globex", "Equipo A", "M"), (None, None, "W", "2025-01-15", "2025-02-15")]:
+        pd.testing.assert_frame_equal(connection_trend(df["connection_rollups"], *args), connection_trend(expected, *args))
+
+
+def test_segment_keys_are_unique_across_threads(monkeypatch):
+    monkeypatch.setattr(connection_rollups, "_segment_keys", {})
+    monkeypatch.setattr(connection_rollups, "_segment_names", [])
+    segments = pd.DataFrame({"company_name": [f"C{i}" for i in range(200)], "group_name": "G"})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(connection_rollups._segment_key_codes(segments))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(connection_rollups._segment_names) == len(set(connection_rollups._segment_names)) == 201
+    assert all((codes == results[0]).all() for codes in results)
\ No newline at end of file
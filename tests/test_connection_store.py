@@ -0,0 +1,71 @@
+# Description: Almacén indexado de conexiones (scripts.connection_store): los recortes por segmento y rango de fechas
+# dan lo mismo que filtrar la tabla de conexiones unida con la dimensión de usuarios.
+import datetime as dt
+import pandas as pd
+import pytest
+from bson import ObjectId
+import scripts.data_processing as data_processing
+from scripts.connection_store import user_connections
+from scripts.metrics import calcular_metricas_connections
+
+FILTERS = [(None, None), ("Acme", None), ("Globex", "Equipo A"), (None, "Equipo A"), ("Nadie", None)]
+DATES = [(None, None), ("2025-01-10", "2025-03-01"), ("2025-02-01", None), (None, "2025-01-20"), ("2025-01-12", "2025-01-12")]
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+@pytest.fixture
+def connections(mongo):
+    """Conexiones sin duración y sin fecha de inicio, además de las de cada usuario."""
+    users = [user["_id"] for user in mongo["users"].find()]
+    mongo["connections"].insert_many([
+        {"_id": ObjectId(), "user": users[0], "address": "1.2.3.4", "startDate": dt.datetime(2025, 1, 12, 23, 59),
+         "endDate": dt.datetime(2025, 1, 13, 0, 5)},
+        {"_id": ObjectId(), "user": users[1], "address": "1.2.3.4", "startDate": None, "endDate": None, "connectionDuration": 5},
+    ])
+    return mongo
+
+
+def conexiones_referencia(df, company_name=None, group_name=None, fecha_inicio=None, fecha_fin=None):
+    """Cálculo original: conexiones unidas con la dimensión de usuarios y filtradas fila a fila."""
+    conexiones = df["connections"].merge(df["user_dim"][["user_id", "company_name", "group_name"]], how="left", on="user_id")
+    conexiones["company_name"] = conexiones["company_name"].astype(object)
+    if company_name:
+        conexiones = conexiones[conexiones["company_name"] == company_name]
+    if group_name:
+        conexiones = conexiones[conexiones["group_name"] == group_name]
+    if fecha_inicio is not None:
+        conexiones = conexiones[conexiones["startDate"] >= pd.Timestamp(fecha_inicio)]
+    if fecha_fin is not None:
+        conexiones = conexiones[conexiones["startDate"] < pd.Timestamp(fecha_fin) + pd.Timedelta(days=1)]
+
+    por_empresa = conexiones.groupby("company_name", as_index=False).agg({"connectionDuration": "mean"}).sort_values(
+        by="connectionDuration", ascending=False
+    )
+    por_dia = conexiones.assign(day_of_week=conexiones["startDate"].dt.day_name()).groupby("day_of_week")[
+        "connectionDuration"
+    ].count().reset_index()
+    por_dia = por_dia.set_index("day_of_week").reindex([day for day in DAY_ORDER if day in set(por_dia["day_of_week"])])
+    return conexiones["connection_id"].nunique(), conexiones["connectionDuration"].mean(), por_empresa, por_dia.reset_index()
+
+
+@pytest.mark.parametrize("fecha_inicio, fecha_fin", DATES)
+@pytest.mark.parametrize("company_name, group_name", FILTERS)
+def test_range_queries_match_the_joined_table(connections, company_name, group_name, fecha_inicio, fecha_fin):
+    df = data_processing.load_and_process_data()
+    total, duracion_media, por_empresa, por_dia = calcular_metricas_connections(df, company_name, group_name, fecha_inicio, fecha_fin)
+    expected = conexiones_referencia(df, company_name, group_name, fecha_inicio, fecha_fin)
+
+    assert total == expected[0]
+    assert duracion_media == pytest.approx(expected[1], nan_ok=True)
+    pd.testing.assert_frame_equal(por_empresa.reset_index(drop=True), expected[2].reset_index(drop=True), check_dtype=False)
+    pd.testing.assert_frame_equal(por_dia, expected[3], check_dtype=False)
+
+
+def test_user_time_series(connections):
+    df = data_processing.load_and_process_data()
+    store = df["connection_store"]
+    for position, user_id in enumerate(df["user_dim"]["user_id"]):
+        expected = df["connections"][df["connections"]["user_id"] == user_id].sort_values("startDate", kind="stable", na_position="first")
+        pd.testing.assert_frame_equal(
+            user_connections(store, position), expected[["startDate", "connectionDuration"]].reset_index(drop=True), check_dtype=False
+        )
\ No newline at end of file
@@ -0,0 +1,65 @@
+# Description: Versión de datos a partir de la huella de las colecciones (scripts.mongo_connector.get_collection_fingerprint
+# y scripts.data_processing.check_data_version): sólo cambia cuando cambian los datos.
+import datetime as dt
+import time
+import pytest
+import scripts.data_processing as data_processing
+import scripts.mongo_connector as mongo_connector
+from bson import ObjectId
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj de mongo_connector que el test puede adelantar."""
+    now = [time.time()]
+    monkeypatch.setattr(mongo_connector.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def index_calls(monkeypatch):
+    calls = []
+    has_index_on = mongo_connector._has_index_on
+    monkeypatch.setattr(mongo_connector, "_has_index_on", lambda collection, field: calls.append(collection.name) or has_index_on(collection, field))
+    return calls
+
+
+def fingerprint():
+    return data_processing.fingerprint_version(data_processing.get_data_fingerprint(parallel=False))
+
+
+def test_version_does_not_change_with_time_alone(mongo, clock, index_calls):
+    version = fingerprint()
+    assert fingerprint() == version
+    clock[0] += 2 * mongo_connector.FULL_SYNC_INTERVAL_S
+    assert fingerprint() == version
+    # index_information se consulta una vez por colección y periodo, no en cada comprobación
+    assert len(index_calls) == 2 * len(data_processing.raw_collection_names)
+
+
+def test_modified_document_without_index_changes_the_version_after_the_interval(mongo, clock):
+    version = fingerprint()
+    mongo["progress"].update_one({"type": "progress_checkpoint"}, {"$set": {"completed": False, "updatedAt": dt.datetime(2026, 1, 1)}})
+    assert fingerprint() == version
+    clock[0] += mongo_connector.FULL_SYNC_INTERVAL_S
+    assert fingerprint() != version
+
+
+def test_modified_document_with_index_changes_the_version_at_once(mongo, clock):
+    mongo["progress"].create_index("updatedAt")
+    version = fingerprint()
+    mongo["progress"].update_one({"type": "progress_checkpoint"}, {"$set": {"updatedAt": dt.datetime(2026, 1, 1)}})
+    assert fingerprint() != version
+
+
+def test_new_document_changes_the_version(mongo, clock):
+    version = fingerprint()
+    mongo["connections"].insert_one({"_id": ObjectId(), "startDate": dt.datetime(2026, 1, 1)})
+    assert fingerprint() != version
+
+
+def test_invalidate_raw_cache_sets_a_new_version(mongo):
+    data_processing.get_raw_collections(["companies"])
+    version = data_processing.get_data_version()
+    assert data_processing.invalidate_raw_cache() != version
+    assert data_processing.get_data_version() != version and not data_processing._raw_cache
\ No newline at end of file
@@ -0,0 +1,80 @@
+# Description: Sincronización incremental de la capa en bruto (scripts.mongo_connector.sync_collection_data y
+# scripts.data_processing.load_collections): igual que una recarga completa, con una única copia de los datos.
+import datetime as dt
+import threading
+import pandas as pd
+import scripts.data_processing as data_processing
+import scripts.mongo_connector as mongo_connector
+from bson import ObjectId
+
+
+def full_reload(col):
+    """Colección en bruto recién descargada entera, ordenada por _id."""
+    data = data_processing.load_collections(
+        [col], data_processing.raw_projections, data_processing.raw_filters,
+        dtypes=data_processing.raw_dtypes, id_columns=data_processing.id_columns
+    )[col]
+    return data.sort_values("_id").reset_index(drop=True)
+
+
+def raw(col, version):
+    return data_processing.get_raw_collections([col], version)[col]
+
+
+def test_delta_merge_matches_a_full_reload(mongo):
+    raw("progress", "v1")
+    checkpoint = mongo["progress"].find_one({"type": "progress_checkpoint"})
+    mongo["progress"].update_one({"_id": checkpoint["_id"]}, {"$set": {
+        "completionDate": dt.datetime(2025, 6, 1), "updatedAt": dt.datetime(2025, 6, 1)
+    }})
+    moved = mongo["progress"].find_one({"type": "progress_exercise"})
+    mongo["progress"].update_one({"_id": moved["_id"]}, {"$set": {"type": "progress_other", "updatedAt": dt.datetime(2025, 6, 1)}})
+    mongo["progress"].insert_one({
+        "_id": ObjectId(), "user": checkpoint["user"], "type": "progress_checkpoint", "completionDate": dt.datetime(2025, 6, 2),
+        "createdAt": dt.datetime(2025, 6, 2), "updatedAt": dt.datetime(2025, 6, 2), "completed": True, "isViewed": True
+    })
+
+    merged = raw("progress", "v2")
+    stats = mongo_connector.get_sync_stats()["progress"]
+    assert stats["incremental"] and stats["full_syncs"] == 1
+    # Sólo se descargan los documentos cambiados (y los que comparten la marca de agua)
+    assert stats["last_rows"] <= 3
+    expected = full_reload("progress")
+    pd.testing.assert_frame_equal(merged.sort_values("_id").reset_index(drop=True)[expected.columns], expected)
+
+
+def test_collections_without_updated_at_are_reloaded_entirely(mongo):
+    raw("connections", "v1")
+    connection = mongo["connections"].find_one()
+    mongo["connections"].update_one({"_id": connection["_id"]}, {"$set": {"connectionDuration": 999}})
+
+    reloaded = raw("connections", "v2")
+    assert not mongo_connector.get_sync_stats()["connections"]["incremental"]
+    assert mongo_connector.get_sync_stats()["connections"]["full_syncs"] == 2
+    assert (reloaded["connectionDuration"] == 999).sum() == 1
+
+
+def test_one_copy_of_each_collection(mongo):
+    v1 = raw("progress", "v1")
+    assert "data" not in next(iter(mongo_connector._sync_state.values()))
+    assert data_processing._sync_bases["progress"][1] is v1
+    # Sin cambios, la nueva versión es el mismo DataFrame
+    assert raw("progress", "v2") is v1
+
+
+def test_collections_sync_concurrently(mongo, monkeypatch):
+    barrier = threading.Barrier(2, timeout=5)
+    fetch = mongo_connector.get_collection_data
+
+    def get_collection_data(collection_name, *args, **kwargs):
+        if collection_name in ("progress", "answers"):
+            barrier.wait()
+        return fetch(collection_name, *args, **kwargs)
+
+    monkeypatch.setattr(mongo_connector, "get_collection_data", get_collection_data)
+    data = data_processing.load_collections(
+        ["progress", "answers"], data_processing.raw_projections, data_processing.raw_filters, parallel=True,
+        incremental=True, dtypes=data_processing.raw_dtypes, id_columns=data_processing.id_columns, bases={}
+    )
+    assert not barrier.broken
+    assert len(data["progress"]) and len(data["answers"])
\ No newline at end of file
@@ -0,0 +1,47 @@
+# Description: Carga concurrente de colecciones (scripts.data_processing.load_collections): límite de tiempo por
+# colección y cargas parciales.
+import threading
+import time
+import pytest
+import scripts.data_processing as data_processing
+import scripts.mongo_connector as mongo_connector
+
+
+@pytest.fixture
+def hung_threads(mongo, monkeypatch):
+    """La colección threads no responde hasta que termina el test."""
+    release = threading.Event()
+    fetch = data_processing.get_collection_data
+
+    def get_collection_data(collection_name, *args, **kwargs):
+        if collection_name == "threads":
+            release.wait(30)
+        return fetch(collection_name, *args, **kwargs)
+
+    monkeypatch.setattr(data_processing, "get_collection_data", get_collection_data)
+    monkeypatch.setattr(mongo_connector, "get_collection_data", get_collection_data)
+    monkeypatch.setattr(data_processing, "LOAD_TIMEOUT_S", 0.5)
+    yield
+    release.set()
+
+
+def test_a_hung_collection_times_out(hung_threads):
+    start = time.monotonic()
+    with pytest.raises(data_processing.CollectionLoadError) as error:
+        data_processing.load_collections(["companies", "users", "connections", "threads"], parallel=True)
+    assert time.monotonic() - start < 5
+    assert list(error.value.errors) == ["threads"]
+    assert isinstance(error.value.errors["threads"], TimeoutError)
+
+
+def test_partial_load_returns_the_collections_that_loaded(hung_threads):
+    loaded = data_processing.load_collections(["companies", "users", "connections", "threads"], parallel=True, partial=True)
+    assert sorted(loaded) == ["companies", "connections", "users"]
+    assert len(loaded["connections"])
+
+
+def test_partial_raw_layer_does_not_keep_the_failed_collection(hung_threads, monkeypatch):
+    monkeypatch.setattr(data_processing, "PARTIAL_LOAD", True)
+    df = data_processing.load_and_process_data_trainings()
+    assert df["threads"].empty and not df["connections"].empty
+    assert ("threads", data_processing.get_data_version()) not in data_processing._raw_cache
\ No newline at end of file
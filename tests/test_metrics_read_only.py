@@ -0,0 +1,77 @@
+# Description: Las métricas públicas de scripts.metrics no modifican los conjuntos de datos compartidos que reciben.
+#
+# Las vistas procesadas se comparten sin copias entre todas las sesiones (ver scripts.shared_datasets). Cada
+# métrica se llama sobre una vista de sólo lectura, con y sin filtros, y se comprueba con la misma huella que
+# usa CHECK_MUTATIONS (identidad, forma, tipos y hash del contenido de cada tabla) que la vista sigue igual.
+import pandas as pd
+import pytest
+import scripts.data_processing as data_processing
+import scripts.metrics as metrics
+from scripts.shared_datasets import (
+    DATASETS_CHECK_MUTATIONS, DatasetMutationError, ReadOnlyDataset, freeze_dataset, read_only, _state
+)
+
+# (métrica, vista, argumentos): "main" es la vista de recurrencia, conexiones y cumplimentación
+METRIC_CALLS = [
+    ("construir_cubo_recurrencia", "main", ()),
+    ("calcular_metricas_recurrencia", "main", ()),
+    ("calcular_metricas_recurrencia", "main", ("Acme", "Equipo A")),
+    ("calcular_retencion_cohortes", "main", ()),
+    ("calcular_retencion_cohortes", "main", ("Globex", None)),
+    ("calcular_metricas_connections", "main", ()),
+    ("calcular_metricas_connections", "main", ("Acme", None, "2025-01-10", "2025-03-01")),
+    ("calcular_tendencia_conexiones", "main", ()),
+    ("calcular_tendencia_conexiones", "main", ("Acme", "Equipo A", "D")),
+    ("obtener_resumen_progreso", "main", ()),
+    ("obtener_resumen_progreso", "main", ("Acme", None, True)),
+    ("calcular_metricas_entrenamientos", "trainings", ()),
+    ("calcular_metricas_entrenamientos", "trainings", (None, "Acme", "Equipo A")),
+    ("calcular_metricas_coach", "trainings", ()),
+    ("calcular_metricas_coach", "trainings", ("Acme ", None)),
+    ("contar_usuarios_unicos", "trainings", ()),
+    ("contar_usuarios_unicos", "trainings", ("2025-01-01", "Globex", "Equipo A")),
+]
+
+loaders = {
+    "main": data_processing.load_and_process_data,
+    "trainings": data_processing.load_and_process_data_trainings,
+}
+
+
+def public_metrics():
+    """Funciones públicas de scripts.metrics (las que no empiezan por _ y no se importan de otros módulos)."""
+    return sorted(
+        name for name, value in vars(metrics).items()
+        if callable(value) and not name.startswith("_") and getattr(value, "__module__", None) == metrics.__name__
+    )
+
+
+def test_mutating_metric_raises():
+    # Bajo pytest CHECK_MUTATIONS está activo por defecto: toda métrica decorada con read_only se comprueba
+    assert DATASETS_CHECK_MUTATIONS
+
+    @read_only
+    def sorts_in_place(df):
+        df["progress"].sort_values("user_id", ascending=False, inplace=True)
+
+    df = freeze_dataset({"progress": pd.DataFrame({"user_id": [1, 2, 3]})})
+    with pytest.raises(DatasetMutationError, match="progress"):
+        sorts_in_place(df)
+
+
+def test_all_public_metrics_are_checked():
+    assert sorted({name for name, _, _ in METRIC_CALLS}) == public_metrics()
+
+
+@pytest.mark.parametrize("name, view, args", METRIC_CALLS)
+def test_metric_does_not_modify_dataset(mongo, name, view, args):
+    df = freeze_dataset(loaders[view]())
+    assert isinstance(df, ReadOnlyDataset)
+    before = _state(df)
+
+    metrics.__dict__[name](df, *args)
+    assert _state(df) == before
+
+    # Segunda llamada: en las métricas memoizadas, un acierto de la caché tampoco toca los datos
+    metrics.__dict__[name](df, *args)
+    assert _state(df) == before
\ No newline at end of file
@@ -0,0 +1,27 @@
+# Description: Códigos enteros de los ObjectId (scripts.object_ids) y su decodificación en los resultados de las métricas.
+import pandas as pd
+import scripts.data_processing as data_processing
+import scripts.object_ids as object_ids
+from bson import ObjectId
+from scripts.metrics import obtener_resumen_progreso
+
+
+def test_encode_column_after_pruning():
+    ids = [ObjectId() for _ in range(3)]
+    object_ids.register_object_ids(ids)
+    for _ in range(3):
+        object_ids.prune_object_ids()
+    new = ObjectId()
+    object_ids.register_object_ids([new])
+
+    codes = object_ids.encode_column(pd.Series([new, None]))
+    assert str(codes.dtype) == "Int64" and codes.isna().tolist() == [False, True]
+    assert object_ids.decode_object_ids(codes.dropna()).tolist() == [new]
+
+
+def test_progress_summary_returns_object_ids(mongo):
+    _, resumen_ejercicios = obtener_resumen_progreso(data_processing.load_and_process_data(), "Acme")
+    assert len(resumen_ejercicios)
+    for column in ("module_id", "exercise_id"):
+        assert all(isinstance(value, ObjectId) for value in resumen_ejercicios[column])
+    assert set(resumen_ejercicios["exercise_id"]) <= {doc["_id"] for doc in mongo["exercises"].find()}
\ No newline at end of file
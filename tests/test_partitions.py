@@ -0,0 +1,97 @@
+# Description: Carga por empresa (scripts.partitions) y capa en bruto por versión de datos (scripts.data_processing).
+import threading
+import time
+from collections import OrderedDict
+import pytest
+import scripts.data_processing as data_processing
+import scripts.partitions as partitions
+import scripts.refresher as refresher
+from scripts.metrics import calcular_metricas_recurrencia
+
+
+@pytest.fixture
+def partition_cache(monkeypatch):
+    """LRU de particiones vacía, sin versión servida."""
+    monkeypatch.setattr(partitions, "_partitions", OrderedDict())
+    monkeypatch.setattr(partitions, "_partition_stats", dict.fromkeys(partitions._partition_stats, 0))
+    monkeypatch.setattr(partitions, "_loading", {})
+    monkeypatch.setattr(partitions, "_load_seconds", {})
+    monkeypatch.setattr(partitions, "_served_version", None)
+    monkeypatch.setattr(partitions, "_warming_version", None)
+
+
+def test_partition_of_company_without_checkpoints(mongo):
+    company_id = mongo["companies"].find_one({"name": "Globex"})["_id"]
+    user_ids = [user["_id"] for user in mongo["users"].find({"company": company_id})]
+    assert mongo["progress"].delete_many({"type": "progress_checkpoint", "user": {"$in": user_ids}}).deleted_count
+
+    datasets = partitions.load_partition("Globex", data_processing.get_data_version())
+    df = datasets["df"]
+    assert "completionDate" in df["progress"].columns
+    assert not (df["progress"]["progress_type"] == "progress_checkpoint").any()
+
+    df_metrics, _ = calcular_metricas_recurrencia(df, "Globex")
+    assert df_metrics.to_dict("records") == [{
+        "Terminó el programa": "NO", "Recurrencia": "NO", "Cantidad de Usuarios": 4, "Porcentaje de Usuarios": "100.0%"
+    }]
+
+
+def test_loading_a_version_keeps_the_raw_collections_of_others(mongo):
+    data_processing.get_raw_collections(["companies", "users"], "v1")
+    data_processing.get_raw_collections(["companies", "users"], "v2")
+    assert {key[1] for key in data_processing._raw_cache} == {"v1", "v2"}
+
+    data_processing.drop_raw_versions("v2")
+    assert {key[1] for key in data_processing._raw_cache} == {"v2"}
+
+
+def test_partitions_are_warmed_before_the_swap(mongo, partition_cache, monkeypatch):
+    monkeypatch.setattr(partitions, "PARTITIONS_MAX", 2)
+    partitions.drop_partitions("v1")
+    partitions.get_partition("Acme", "v1")
+    partitions.get_partition(None, "v1")
+
+    companies = partitions.start_warming("v2")
+    assert companies == [None, "Acme"]
+    partitions.warm_partitions("v2", companies)
+    # Las de la versión servida siguen en caché (las de la nueva no cuentan para PARTITIONS_MAX hasta servirla)
+    assert list(partitions._partitions) == [("v1", "Acme"), ("v1", None), ("v2", None), ("v2", "Acme")]
+    assert partitions.get_partition("Acme", "v1")["df"]["data_fingerprint"] == "main:v1:company:Acme"
+    assert {key[1] for key in data_processing._raw_cache} >= {"v1", "v2"}
+
+    fingerprints = partitions.drop_partitions("v2")
+    assert list(partitions._partitions) == [("v2", None), ("v2", "Acme")]
+    assert fingerprints == {"main:v2", "trainings:v2", "main:v2:company:Acme", "trainings:v2:company:Acme"}
+
+
+def test_reload_does_not_block_the_request(mongo, partition_cache, monkeypatch):
+    monkeypatch.setattr(refresher, "PARTITIONS_ENABLED", True)
+    monkeypatch.setattr(refresher, "_refresher", None)
+    monkeypatch.setattr(refresher, "REFRESH_ENABLED", False)
+    monkeypatch.setattr(refresher, "_served", None)
+    monkeypatch.setattr(refresher, "_reload", None)
+    monkeypatch.setattr(refresher, "_check_version", lambda force: None)
+    data_processing.set_data_version("v1")
+    assert refresher.get_served_datasets()["version"] == "v1"
+    partitions.get_partition("Acme", "v1")
+
+    release = threading.Event()
+    load_dimensions = refresher.load_dimensions
+    monkeypatch.setattr(refresher, "load_dimensions", lambda version: release.wait(10) and load_dimensions(version))
+    data_processing.set_data_version("v2")
+    start = time.monotonic()
+    assert refresher.get_served_datasets()["version"] == "v1"
+    assert time.monotonic() - start < 5
+    release.set()
+    refresher._reload.join(10)
+
+    assert refresher.get_served_datasets()["version"] == "v2"
+    assert list(partitions._partitions) == [("v2", "Acme")]
+
+
+def test_stale_version_request_gets_the_served_partition(mongo, partition_cache):
+    partitions.drop_partitions("v2")
+    datasets = partitions.get_partition("Acme", "v1")
+    assert datasets["df"]["data_fingerprint"] == "main:v2:company:Acme"
+    assert list(partitions._partitions) == [("v2", "Acme")]
+    assert partitions.get_partition_stats()["stale_requests"] == 1
\ No newline at end of file
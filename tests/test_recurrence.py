@@ -0,0 +1,107 @@
+# Description: Métricas de recurrencia (scripts.metrics): el cubo precalculado por (empresa, grupo) da lo mismo que
+# el cálculo original, que une usuarios, checkpoints y conexiones para cada filtro.
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pytest
+from bson import ObjectId
+import scripts.data_processing as data_processing
+from scripts.metrics import calcular_metricas_recurrencia, _conexiones_tras_checkpoint
+
+FILTERS = [(None, None), ("Acme", None), ("Globex", None), ("Acme", "Equipo A"), (None, "Equipo A"), ("Nadie", None)]
+
+
+@pytest.fixture
+def recurrent(mongo):
+    """Conexiones tras el último checkpoint (una en el mismo instante, que no cuenta) para que haya recurrentes."""
+    last = {}
+    for doc in mongo["progress"].find({"type": "progress_checkpoint"}):
+        last[doc["user"]] = max(last.get(doc["user"], doc["completionDate"]), doc["completionDate"])
+    for i, (user, date) in enumerate(sorted(last.items())):
+        for k in range(i % 3 + 1):
+            start = date + dt.timedelta(days=5 * k)
+            mongo["connections"].insert_one({"_id": ObjectId(), "user": user, "address": "1.2.3.4", "startDate": start,
+                                             "endDate": start, "connectionDuration": 7 + i})
+    return mongo
+
+
+def recurrencia_referencia(df, company_name=None, group_name=None):
+    """Cálculo original de calcular_metricas_recurrencia, con merges sobre toda la tabla de conexiones."""
+    df_recurrencia = df["user_dim"][["user_id", "company_name", "group_name"]]
+    if company_name:
+        df_recurrencia = df_recurrencia[df_recurrencia["company_name"] == company_name]
+    if group_name:
+        df_recurrencia = df_recurrencia[df_recurrencia["group_name"] == group_name]
+
+    df_progress = df["progress"].query("progress_type == 'progress_checkpoint'")
+    df_progress_recurrencia = df_progress.groupby("user_id").agg(
+        checkpoint_count=("progress_type", "size"),
+        checkpoint_date=("completionDate", "max")
+    ).reset_index()
+    df_connections_recurrencia = df["connections"].merge(df_progress_recurrencia, how="left")
+    df_connections_recurrencia = df_connections_recurrencia.groupby("user_id")["endDate"].max().reset_index().merge(
+        df_connections_recurrencia.query("endDate > checkpoint_date").groupby("user_id").agg(
+            connection_count=("user_id", "size")
+        ).reset_index(), how="left"
+    )
+    df_recurrencia = df_recurrencia.merge(df_progress_recurrencia, how="left").merge(df_connections_recurrencia, how="left")
+    df_recurrencia["days_since_completion"] = (df_recurrencia["endDate"] - df_recurrencia["checkpoint_date"]).dt.days
+
+    df_recurrencia.eval("is_active_2025 = endDate > '2024-12-31'", inplace=True)
+    df_recurrencia.eval("is_finished = checkpoint_count > 1", inplace=True)
+    df_recurrencia.eval("is_recurrent_2025 = is_active_2025 and is_finished and (days_since_completion > 0)", inplace=True)
+
+    metrics = df_recurrencia.groupby(["is_finished", "is_recurrent_2025"]).size().reset_index().rename(columns={0: "count"})
+    metrics.eval("percentage = (count / count.sum()) * 100", inplace=True)
+    metrics.replace({False: "NO", True: "SÍ"}, inplace=True)
+    metrics["percentage"] = metrics["percentage"].round(1).astype(str) + "%"
+    metrics.columns = ["Terminó el programa", "Recurrencia", "Cantidad de Usuarios", "Porcentaje de Usuarios"]
+    promedios = df_recurrencia.query("is_recurrent_2025")[["connection_count", "days_since_completion"]].mean().to_frame().round(0)
+    return metrics, promedios
+
+
+@pytest.mark.parametrize("company_name, group_name", FILTERS)
+def test_cube_slices_match_the_original_computation(recurrent, company_name, group_name):
+    df = data_processing.load_and_process_data()
+    assert "recurrence_cube" in df and df["recurrence_cube"]["is_recurrent_2025"].any()
+
+    metrics, promedios = calcular_metricas_recurrencia(df, company_name, group_name)
+    expected_metrics, expected_promedios = recurrencia_referencia(df, company_name, group_name)
+    pd.testing.assert_frame_equal(metrics, expected_metrics, check_dtype=False)
+    pd.testing.assert_frame_equal(promedios, expected_promedios, check_dtype=False)
+
+
+def conexiones_referencia(df_connections, checkpoint_date):
+    """Última conexión y conexiones posteriores al checkpoint por usuario, con groupby sobre la tabla unida."""
+    conexiones = df_connections.merge(checkpoint_date.rename("checkpoint_date"), left_on="user_id", right_index=True, how="left")
+    return pd.DataFrame({
+        "endDate": conexiones.groupby("user_id")["endDate"].max(),
+        "connection_count": conexiones.query("endDate > checkpoint_date").groupby("user_id").size().astype("float64"),
+    })
+
+
+@pytest.mark.parametrize("offset", [0, 10**12])
+def test_offsets_and_binary_search_match_a_groupby(recurrent, offset):
+    # offset: códigos pequeños (tabla de presencia) o enteros grandes (rango por ordenación) en _rango_denso
+    df = data_processing.load_and_process_data()
+    connections = df["connections"][["user_id", "endDate"]].assign(user_id=lambda x: x["user_id"] + offset)
+    progress = df["progress"][df["progress"]["progress_type"] == "progress_checkpoint"]
+    checkpoint_date = progress.groupby("user_id")["completionDate"].max()
+    checkpoint_date.index = checkpoint_date.index + offset
+
+    # Casos límite: conexión sin endDate, conexión justo en el checkpoint y usuario sin checkpoint
+    user, date = checkpoint_date.index[0], checkpoint_date.iloc[0]
+    connections = pd.concat([connections, pd.DataFrame({
+        "user_id": [user, user, offset + 10**6], "endDate": [pd.NaT, date, date]
+    })], ignore_index=True)
+
+    result = _conexiones_tras_checkpoint(connections, checkpoint_date)
+    expected = conexiones_referencia(connections, checkpoint_date)
+    assert result["connection_count"].notna().any()
+    pd.testing.assert_frame_equal(result, expected.reindex(result.index), check_names=False)
+    assert np.array_equal(np.sort(result.index.to_numpy()), np.sort(connections["user_id"].unique()))
+
+
+def test_cube_covers_every_user(mongo):
+    df = data_processing.load_and_process_data()
+    assert df["recurrence_cube"]["count"].sum() == len(df["user_dim"])
\ No newline at end of file